@@ -2,6 +2,9 @@
 ASGI config for Store2 project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it (e.g. ``uvicorn Store2.asgi:application``) for the notification
+stream, /api/notifications/stream/, which holds one connection per open
+client; under WSGI every such client would pin a worker thread.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -0,0 +1,42 @@
+# Store2/benchmark.py
+"""
+Helpers shared by the benchmark management commands.
+
+Benchmarks never touch the development database: they run against a
+throwaway database created (and migrated) the same way the test runner does.
+"""
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+@contextmanager
+def benchmark_database(name=None, keepdb=False, alias=DEFAULT_DB_ALIAS):
+    """
+    Point ``alias`` at a fresh, migrated database for the duration of the block.
+
+    ``name`` overrides the database name (a file path for SQLite), and
+    ``keepdb`` keeps it afterwards so an expensive seed can be reused.
+    """
+    connection = connections[alias]
+    if name:
+        connection.settings_dict['TEST']['NAME'] = str(name)
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False, keepdb=keepdb
+    )
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+
+
+def timed(func, repeat=5):
+    """Run ``func`` ``repeat`` times and return (best, median) in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return min(samples), statistics.median(samples)
@@ -0,0 +1,75 @@
+# Store2/cache_profiles.py
+"""
+CACHES from the STORE_CACHE_URL environment variable (settings.py calls
+``caches()``):
+
+``locmem://`` (default)
+    Per-process memory. Fine for a single worker; with several, each one
+    has its own copy and invalidations only reach the worker that made them.
+``redis://host:6379/1`` (or ``rediss://``)
+    Django's Redis backend, shared by every worker. Needs redis-py.
+``memcached://host:11211[,host2:11211]``
+    pymemcache. Needs pymemcache.
+``file:///var/tmp/store-cache``
+    One file per key; shared by the workers of one machine.
+``dummy://``
+    Caches nothing.
+
+STORE_CACHE_PREFIX namespaces the keys when several deployments share a
+server. Features that coordinate workers through the cache (the read
+replicas' read-your-writes pins) call ``require_shared()``.
+"""
+import os
+from urllib.parse import urlsplit
+
+from django.core.exceptions import ImproperlyConfigured
+
+CACHE_URL_ENV = 'STORE_CACHE_URL'
+DEFAULT_CACHE_URL = 'locmem://'
+# Backends whose entries no other worker sees
+PER_PROCESS_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def backend(url):
+    """The CACHES entry for one cache URL"""
+    parts = urlsplit(url)
+    if parts.scheme == 'locmem':
+        entry = {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': parts.netloc or 'store',
+        }
+    elif parts.scheme in ('redis', 'rediss'):
+        entry = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': url}
+    elif parts.scheme == 'memcached':
+        entry = {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': parts.netloc.split(','),
+        }
+    elif parts.scheme == 'file':
+        if not parts.path:
+            raise ImproperlyConfigured(f"{CACHE_URL_ENV}: file:// needs a directory, e.g. file:///var/tmp/cache")
+        entry = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': parts.path}
+    elif parts.scheme == 'dummy':
+        entry = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+    else:
+        raise ImproperlyConfigured(
+            f"Unknown {CACHE_URL_ENV} {url!r}, use locmem://, redis://, memcached://, file:// or dummy://"
+        )
+    entry['KEY_PREFIX'] = os.environ.get('STORE_CACHE_PREFIX', '')
+    return entry
+
+
+def caches():
+    return {'default': backend(os.environ.get(CACHE_URL_ENV, DEFAULT_CACHE_URL))}
+
+
+def require_shared(caches, feature):
+    """ImproperlyConfigured unless the default cache is shared by the workers"""
+    if caches['default']['BACKEND'] in PER_PROCESS_BACKENDS:
+        raise ImproperlyConfigured(
+            f"{feature} needs a cache shared by every worker: set {CACHE_URL_ENV} "
+            f"to redis://, memcached:// or file://"
+        )
@@ -1,9 +1,9 @@
 import os
 from celery import Celery
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'your_project.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Store2.settings')
 
-app = Celery('your_project')
+app = Celery('Store2')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
@@ -12,4 +12,33 @@ app.conf.beat_schedule = {
         'task': 'products.tasks.expire_sales',
         'schedule': 3600.0,  # Every hour (in seconds)
     },
-}
\ No newline at end of file
+    # Picks up emails whose retry is due or whose immediate run never got queued
+    'deliver-email-outbox': {
+        'task': 'accounts.tasks.deliver_email_outbox',
+        'schedule': 30.0,
+    },
+    # Abandoned carts give their reserved stock back
+    'release-expired-reservations': {
+        'task': 'products.tasks.release_expired_reservations',
+        'schedule': 60.0,
+    },
+    # Keeps ledger replays short for reconciliation and balance checks
+    'snapshot-wallet-balances': {
+        'task': 'wallet.tasks.snapshot_wallet_balances',
+        'schedule': 6 * 3600.0,
+    },
+    # Sent and failed emails, with their codes, don't stay around
+    'purge-email-outbox': {
+        'task': 'accounts.tasks.purge_email_outbox',
+        'schedule': 3600.0,
+    },
+    'purge-idempotency-keys': {
+        'task': 'accounts.tasks.purge_idempotency_keys',
+        'schedule': 3600.0,
+    },
+    # Wishlist fan-outs that were never queued (broker down) or wait for a retry
+    'run-pending-wishlist-fanouts': {
+        'task': 'notifications.tasks.run_pending_wishlist_fanouts',
+        'schedule': 30.0,
+    },
+}
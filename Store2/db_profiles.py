@@ -0,0 +1,157 @@
+# Store2/db_profiles.py
+"""
+Database settings by profile, picked with the STORE_DB_PROFILE environment
+variable (settings.py calls ``database()``):
+
+``sqlite`` (default)
+    db.sqlite3 tuned for concurrent writers: WAL (readers never block the
+    writer), synchronous=NORMAL (durable at checkpoints, no fsync per
+    commit), a busy timeout so a writer waits for the lock instead of
+    failing with "database is locked", a memory-mapped read path, and
+    BEGIN IMMEDIATE so a transaction takes the write lock up front rather
+    than deadlocking when two readers both try to upgrade.
+``sqlite-basic``
+    Django's SQLite defaults, as the project shipped. Kept as a baseline
+    for ``benchmark_db_writes``.
+``postgres``
+    Persistent connections (CONN_MAX_AGE) with health checks, so a request
+    reuses its worker's connection and a dropped one is replaced.
+``postgres-pool``
+    psycopg 3's connection pool (Django's ``pool`` option) shared by the
+    threads of a worker; Django requires CONN_MAX_AGE = 0 with it.
+
+The PostgreSQL profiles read POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD,
+POSTGRES_HOST and POSTGRES_PORT.
+
+Read replicas (Store2/routers.py) come from STORE_DB_REPLICAS, a comma
+separated list of SQLite files or PostgreSQL ``host[:port]``s holding copies
+of the primary; each becomes a ``replica_<n>`` alias with the primary's
+settings. To try it locally, copy db.sqlite3 to a second file (or point at a
+second PostgreSQL instance) and list it there, with a shared STORE_CACHE_URL
+(see Store2/cache_profiles.py). The test runner mirrors the replicas onto
+the test database.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+PROFILE_ENV = 'STORE_DB_PROFILE'
+REPLICAS_ENV = 'STORE_DB_REPLICAS'
+DEFAULT_PROFILE = 'sqlite'
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        raise ImproperlyConfigured(f"{name} must be an integer")
+
+
+def sqlite_basic(base_dir):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', base_dir / 'db.sqlite3'),
+    }
+
+
+def sqlite(base_dir):
+    busy_timeout_ms = _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    return {
+        **sqlite_basic(base_dir),
+        'OPTIONS': {
+            'timeout': busy_timeout_ms / 1000,
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # Applied to every new connection by apply_sqlite_pragmas()
+        'PRAGMAS': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': busy_timeout_ms,
+            'mmap_size': _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+            'cache_size': -20000,  # KiB
+            'temp_store': 'MEMORY',
+        },
+    }
+
+
+def _postgres_connection():
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB', 'store'),
+        'USER': os.environ.get('POSTGRES_USER', 'store'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+    }
+
+
+def postgres(base_dir):
+    return {
+        **_postgres_connection(),
+        'CONN_MAX_AGE': _env_int('POSTGRES_CONN_MAX_AGE', 60),
+        'CONN_HEALTH_CHECKS': True,
+    }
+
+
+def postgres_pool(base_dir):
+    return {
+        **_postgres_connection(),
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'pool': {
+                'min_size': _env_int('POSTGRES_POOL_MIN_SIZE', 2),
+                'max_size': _env_int('POSTGRES_POOL_MAX_SIZE', 10),
+                'timeout': _env_int('POSTGRES_POOL_TIMEOUT', 10),
+            },
+        },
+    }
+
+
+PROFILES = {
+    'sqlite': sqlite,
+    'sqlite-basic': sqlite_basic,
+    'postgres': postgres,
+    'postgres-pool': postgres_pool,
+}
+
+
+def database(base_dir, profile=None):
+    """The ``default`` DATABASES entry for ``profile`` (STORE_DB_PROFILE if None)"""
+    profile = profile or os.environ.get(PROFILE_ENV, DEFAULT_PROFILE)
+    try:
+        return PROFILES[profile](base_dir)
+    except KeyError:
+        raise ImproperlyConfigured(
+            f"Unknown {PROFILE_ENV} {profile!r}, use one of: {', '.join(PROFILES)}"
+        )
+
+
+def replicas(primary):
+    """The replica DATABASES entries for the ``primary`` settings, by alias"""
+    entries = [entry.strip() for entry in os.environ.get(REPLICAS_ENV, '').split(',') if entry.strip()]
+    aliases = {}
+    for number, entry in enumerate(entries, start=1):
+        replica = {**primary, 'TEST': {'MIRROR': 'default'}}
+        if primary['ENGINE'].endswith('sqlite3'):
+            replica['NAME'] = entry
+        else:
+            host, _, port = entry.partition(':')
+            replica.update(HOST=host, PORT=port or primary.get('PORT', ''))
+        aliases[f'replica_{number}'] = replica
+    return aliases
+
+
+@receiver(connection_created, dispatch_uid='store2_sqlite_pragmas')
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    pragmas = connection.settings_dict.get('PRAGMAS')
+    if connection.vendor != 'sqlite' or not pragmas:
+        return
+    # Straight on the DB-API connection: nothing here should show up in query logs
+    cursor = connection.connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
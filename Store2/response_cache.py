@@ -0,0 +1,217 @@
+# Store2/response_cache.py
+"""
+Shared response cache for the public catalog endpoints.
+
+``@cache_response(scope, tags)`` on an APIView ``get`` stores the 200
+responses it produces. The key covers the absolute URL (host included,
+image URLs are absolute), the query parameters sorted, the
+``Accept-Language`` the views understand, and the current version of every
+tag the response depends on. ``invalidate(*tags)`` bumps those versions
+(products/signals.py does it on commit of each catalog write), which
+orphans every response built from the old data; nothing is deleted.
+
+Prices follow sale windows that open and close without any write, so
+entries also expire after RESPONSE_CACHE_TIMEOUT seconds (0 turns the cache
+off).
+
+On a miss only one request per key computes the response (a lock taken
+with ``cache.add``); the others wait briefly for its result instead of all
+hitting the database at once. Hits, misses and coalesced waits are counted
+per scope (``stats()``, ``response_cache_stats`` command) and each response
+carries ``X-Cache: HIT|MISS``.
+
+Read replicas (Store2/routers.py): a miss is computed wherever the view
+reads, a replica for the ``ReadReplicaMixin`` views, except in the
+REPLICA_STICKY_SECONDS after one of its tags was invalidated. A replica may
+not have that write yet, and an entry built from it would outlive the lag
+under the new tag versions, so those misses read the primary. Users pinned
+to the primary after a write skip the cache altogether, so they read their
+own writes.
+"""
+import hashlib
+import json
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from Store2.routers import STICKY_SECONDS, is_pinned, replica_reads
+
+CACHE_ALIAS = getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')
+DEFAULT_TIMEOUT = 60
+LANGUAGES = ('ar', 'en')
+# Longer than any view takes, so a crashed worker's lock frees itself
+LOCK_TIMEOUT = 10
+WAIT_SECONDS = 2
+WAIT_STEP = 0.025
+REPLAYED_HEADERS = ('ETag', 'Cache-Control', 'Vary')
+OUTCOMES = ('hit', 'miss', 'coalesced')
+
+TAG_KEY = 'rc:tag:{tag}'
+# Set for REPLICA_STICKY_SECONDS by invalidate(): the replicas may lag behind the tag
+RECENT_KEY = 'rc:recent:{tag}'
+ENTRY_KEY = 'rc:{scope}:{digest}'
+STATS_KEY = 'rc:stats:{scope}:{outcome}'
+
+# Every scope a view caches under, for stats()
+SCOPES = []
+
+
+def _store():
+    return caches[CACHE_ALIAS]
+
+
+def tag_versions(tags):
+    store = _store()
+    keys = [TAG_KEY.format(tag=tag) for tag in tags]
+    versions = store.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Start from the clock so a lost version never comes back
+            store.add(key, int(time.time() * 1000), timeout=None)
+            versions[key] = store.get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*tags):
+    store = _store()
+    for tag in set(tags):
+        key = TAG_KEY.format(tag=tag)
+        try:
+            store.incr(key)
+        except ValueError:
+            tag_versions([tag])
+    if getattr(settings, 'REPLICA_DATABASES', ()):
+        store.set_many({RECENT_KEY.format(tag=tag): True for tag in tags}, STICKY_SECONDS)
+
+
+def recently_invalidated(tags):
+    """Whether a replica might not have the last write to one of ``tags`` yet"""
+    if not getattr(settings, 'REPLICA_DATABASES', ()):
+        return False
+    return bool(_store().get_many([RECENT_KEY.format(tag=tag) for tag in tags]))
+
+
+def language(request):
+    lang = request.headers.get('Accept-Language', '').lower()
+    # The views fall back to their default for anything else
+    return lang if lang in LANGUAGES else '*'
+
+
+def response_key(scope, request, tags):
+    query = sorted((key, value) for key, values in request.query_params.lists() for value in values)
+    parts = [
+        request.build_absolute_uri(request.path), query, language(request),
+        list(zip(tags, tag_versions(tags))),
+    ]
+    digest = hashlib.md5(json.dumps(parts, default=str).encode()).hexdigest()
+    return ENTRY_KEY.format(scope=scope, digest=digest)
+
+
+def count(scope, outcome):
+    store = _store()
+    key = STATS_KEY.format(scope=scope, outcome=outcome)
+    try:
+        store.incr(key)
+    except ValueError:
+        if not store.add(key, 1, timeout=None):
+            store.incr(key)
+
+
+def stats(scopes=None):
+    """{scope: {'hit': n, 'miss': n, 'coalesced': n}}"""
+    scopes = SCOPES if scopes is None else scopes
+    keys = {(scope, outcome): STATS_KEY.format(scope=scope, outcome=outcome)
+            for scope in scopes for outcome in OUTCOMES}
+    values = _store().get_many(keys.values())
+    result = {scope: {} for scope in scopes}
+    for (scope, outcome), key in keys.items():
+        result[scope][outcome] = values.get(key, 0)
+    return result
+
+
+def reset_stats(scopes=None):
+    scopes = SCOPES if scopes is None else scopes
+    _store().delete_many([STATS_KEY.format(scope=scope, outcome=outcome)
+                          for scope in scopes for outcome in OUTCOMES])
+
+
+def _entry(response):
+    return {
+        'status': response.status_code,
+        # Stored as rendered JSON, like the idempotency keys: plain, picklable data
+        'data': json.loads(JSONRenderer().render(response.data) or 'null'),
+        'headers': {name: response[name] for name in REPLAYED_HEADERS if response.has_header(name)},
+    }
+
+
+def _replay(request, entry):
+    etag = entry['headers'].get('ETag')
+    response = get_conditional_response(request, etag=etag) if etag else None
+    if response is None:
+        response = Response(entry['data'], status=entry['status'])
+    for name, value in entry['headers'].items():
+        response[name] = value
+    response['X-Cache'] = 'HIT'
+    return response
+
+
+def _wait_for(key):
+    store = _store()
+    deadline = time.monotonic() + WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        entry = store.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def cache_response(scope, tags, timeout=None):
+    """
+    Cache the decorated APIView ``get``. ``tags`` are formatted with the URL
+    kwargs, e.g. ``('product:{pk}', 'sales')``.
+    """
+    SCOPES.append(scope)
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            ttl = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', DEFAULT_TIMEOUT) if timeout is None else timeout
+            if not ttl or is_pinned(getattr(request.user, 'id', None)):
+                return method(view, request, *args, **kwargs)
+
+            store = _store()
+            formatted = [tag.format(**kwargs) for tag in tags]
+            key = response_key(scope, request, formatted)
+            entry = store.get(key)
+            if entry is not None:
+                count(scope, 'hit')
+                return _replay(request, entry)
+
+            lock = f'{key}:lock'
+            locked = store.add(lock, 1, timeout=LOCK_TIMEOUT)
+            if not locked:
+                # Someone else is computing this very response
+                entry = _wait_for(key)
+                if entry is not None:
+                    count(scope, 'coalesced')
+                    return _replay(request, entry)
+            count(scope, 'miss')
+            try:
+                with replica_reads(False) if recently_invalidated(formatted) else nullcontext():
+                    response = method(view, request, *args, **kwargs)
+                if response.status_code == 200:
+                    store.set(key, _entry(response), ttl)
+            finally:
+                if locked:
+                    store.delete(lock)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
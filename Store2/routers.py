@@ -0,0 +1,112 @@
+# Store2/routers.py
+"""
+Read-replica routing.
+
+Reads go to a replica only inside views that opt in with
+``ReadReplicaMixin`` (catalog and listing endpoints), and only for their
+safe requests (GET/HEAD/OPTIONS). Everything else stays on ``default``:
+writes, anything inside a transaction, ``select_for_update()`` (Django
+routes it as a write) and every model of REPLICA_PRIMARY_APPS (the wallet,
+whose balances must never be read stale).
+
+Read-your-writes: a user's successful write pins that user to the primary
+for REPLICA_STICKY_SECONDS (``ReplicaStickinessMiddleware``), covering the
+replication lag, so someone who just edited a product sees the edit. The
+pin lives in the cache, which has to be shared by every worker for the next
+request to see it: settings.py refuses replicas with a per-process cache
+(locmem://, dummy://).
+
+Replicas are declared with STORE_DB_REPLICAS (see Store2/db_profiles.py).
+Without any, the router sends everything to ``default``.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+STICKY_SECONDS = getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+STICKY_KEY = 'replica:pin:{user_id}'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Let the reads in this block go to a replica"""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def pin_to_primary(user_id):
+    cache.set(STICKY_KEY.format(user_id=user_id), True, STICKY_SECONDS)
+
+
+def is_pinned(user_id):
+    return user_id is not None and cache.get(STICKY_KEY.format(user_id=user_id), False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get():
+            return None
+        replicas = getattr(settings, 'REPLICA_DATABASES', ())
+        if not replicas or model._meta.app_label in getattr(settings, 'REPLICA_PRIMARY_APPS', ('wallet',)):
+            return None
+        # Reads inside a transaction belong with its writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in getattr(settings, 'REPLICA_DATABASES', ()):
+            return False
+        return None
+
+
+class ReadReplicaMixin:
+    """APIView mixin: safe requests read from a replica unless the user is pinned"""
+
+    def dispatch(self, request, *args, **kwargs):
+        token = _replica_reads.set(False)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        # Runs after authentication (which reads the primary), before the handler
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and not is_pinned(getattr(request.user, 'id', None)):
+            _replica_reads.set(True)
+
+
+class ReplicaStickinessMiddleware:
+    """Pin users to the primary for a moment after each of their successful writes"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not getattr(settings, 'REPLICA_DATABASES', ()):
+            return response
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            # DRF sets the authenticated user back on the Django request
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                pin_to_primary(user.id)
+        return response
@@ -13,6 +13,8 @@ from datetime import timedelta
 from pathlib import Path
 from cryptography.fernet import Fernet
 
+from Store2 import cache_profiles, db_profiles
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -69,6 +71,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "Store2.routers.ReplicaStickinessMiddleware",
 ]
 
 ROOT_URLCONF = "Store2.urls"
@@ -93,8 +96,8 @@ WSGI_APPLICATION = "Store2.wsgi.application"
 # settings.py
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        # Handles both our session tokens and simplejwt access tokens
         'accounts.authentication.JWTAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
     ]
 }
 
@@ -117,12 +120,22 @@ SIMPLE_JWT = {
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Pick the profile with STORE_DB_PROFILE (sqlite, sqlite-basic, postgres,
+# postgres-pool), see Store2/db_profiles.py
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+    "default": db_profiles.database(BASE_DIR),
 }
+# Read replicas (STORE_DB_REPLICAS) and their routing, see Store2/routers.py
+DATABASES.update(db_profiles.replicas(DATABASES["default"]))
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["Store2.routers.ReplicaRouter"]
+
+# Pick the backend with STORE_CACHE_URL (locmem://, redis://..., memcached://...),
+# see Store2/cache_profiles.py
+CACHES = cache_profiles.caches()
+if REPLICA_DATABASES:
+    # The read-your-writes pins (Store2/routers.py) must reach every worker
+    cache_profiles.require_shared(CACHES, "STORE_DB_REPLICAS")
 
 
 # Password validation
@@ -1,11 +1,96 @@
 # authentication.py
+from functools import lru_cache
+
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings as simplejwt_settings
 import jwt
 from django.conf import settings
 from .models import User
+from .session_cache import SessionUser, get_session, store_session
+from .utils import SESSION_KEY_ID
+
+ACCESS_KEY_ID = 'access'
+
+
+def get_keyring():
+    """
+    Every kind of bearer token we accept, by key id: the login session tokens
+    from create_monthly_token() and the simplejwt access tokens from
+    api/auth/login/. Each entry is the verification key plus decode options.
+    """
+    return {
+        SESSION_KEY_ID: {
+            'key': settings.SECRET_KEY,
+            'algorithm': 'HS256',
+        },
+        ACCESS_KEY_ID: {
+            'key': simplejwt_settings.VERIFYING_KEY or simplejwt_settings.SIGNING_KEY,
+            'algorithm': simplejwt_settings.ALGORITHM,
+            'audience': simplejwt_settings.AUDIENCE,
+            'issuer': simplejwt_settings.ISSUER,
+            'leeway': simplejwt_settings.LEEWAY,
+        },
+    }
+
+
+@lru_cache(maxsize=8)
+def get_verification_key(key, algorithm):
+    """Parsed key object, so PEM keys are not parsed again on every request"""
+    return jwt.get_algorithm_by_name(algorithm).prepare_key(key)
+
+
+def token_key_id(token, header):
+    """
+    The keyring entry ``token`` claims to be signed with. Tokens without a
+    ``kid`` (simplejwt tokens and session tokens issued before the header
+    existed) are told apart by simplejwt's token type claim; the signature
+    check that follows is what decides.
+    """
+    if 'kid' in header:
+        return header['kid']
+    claims = jwt.decode(token, options={'verify_signature': False})
+    return ACCESS_KEY_ID if simplejwt_settings.TOKEN_TYPE_CLAIM in claims else SESSION_KEY_ID
+
+
+def decode_token(token):
+    """
+    Verify ``token`` against the one key its header (or its claims, see
+    token_key_id()) names and return (key id, payload).
+    """
+    try:
+        header = jwt.get_unverified_header(token)
+        key_id = token_key_id(token, header)
+    except jwt.InvalidTokenError:
+        raise AuthenticationFailed("Invalid token")
+
+    entry = get_keyring().get(key_id)
+    # The algorithm comes from our keyring, the header only has to agree
+    if entry is None or header.get('alg') != entry['algorithm']:
+        raise AuthenticationFailed("Invalid token")
+    try:
+        payload = jwt.decode(
+            token,
+            get_verification_key(entry['key'], entry['algorithm']),
+            algorithms=[entry['algorithm']],
+            audience=entry.get('audience'),
+            issuer=entry.get('issuer'),
+            leeway=entry.get('leeway', 0),
+            options={'verify_aud': entry.get('audience') is not None},
+        )
+    except jwt.ExpiredSignatureError:
+        raise AuthenticationFailed("Token expired")
+    except jwt.InvalidTokenError:
+        raise AuthenticationFailed("Invalid token")
+    return key_id, payload
+
 
 class JWTAuthentication(BaseAuthentication):
+    """
+    The only authentication class: one signature check per request for both
+    session tokens and simplejwt access tokens.
+    """
+
     def authenticate(self, request):
         auth = request.headers.get('Authorization')
 
@@ -13,16 +98,22 @@ class JWTAuthentication(BaseAuthentication):
             return None
 
         token = auth.split(' ')[1]
+        key_id, payload = decode_token(token)
 
-        try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        except jwt.ExpiredSignatureError:
-            raise AuthenticationFailed("Token expired")
-        except jwt.InvalidTokenError:
+        if key_id == ACCESS_KEY_ID:
+            return (self.get_access_token_user(payload), token)
+
+        user_id = payload.get("user_id")
+        if user_id is None:
             raise AuthenticationFailed("Invalid token")
 
+        # Session already validated recently: no query, the user loads lazily
+        session = get_session(user_id, token)
+        if session is not None:
+            return (SessionUser(user_id, session), token)
+
         try:
-            user = User.objects.get(id=payload["user_id"])
+            user = User.objects.get(id=user_id)
         except User.DoesNotExist:
             raise AuthenticationFailed("User not found")
 
@@ -30,4 +121,30 @@ class JWTAuthentication(BaseAuthentication):
         if user.current_token_user != token:
             raise AuthenticationFailed("Invalid session token")
 
+        store_session(user, token, payload.get("exp"))
         return (user, token)
+
+    def get_access_token_user(self, payload):
+        """Same checks simplejwt's own authentication class applies"""
+        if payload.get(simplejwt_settings.TOKEN_TYPE_CLAIM) != 'access':
+            raise AuthenticationFailed("Invalid token type")
+
+        user_id = payload.get(simplejwt_settings.USER_ID_CLAIM)
+        if user_id is None:
+            raise AuthenticationFailed("Invalid token")
+
+        try:
+            user = User.objects.get(**{simplejwt_settings.USER_ID_FIELD: user_id})
+        except User.DoesNotExist:
+            raise AuthenticationFailed("User not found")
+
+        if not user.is_active:
+            raise AuthenticationFailed("User is inactive")
+
+        # Logout revokes the access tokens issued before it, like the session token
+        issued_at = payload.get('iat')
+        if user.tokens_revoked_at is not None and (
+            issued_at is None or issued_at < user.tokens_revoked_at.timestamp()
+        ):
+            raise AuthenticationFailed("Token revoked")
+        return user
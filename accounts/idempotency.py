@@ -0,0 +1,137 @@
+# accounts/idempotency.py
+"""
+Idempotency keys for mutating endpoints.
+
+A client that may retry (flaky mobile networks) sends an ``Idempotency-Key``
+header. The first request with that key runs normally and its response is
+stored; retries of the same request get the stored response back
+(``Idempotent-Replayed: true``) without running the view again. Reusing a
+key for a different request is a 422.
+
+The key is claimed, the view runs and its response is stored in a single
+transaction: a retry racing the first request waits on the unique index and
+then replays, and a request that fails with an exception or a 5xx leaves no
+key behind, so it can simply be retried.
+
+Usage, on an APIView method::
+
+    @idempotent('wallet.transfer')
+    def post(self, request): ...
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+KEY_TTL = timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+MAX_KEY_LENGTH = 255
+
+
+def request_hash(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps([request.method, request.get_full_path(), data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def stored_answer(user_id, scope, key, fingerprint):
+    """The response for a key that was already used, None if the key is free"""
+    record = IdempotencyKey.objects.filter(user_id=user_id, scope=scope, key=key).first()
+    if record is None:
+        return None
+    if record.created_at < timezone.now() - KEY_TTL:
+        # Expired but not purged yet: the key is free again
+        record.delete()
+        return None
+    if record.request_hash != fingerprint:
+        return Response(
+            {"error": f"This {HEADER} was already used for a different request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    if record.response_status is None:
+        return Response(
+            {"error": f"A request with this {HEADER} is still being processed"},
+            status=status.HTTP_409_CONFLICT
+        )
+    return replay(record)
+
+
+def claim(user_id, scope, key, fingerprint):
+    """The new key record, or the response to answer with instead of running the view"""
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                user_id=user_id, scope=scope, key=key, request_hash=fingerprint
+            ), None
+    except IntegrityError:
+        # Lost the race to a concurrent request with the same key, which has committed by now
+        return None, stored_answer(user_id, scope, key, fingerprint) or Response(
+            {"error": f"A request with this {HEADER} is still being processed"},
+            status=status.HTTP_409_CONFLICT
+        )
+
+
+def idempotent(scope):
+    """Make an APIView method replay its stored response for retried Idempotency-Keys"""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key or not request.user.is_authenticated:
+                return method(view, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            fingerprint = request_hash(request)
+            # The common retry: one SELECT and no transaction
+            answer = stored_answer(request.user.id, scope, key, fingerprint)
+            if answer is not None:
+                return answer
+
+            with transaction.atomic():
+                record, answer = claim(request.user.id, scope, key, fingerprint)
+                if answer is not None:
+                    return answer
+
+                response = method(view, request, *args, **kwargs)
+                if response.status_code >= 500:
+                    # Nothing happened as far as the client is concerned
+                    transaction.set_rollback(True)
+                    return response
+
+                # Stored as rendered, so a replay is byte-for-byte the same JSON
+                IdempotencyKey.objects.filter(id=record.id).update(
+                    response_status=response.status_code,
+                    response_body=json.loads(JSONRenderer().render(getattr(response, 'data', None)) or 'null'),
+                )
+            return response
+        return wrapper
+    return decorator
+
+
+def purge_expired(now=None):
+    """Delete keys past their TTL, returns how many"""
+    cutoff = (now or timezone.now()) - KEY_TTL
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
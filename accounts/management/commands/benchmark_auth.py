@@ -0,0 +1,116 @@
+import logging
+import tempfile
+import time
+
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication as SimpleJWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts import session_cache
+from accounts.authentication import JWTAuthentication
+from accounts.models import User
+from accounts.utils import create_monthly_token
+from products.views import CartView
+from Store2.benchmark import benchmark_database
+
+
+class LegacyJWTAuthentication(BaseAuthentication):
+    """The session-token authenticator as it was before the unified class (baseline only)"""
+
+    def authenticate(self, request):
+        auth = request.headers.get('Authorization')
+        if not auth or not auth.startswith('Bearer '):
+            return None
+        token = auth.split(' ')[1]
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+        except jwt.ExpiredSignatureError:
+            raise AuthenticationFailed("Token expired")
+        except jwt.InvalidTokenError:
+            raise AuthenticationFailed("Invalid token")
+        try:
+            user = User.objects.get(id=payload["user_id"])
+        except User.DoesNotExist:
+            raise AuthenticationFailed("User not found")
+        if user.current_token_user != token:
+            raise AuthenticationFailed("Invalid session token")
+        return (user, token)
+
+
+CONFIGURATIONS = [
+    ('before', [LegacyJWTAuthentication, SimpleJWTAuthentication]),
+    ('after', [JWTAuthentication]),
+]
+
+
+class Command(BaseCommand):
+    help = 'Requests per second on the authenticated cart endpoint, before/after the unified authenticator'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--warmup', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if session_cache.enabled():
+            self.benchmark(options)
+            return
+        # Sessions are only cached in a shared cache: stand one in
+        with tempfile.TemporaryDirectory() as directory:
+            shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                  'LOCATION': directory}}
+            with override_settings(CACHES=shared):
+                self.benchmark(options)
+
+    def benchmark(self, options):
+        with benchmark_database():
+            user = User.objects.create_user(
+                email='bench-buyer@example.com', username='bench-buyer', password='bench',
+                first_name='Bench', last_name='Buyer', phone_number='0', role='user'
+            )
+            session_token = create_monthly_token({'user_id': user.id, 'email': user.email, 'role': user.role})
+            user.current_token_user = session_token
+            user.save(update_fields=['current_token_user'])
+            tokens = [
+                ('session token', session_token),
+                ('simplejwt access token', str(RefreshToken.for_user(user).access_token)),
+            ]
+
+            original = CartView.authentication_classes
+            # The rejected "before" runs would log one warning per request
+            request_logger = logging.getLogger('django.request')
+            level = request_logger.level
+            request_logger.setLevel(logging.ERROR)
+            try:
+                for name, classes in CONFIGURATIONS:
+                    CartView.authentication_classes = classes
+                    for label, token in tokens:
+                        self.run(f'{name:<7} {label}', token, options)
+            finally:
+                CartView.authentication_classes = original
+                request_logger.setLevel(level)
+
+    def run(self, label, token, options):
+        cache.clear()
+        client = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Bearer {token}')
+        for _ in range(options['warmup']):
+            status = client.get('/api/product/cart/').status_code
+
+        total = options['requests']
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(total):
+                client.get('/api/product/cart/')
+            elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f'{label:<32} status {status}   {total / elapsed:8.0f} req/s   '
+            f'{len(queries) / total:.1f} queries/request'
+        )
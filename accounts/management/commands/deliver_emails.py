@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.outbox import deliver_pending
+
+
+class Command(BaseCommand):
+    help = 'Sends the pending emails in the outbox (once, or continuously with --loop)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        while True:
+            sent = deliver_pending(limit=options['batch_size'])
+            if sent:
+                self.stdout.write(self.style.SUCCESS(f'Sent {sent} emails'))
+            if not options['loop']:
+                break
+            # A full batch means more may be waiting
+            if sent < options['batch_size']:
+                time.sleep(options['interval'])
@@ -23,6 +23,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     current_token_user = models.CharField(max_length=255, null=True, blank=True)
+    # Access tokens (api/auth/login/) issued before this are refused, set by logout
+    tokens_revoked_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     objects = CustomUserManager()
@@ -34,7 +36,8 @@ class User(AbstractBaseUser, PermissionsMixin):
         return self.user_notifications.filter(is_read=False)  # Updated related_name
 
     def mark_all_notifications_read(self):
-        return self.user_notifications.filter(is_read=False).update(is_read=True)  # Updated
+        from notifications.unread import mark_read
+        return mark_read(self.id)
 
     def send_notification(self, notification_type, message_ar, message_en, content_object=None):
           from notifications.models import Notification
@@ -91,4 +94,56 @@ class Profile(models.Model):
     is_certified = models.BooleanField(default=False)
 
     def __str__(self):
-        return f"{self.user.email}'s Profile"
\ No newline at end of file
+        return f"{self.user.email}'s Profile"
+
+
+class EmailOutbox(models.Model):
+    """Emails waiting to be sent by the outbox worker (see accounts/outbox.py)"""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        SENT = 'sent', 'Sent'
+        FAILED = 'failed', 'Failed'
+
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.to_email} - {self.subject} ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    """
+    The stored outcome of a mutating request sent with an Idempotency-Key
+    header, replayed to retries of the same request (see accounts/idempotency.py)
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    scope = models.CharField(max_length=100)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.scope} {self.key}"
@@ -0,0 +1,136 @@
+# accounts/outbox.py
+"""
+Transactional email outbox.
+
+Views never talk to SMTP: ``enqueue_email()`` stores the message in the same
+transaction as the data it belongs to and, once that commits, nudges the
+worker. ``deliver_pending()`` (run by the Celery task or the
+``deliver_emails`` command) sends due messages over a single SMTP
+connection, retrying failures with exponential backoff.
+
+Bodies hold verification codes, so a message's body is cleared once it is
+sent or given up on, and ``purge_finished()`` (hourly Celery task) deletes
+those rows after EMAIL_OUTBOX_RETENTION_DAYS.
+"""
+import logging
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 6)
+BACKOFF_BASE = getattr(settings, 'EMAIL_OUTBOX_BACKOFF_SECONDS', 30)
+BACKOFF_MAX = getattr(settings, 'EMAIL_OUTBOX_BACKOFF_MAX_SECONDS', 3600)
+# How long a claimed message stays invisible to other workers
+CLAIM_TIMEOUT = timedelta(minutes=5)
+RETENTION = timedelta(days=getattr(settings, 'EMAIL_OUTBOX_RETENTION_DAYS', 7))
+
+# The server answered for this message; the connection itself is fine
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException)
+
+
+def enqueue_email(to_email, subject, body):
+    message = EmailOutbox.objects.create(to_email=to_email, subject=subject, body=body)
+    transaction.on_commit(notify_worker)
+    return message
+
+
+def notify_worker():
+    """Ask Celery for an immediate delivery run; the periodic run is the fallback"""
+    from .tasks import deliver_email_outbox
+
+    try:
+        deliver_email_outbox.apply_async(retry=False)
+    except Exception:
+        logger.warning('Could not queue the email outbox task, the next periodic run will send', exc_info=True)
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX))
+
+
+def claim_due(limit, now):
+    """
+    Lock up to ``limit`` due messages for this worker by pushing their
+    next_attempt_at past the claim timeout. The conditional update makes a
+    message go to exactly one of several concurrent workers.
+    """
+    due = EmailOutbox.objects.filter(
+        status=EmailOutbox.Status.PENDING, next_attempt_at__lte=now
+    ).order_by('next_attempt_at').values_list('id', 'next_attempt_at')[:limit]
+
+    claimed = []
+    for message_id, next_attempt_at in due:
+        if EmailOutbox.objects.filter(
+            id=message_id, status=EmailOutbox.Status.PENDING, next_attempt_at=next_attempt_at
+        ).update(next_attempt_at=now + CLAIM_TIMEOUT):
+            claimed.append(message_id)
+    return list(EmailOutbox.objects.filter(id__in=claimed).order_by('id'))
+
+
+def deliver_pending(limit=100):
+    """Send the due messages over one SMTP connection, returns how many were sent"""
+    now = timezone.now()
+    messages = claim_due(limit, now)
+    if not messages:
+        return 0
+
+    sent = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        for index, message in enumerate(messages):
+            try:
+                # Opened once and reused; send() alone would reconnect per message
+                connection.open()
+                EmailMessage(
+                    message.subject, message.body, settings.DEFAULT_FROM_EMAIL,
+                    [message.to_email], connection=connection
+                ).send()
+            except MESSAGE_ERRORS as exc:
+                _record_failure(message, exc)
+            except Exception as exc:
+                # The server is unreachable or dropped us: count it against this
+                # message only and hand the rest back to the next run
+                _record_failure(message, exc)
+                rest = [pending.pk for pending in messages[index + 1:]]
+                EmailOutbox.objects.filter(id__in=rest).update(next_attempt_at=now)
+                break
+            else:
+                message.status = EmailOutbox.Status.SENT
+                message.attempts += 1
+                message.sent_at = timezone.now()
+                message.last_error = ''
+                message.body = ''
+                message.save(update_fields=['status', 'attempts', 'sent_at', 'last_error', 'body'])
+                sent += 1
+    finally:
+        connection.close()
+    return sent
+
+
+def _record_failure(message, exc):
+    message.attempts += 1
+    message.last_error = f'{type(exc).__name__}: {exc}'
+    if message.attempts >= MAX_ATTEMPTS:
+        message.status = EmailOutbox.Status.FAILED
+        message.body = ''
+        logger.error('Giving up on email %s to %s: %s', message.pk, message.to_email, message.last_error)
+    else:
+        message.next_attempt_at = timezone.now() + backoff(message.attempts)
+    message.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at', 'body'])
+
+
+def purge_finished(now=None):
+    """Delete sent and failed messages older than RETENTION, returns how many"""
+    cutoff = (now or timezone.now()) - RETENTION
+    deleted, _ = EmailOutbox.objects.filter(
+        status__in=[EmailOutbox.Status.SENT, EmailOutbox.Status.FAILED], created_at__lt=cutoff
+    ).delete()
+    return deleted
@@ -0,0 +1,93 @@
+# accounts/session_cache.py
+"""
+Cache of validated login sessions.
+
+JWTAuthentication used to load the user row on every request just to compare
+``current_token_user`` with the bearer token. After the first request of a
+session the cache holds the token hash plus the role and permission flags, so
+the next requests authenticate without touching the database. Any save of the
+user (login, logout, role change) drops the entry, see signals.py.
+
+Logout and token replacement revoke a session by deleting its entry, which
+only works if every worker reads the same cache. With a per-process backend
+(locmem://, the default, or dummy://) sessions are therefore not cached at
+all and every request checks the token against the database as before; set
+STORE_CACHE_URL to a shared cache (see Store2/cache_profiles.py) to get the
+query-free path.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.functional import SimpleLazyObject
+
+from Store2.cache_profiles import PER_PROCESS_BACKENDS
+
+SESSION_KEY = 'auth:session:{user_id}'
+SESSION_CACHE_ALIAS = getattr(settings, 'AUTH_SESSION_CACHE_ALIAS', 'default')
+SESSION_TIMEOUT = getattr(settings, 'AUTH_SESSION_CACHE_TIMEOUT', 60)
+# Attributes the permission classes read, served without loading the user
+CACHED_FIELDS = ('role', 'is_active', 'is_staff', 'is_superuser')
+
+
+def _cache():
+    return caches[SESSION_CACHE_ALIAS]
+
+
+def enabled():
+    """Only with a cache every worker shares: a revocation must reach them all"""
+    return settings.CACHES[SESSION_CACHE_ALIAS]['BACKEND'] not in PER_PROCESS_BACKENDS
+
+
+def token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def get_session(user_id, token):
+    """The cached session for this exact token, or None"""
+    if not enabled():
+        return None
+    session = _cache().get(SESSION_KEY.format(user_id=user_id))
+    if session and session['token'] == token_hash(token):
+        return session
+    return None
+
+
+def store_session(user, token, expires_at=None):
+    if not enabled():
+        return
+    timeout = SESSION_TIMEOUT
+    if expires_at:
+        timeout = min(timeout, int(expires_at - time.time()))
+        if timeout <= 0:
+            return
+    session = {'token': token_hash(token)}
+    session.update({field: getattr(user, field) for field in CACHED_FIELDS})
+    _cache().set(SESSION_KEY.format(user_id=user.pk), session, timeout)
+
+
+def invalidate_session(user_id):
+    _cache().delete(SESSION_KEY.format(user_id=user_id))
+
+
+class SessionUser(SimpleLazyObject):
+    """
+    The authenticated user built from a cached session: ``id``, ``role`` and
+    the permission flags are answered directly, anything else loads the
+    ``User`` row (once) and proxies to it.
+    """
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id, session):
+        from .models import User
+
+        super().__init__(lambda: User.objects.get(pk=user_id))
+        self.__dict__['id'] = self.__dict__['pk'] = user_id
+        for field in CACHED_FIELDS:
+            self.__dict__[field] = session[field]
+
+    def __bool__(self):
+        # IsAuthenticated checks `request.user and ...`; don't load the row for that
+        return True
@@ -1,9 +1,16 @@
 # accounts/signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from .models import User, Profile
+from .session_cache import invalidate_session
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_session(sender, instance, **kwargs):
+    # تسجيل دخول/خروج او تغيير الدور يلغي الجلسة المخزنة
+    invalidate_session(instance.pk)
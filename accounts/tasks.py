@@ -0,0 +1,24 @@
+from celery import shared_task
+
+from .outbox import deliver_pending
+
+@shared_task
+def deliver_email_outbox():
+    sent = deliver_pending()
+    return f"Sent {sent} emails"
+
+
+@shared_task
+def purge_email_outbox():
+    from .outbox import purge_finished
+
+    purged = purge_finished()
+    return f"Purged {purged} emails"
+
+
+@shared_task
+def purge_idempotency_keys():
+    from .idempotency import purge_expired
+
+    purged = purge_expired()
+    return f"Purged {purged} idempotency keys"
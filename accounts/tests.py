@@ -1,3 +1,380 @@
-from django.test import TestCase
+import os
+import socket
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from unittest import skipUnless
 
-# Create your tests here.
+import jwt
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from wallet import ledger
+from wallet.models import Transaction
+from . import idempotency, outbox
+from .authentication import ACCESS_KEY_ID, JWTAuthentication, decode_token
+from .models import EmailOutbox, IdempotencyKey, User
+from .outbox import deliver_pending, enqueue_email
+from .session_cache import SessionUser
+from .utils import SESSION_KEY_ID
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+
+# Sessions are only cached in a cache shared by the workers
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'store-session-cache-tests'),
+    }
+}
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class SessionCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass12345',
+            first_name='seller', last_name='test', phone_number='0000', role='seller'
+        )
+
+    def login(self):
+        response = self.client.post('/api/LoginAPI/', {'email': 'seller@example.com', 'password': 'pass12345'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['token']
+
+    def authenticate(self, token):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return JWTAuthentication().authenticate(request)
+
+    def test_cached_session_needs_no_query(self):
+        token = self.login()
+        with self.assertNumQueries(1):
+            user, _ = self.authenticate(token)
+        self.assertIsInstance(user, User)
+
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate(token)
+            self.assertIsInstance(user, SessionUser)
+            self.assertTrue(user and user.is_authenticated)
+            self.assertEqual((user.id, user.pk, user.role, user.is_superuser), (self.user.id, self.user.id, 'seller', False))
+
+        # Anything else loads the user once
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, 'seller@example.com')
+            self.assertEqual(user.username, 'seller')
+
+    def test_login_and_logout_invalidate(self):
+        old_token = self.login()
+        self.authenticate(old_token)
+
+        # A login from another device replaces the stored token
+        self.user.refresh_from_db()
+        self.user.current_token_user = 'another-device'
+        self.user.save(update_fields=['current_token_user'])
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(old_token)
+
+        new_token = self.login()
+        self.authenticate(new_token)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {new_token}')
+        self.assertEqual(self.client.post('/api/LogoutAPI/').status_code, 200)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(new_token)
+
+    def test_role_change_invalidates(self):
+        token = self.login()
+        self.authenticate(token)
+        self.user.refresh_from_db()
+        self.user.role = 'user'
+        self.user.save()
+        self.assertEqual(self.authenticate(token)[0].role, 'user')
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_per_process_cache_checks_the_database(self):
+        # Another worker's logout would never reach this process's entry
+        token = self.login()
+        self.authenticate(token)
+        with self.assertNumQueries(1):
+            self.assertIsInstance(self.authenticate(token)[0], User)
+
+        User.objects.filter(pk=self.user.pk).update(current_token_user=None)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+
+class UnifiedAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='pass12345',
+            first_name='buyer', last_name='test', phone_number='0000', role='user'
+        )
+
+    def cart(self, token):
+        return self.client.get('/api/product/cart/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_simplejwt_access_tokens(self):
+        tokens = self.client.post(
+            '/api/auth/login/', {'email': 'buyer@example.com', 'password': 'pass12345'}
+        ).json()
+        self.assertEqual(self.cart(tokens['access']).status_code, 200)
+        # Refresh tokens are not bearer credentials
+        self.assertEqual(self.cart(tokens['refresh']).status_code, 403)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.cart(tokens['access']).status_code, 403)
+
+    def test_session_tokens_with_and_without_key_id(self):
+        token = self.client.post(
+            '/api/LoginAPI/', {'email': 'buyer@example.com', 'password': 'pass12345'}
+        ).json()['token']
+        self.assertEqual(jwt.get_unverified_header(token)['kid'], SESSION_KEY_ID)
+        self.assertEqual(self.cart(token).status_code, 200)
+
+        # Issued before tokens carried a kid
+        legacy = jwt.encode(jwt.decode(token, options={'verify_signature': False}), settings.SECRET_KEY, algorithm='HS256')
+        User.objects.filter(pk=self.user.pk).update(current_token_user=legacy)
+        self.assertEqual(self.cart(legacy).status_code, 200)
+
+    def test_one_signature_check_per_token(self):
+        session = self.client.post(
+            '/api/LoginAPI/', {'email': 'buyer@example.com', 'password': 'pass12345'}
+        ).json()['token']
+        legacy = jwt.encode(jwt.decode(session, options={'verify_signature': False}), settings.SECRET_KEY, algorithm='HS256')
+        access = self.client.post(
+            '/api/auth/login/', {'email': 'buyer@example.com', 'password': 'pass12345'}
+        ).json()['access']
+
+        for token, key_id in ((session, SESSION_KEY_ID), (legacy, SESSION_KEY_ID), (access, ACCESS_KEY_ID)):
+            with mock.patch('accounts.authentication.jwt.decode', wraps=jwt.decode) as decode:
+                self.assertEqual(decode_token(token)[0], key_id)
+            verified = [call for call in decode.call_args_list if call.args[1:]]
+            self.assertEqual(len(verified), 1)
+
+    def test_logout_revokes_access_tokens(self):
+        access = self.client.post(
+            '/api/auth/login/', {'email': 'buyer@example.com', 'password': 'pass12345'}
+        ).json()['access']
+        response = self.client.post('/api/LogoutAPI/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cart(access).status_code, 403)
+
+        # Logging in again (a moment later) works
+        User.objects.filter(pk=self.user.pk).update(tokens_revoked_at=timezone.now() - timedelta(seconds=2))
+        access = self.client.post(
+            '/api/auth/login/', {'email': 'buyer@example.com', 'password': 'pass12345'}
+        ).json()['access']
+        self.assertEqual(self.cart(access).status_code, 200)
+
+    def test_rejects_foreign_keys_and_algorithms(self):
+        payload = {'user_id': self.user.pk}
+        forged = [
+            jwt.encode(payload, 'not-our-key', algorithm='HS256', headers={'kid': SESSION_KEY_ID}),
+            jwt.encode(payload, 'not-our-key', algorithm='HS256'),
+            jwt.encode(payload, settings.SECRET_KEY, algorithm='HS512', headers={'kid': SESSION_KEY_ID}),
+            jwt.encode(payload, settings.SECRET_KEY, algorithm='HS256', headers={'kid': 'unknown'}),
+            'not.a.token',
+        ]
+        for token in forged:
+            with self.assertRaises(AuthenticationFailed):
+                decode_token(token)
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(
+            email='alice@example.com', username='alice', password='pass12345',
+            first_name='alice', last_name='test', phone_number='0000'
+        )
+        User.objects.create_user(
+            email='bob@example.com', username='bob', password='pass12345',
+            first_name='bob', last_name='test', phone_number='0000'
+        )
+        ledger.deposit(self.alice.wallet.id, Decimal('100.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def transfer(self, amount='10.00', key='retry-1'):
+        return self.client.post(
+            '/api/wallet/transfer/', {'recipient_email': 'bob@example.com', 'amount': amount},
+            format='json', HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_retries_replay_the_first_response(self):
+        first = self.transfer()
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.json()['reference'].startswith('TRF-'))
+
+        with self.assertNumQueries(1):  # the stored response
+            retry = self.transfer()
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Transaction.objects.filter(transaction_type='transfer').count(), 2)
+
+        # A new key is a new transfer, with its own reference
+        second = self.transfer(key='retry-2')
+        self.assertNotEqual(second.json()['reference'], first.json()['reference'])
+        self.assertEqual(Transaction.objects.filter(transaction_type='transfer').count(), 4)
+
+    def test_key_reused_for_another_request(self):
+        self.transfer()
+        response = self.transfer(amount='20.00')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Transaction.objects.filter(transaction_type='transfer').count(), 2)
+
+    def test_failures_leave_the_key_free(self):
+        with mock.patch.object(ledger, 'transfer', side_effect=RuntimeError('database went away')):
+            with self.assertRaises(RuntimeError):
+                self.transfer()
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        self.assertEqual(self.transfer().status_code, 200)
+        self.assertEqual(IdempotencyKey.objects.get().response_status, 200)
+
+    def test_expired_keys(self):
+        self.transfer()
+        IdempotencyKey.objects.update(created_at=timezone.now() - idempotency.KEY_TTL - timedelta(minutes=1))
+        response = self.transfer()
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Transaction.objects.filter(transaction_type='transfer').count(), 4)
+
+        IdempotencyKey.objects.update(created_at=timezone.now() - idempotency.KEY_TTL - timedelta(minutes=1))
+        self.assertEqual(idempotency.purge_expired(), 1)
+
+
+class EmailOutboxTests(TestCase):
+    def test_verification_email_is_queued_not_sent(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = APIClient().post('/api/EmailVerificationAPI/', {'email': 'new@example.com', 'role': 'user'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(len(callbacks), 1)
+
+        queued = EmailOutbox.objects.get()
+        self.assertEqual((queued.to_email, queued.status), ('new@example.com', EmailOutbox.Status.PENDING))
+
+        self.assertEqual(deliver_pending(), 1)
+        self.assertEqual(mail.outbox[0].to, ['new@example.com'])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (EmailOutbox.Status.SENT, 1))
+        # The code is not kept once it went out
+        self.assertEqual(queued.body, '')
+        self.assertEqual(deliver_pending(), 0)
+
+    def test_finished_messages_are_purged(self):
+        sent = enqueue_email('sent@example.com', 'Code', '1234')
+        failed = enqueue_email('failed@example.com', 'Code', '1234')
+        pending = enqueue_email('pending@example.com', 'Code', '1234')
+        EmailOutbox.objects.filter(pk=sent.pk).update(status=EmailOutbox.Status.SENT)
+        EmailOutbox.objects.filter(pk=failed.pk).update(status=EmailOutbox.Status.FAILED)
+        self.assertEqual(outbox.purge_finished(), 0)
+
+        EmailOutbox.objects.update(created_at=timezone.now() - outbox.RETENTION - timedelta(minutes=1))
+        self.assertEqual(outbox.purge_finished(), 2)
+        self.assertEqual(list(EmailOutbox.objects.values_list('pk', flat=True)), [pending.pk])
+
+
+class RecordingHandler:
+    """aiosmtpd handler: records deliveries per SMTP session, refuses *@bounce.test"""
+
+    def __init__(self):
+        self.deliveries = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.endswith('@bounce.test'):
+            return '550 No such user'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.deliveries.append((id(session), envelope.rcpt_tos[0]))
+        return '250 Message accepted for delivery'
+
+
+@skipUnless(Controller, 'aiosmtpd is not installed')
+class SMTPDeliveryTests(TestCase):
+    def setUp(self):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            self.port = probe.getsockname()[1]
+        self.handler = RecordingHandler()
+        self.start_server()
+        self.addCleanup(self.stop_server)
+        smtp = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.port,
+            EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='', EMAIL_USE_TLS=False,
+        )
+        smtp.enable()
+        self.addCleanup(smtp.disable)
+
+    def start_server(self):
+        self.controller = Controller(self.handler, hostname='127.0.0.1', port=self.port)
+        self.controller.start()
+
+    def stop_server(self):
+        if self.controller:
+            self.controller.stop()
+            self.controller = None
+
+    def test_batch_shares_one_connection_and_retries_with_backoff(self):
+        for index in range(3):
+            enqueue_email(f'user{index}@example.com', 'Code', '1234')
+        bounced = enqueue_email('nobody@bounce.test', 'Code', '1234')
+
+        self.assertEqual(deliver_pending(), 3)
+        self.assertEqual(sorted(to for _, to in self.handler.deliveries), [f'user{i}@example.com' for i in range(3)])
+        self.assertEqual(len({session for session, _ in self.handler.deliveries}), 1)
+
+        bounced.refresh_from_db()
+        self.assertEqual((bounced.status, bounced.attempts), (EmailOutbox.Status.PENDING, 1))
+        self.assertIn('550', bounced.last_error)
+        self.assertGreater(bounced.next_attempt_at, timezone.now())
+        # Not due yet
+        self.assertEqual(deliver_pending(), 0)
+
+        delays = [bounced.next_attempt_at - timezone.now()]
+        for attempt in range(2, outbox.MAX_ATTEMPTS):
+            EmailOutbox.objects.filter(pk=bounced.pk).update(next_attempt_at=timezone.now())
+            deliver_pending()
+            bounced.refresh_from_db()
+            self.assertEqual(bounced.attempts, attempt)
+            delays.append(bounced.next_attempt_at - timezone.now())
+        # Exponential backoff between attempts
+        self.assertTrue(all(later > earlier * 1.5 for earlier, later in zip(delays, delays[1:])))
+
+        EmailOutbox.objects.filter(pk=bounced.pk).update(next_attempt_at=timezone.now())
+        with self.assertLogs('accounts.outbox', 'ERROR'):
+            deliver_pending()
+        bounced.refresh_from_db()
+        self.assertEqual((bounced.status, bounced.attempts), (EmailOutbox.Status.FAILED, outbox.MAX_ATTEMPTS))
+        self.assertEqual(bounced.body, '')
+
+    def test_unreachable_server_releases_the_batch(self):
+        messages = [enqueue_email(f'user{index}@example.com', 'Code', '1234') for index in range(3)]
+        self.stop_server()
+
+        self.assertEqual(deliver_pending(), 0)
+        attempts = [EmailOutbox.objects.get(pk=message.pk).attempts for message in messages]
+        self.assertEqual(attempts, [1, 0, 0])
+
+        self.start_server()
+        self.assertEqual(deliver_pending(), 2)
@@ -4,7 +4,6 @@ import random
 import re
 from datetime import datetime, timedelta
 from django.conf import settings
-from django.core.mail import send_mail
 from django.core.exceptions import ValidationError
 from rest_framework.exceptions import AuthenticationFailed
 from cryptography.fernet import Fernet
@@ -45,13 +44,16 @@ def verify_encrypted_token(raw_code: str, encrypted_code: str) -> bool:
     """مقارنة الرمز المدخل مع المشفر."""
     return check_password(raw_code, encrypted_code)
 
+# معرف المفتاح في هيدر التوكن، يحدد مفتاح التحقق في JWTAuthentication
+SESSION_KEY_ID = 'session'
+
 def create_jwt_token(payload: dict, expires_minutes: int = 60) -> str:
     """إنشاء JWT Token مع صلاحية محددة"""
     payload.update({
         'exp': datetime.utcnow() + timedelta(minutes=expires_minutes),
         'iat': datetime.utcnow()
     })
-    return jwt.encode(payload, settings.SECRET_KEY, algorithm='HS256')
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm='HS256', headers={'kid': SESSION_KEY_ID})
 
 def decode_jwt_token(token: str) -> dict:
     """فك تشفير JWT Token"""
@@ -71,10 +73,12 @@ def create_monthly_token(payload: dict) -> str:
 # ------------------ Email Operations ------------------
 
 def send_verification_email(email: str, code: str) -> None:
-    """إرسال رمز التحقق إلى البريد الإلكتروني."""
+    """إضافة رمز التحقق إلى صندوق الإرسال، يرسله العامل بعد حفظ المعاملة."""
+    from .outbox import enqueue_email
+
     subject = "رمز التحقق الخاص بك"
     message = f"رمز التحقق الخاص بك هو: {code}"
-    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [email], fail_silently=False)
+    enqueue_email(email, subject, message)
 
 
 
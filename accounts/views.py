@@ -14,14 +14,16 @@ from django.core.exceptions import ObjectDoesNotExist
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.exceptions import ValidationError
 
 import random
 import jwt
 from cryptography.fernet import Fernet
 
+from Store2.routers import ReadReplicaMixin
 from .models import EmailVerification, Purpose, User, Role
+from .session_cache import invalidate_session
 from .utils import (
     decode_jwt_token,
     decrypt_token,
@@ -534,6 +536,17 @@ class LoginAPIView(APIView):
             }
         }, status=status.HTTP_200_OK)
 
+class LogoutAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        # إلغاء التوكن الحالي، اي طلب لاحق بنفس التوكن يرفض
+        User.objects.filter(pk=request.user.id).update(
+            current_token_user=None, tokens_revoked_at=timezone.now()
+        )
+        invalidate_session(request.user.id)
+        return Response({'message': 'تم تسجيل الخروج بنجاح.'}, status=status.HTTP_200_OK)
+
 class VerifyResetCodeView(APIView):
     authentication_classes = []  # إلغاء المصادقة الافتراضية
     permission_classes = []
@@ -1163,7 +1176,7 @@ class ConfirmEmailChangeAPIView(APIView):
 
 from .serializers import PublicUserProfileSerializer
 
-class ListUsersView(APIView):
+class ListUsersView(ReadReplicaMixin, APIView):
     permission_classes = [IsAuthenticated, IsSuperAdminOrAdmin]
 
     def get(self, request):
@@ -1172,7 +1185,7 @@ class ListUsersView(APIView):
         return Response(serializer.data)
 
 
-class ListSellersView(APIView):
+class ListSellersView(ReadReplicaMixin, APIView):
     permission_classes = [IsAuthenticated, IsSuperAdminOrAdmin]
 
     def get(self, request):
@@ -1181,7 +1194,7 @@ class ListSellersView(APIView):
         return Response(serializer.data)
 
 
-class ListDeliveryView(APIView):
+class ListDeliveryView(ReadReplicaMixin, APIView):
     permission_classes = [IsAuthenticated, IsSuperAdminOrAdmin]
 
     def get(self, request):
@@ -1190,7 +1203,7 @@ class ListDeliveryView(APIView):
         return Response(serializer.data)
 
 
-class ListAdminsView(APIView):
+class ListAdminsView(ReadReplicaMixin, APIView):
     permission_classes = [IsAuthenticated, IsSuperAdmin]
 
     def get(self, request):
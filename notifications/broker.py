@@ -0,0 +1,212 @@
+# notifications/broker.py
+"""
+In-process pub/sub behind the notification stream (``/api/notifications/stream/``).
+
+Each open stream subscribes a small queue for its user and ``publish()``
+hands an event to every queue of that user. Publishing is thread safe:
+notifications are created in sync code (request threads, signal receivers)
+while the streams wait on the ASGI event loop.
+
+A broker only reaches the streams of its own worker process. With several
+workers, or when notifications are written by Celery (the wishlist
+fan-out), set ``NOTIFICATION_STREAM_RELAY = 'database'``: every worker then
+runs one ``DatabaseRelay`` that tails the notifications table by id and
+publishes the new rows of its connected users locally. It stands in for a
+Redis or Postgres LISTEN channel at a few indexed queries per interval per
+worker, however many clients are connected. Ids are allocated before commit
+(PostgreSQL sequences), so a row can become visible after a higher id has
+been seen: each poll re-reads the last NOTIFICATION_STREAM_RELAY_OVERLAP ids
+and skips the ones it already went through.
+
+In the default ``'local'`` mode only notifications created with ``save()``
+in the stream's own process are pushed; the bulk-created wishlist alerts
+never are.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+RELAY = getattr(settings, 'NOTIFICATION_STREAM_RELAY', 'local')
+RELAY_INTERVAL = getattr(settings, 'NOTIFICATION_STREAM_RELAY_INTERVAL', 1.0)
+# How far below the highest id seen each poll looks again for late commits
+RELAY_OVERLAP = getattr(settings, 'NOTIFICATION_STREAM_RELAY_OVERLAP', 1000)
+QUEUE_SIZE = 100
+
+
+class Subscription:
+    """One open stream: a queue on the event loop the stream runs on"""
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        # A client too slow to keep up is disconnected; it resumes from
+        # Last-Event-ID when it reconnects
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+        self._relays = {}
+
+    def subscribe(self, user_id):
+        """Must be called on the event loop that will read the subscription"""
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        if RELAY == 'database':
+            self._start_relay(subscription.loop)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def is_connected(self, user_id):
+        return user_id in self._subscriptions
+
+    def user_ids(self):
+        with self._lock:
+            return list(self._subscriptions)
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def publish(self, user_id, event):
+        """Queue ``event`` for every stream of ``user_id``, from any thread; returns how many"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        delivered = 0
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+                delivered += 1
+            except RuntimeError:
+                # Its loop is gone (worker shutting down)
+                subscription.close()
+        return delivered
+
+    def _start_relay(self, loop):
+        relay = self._relays.get(loop)
+        if relay is None or relay.task.done():
+            self._relays[loop] = DatabaseRelay(self, loop)
+
+
+broker = Broker()
+
+
+def notification_event(notification, unread_count):
+    from .serializers import NotificationSerializer
+
+    return {
+        'id': notification.id,
+        'event': 'notification',
+        'data': {'notification': NotificationSerializer(notification).data, 'unread_count': unread_count},
+    }
+
+
+def format_event(event):
+    """Server-Sent Events wire format"""
+    lines = []
+    if event.get('id') is not None:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['event']}")
+    lines.append(f"data: {json.dumps(event['data'], separators=(',', ':'), default=str)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def publish_on_commit(notification):
+    """Push a just-created notification to its user's open streams (same-process relay)"""
+    if RELAY != 'local' or not broker.is_connected(notification.user_id):
+        return
+
+    def send():
+        from .unread import unread_count
+
+        broker.publish(notification.user_id, notification_event(notification, unread_count(notification.user_id)))
+
+    transaction.on_commit(send)
+
+
+class DatabaseRelay:
+    """Publishes the notifications other processes wrote, see the module docstring"""
+
+    BATCH_SIZE = 500
+
+    def __init__(self, broker, loop):
+        self.broker = broker
+        self.last_id = None
+        # Ids of the overlap window already gone through (any user)
+        self.seen = set()
+        self.task = loop.create_task(self.run())
+
+    async def run(self):
+        while True:
+            try:
+                await sync_to_async(self.poll)()
+            except Exception:
+                logger.exception('Notification relay poll failed')
+            await asyncio.sleep(RELAY_INTERVAL)
+
+    def poll(self):
+        from .models import Notification, UnreadCounter
+
+        if self.last_id is None:
+            # Only what is written from now on; older rows are replayed by Last-Event-ID
+            self.last_id = Notification.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            self.seen = set(Notification.objects.filter(
+                id__gt=self.last_id - RELAY_OVERLAP
+            ).values_list('id', flat=True))
+            return 0
+
+        floor = self.last_id - RELAY_OVERLAP
+        ids = list(Notification.objects.filter(id__gt=floor).order_by('id').values_list(
+            'id', flat=True
+        )[:len(self.seen) + self.BATCH_SIZE])
+        new_ids = [pk for pk in ids if pk not in self.seen]
+
+        user_ids = self.broker.user_ids()
+        published = 0
+        if user_ids and new_ids:
+            rows = list(Notification.objects.filter(
+                id__in=new_ids, user_id__in=user_ids
+            ).order_by('id'))
+            counts = dict(UnreadCounter.objects.filter(
+                user_id__in={row.user_id for row in rows}
+            ).values_list('user_id', 'unread'))
+            for row in rows:
+                published += self.broker.publish(row.user_id, notification_event(row, counts.get(row.user_id, 0)))
+
+        if ids:
+            self.last_id = max(self.last_id, ids[-1])
+        self.seen.update(new_ids)
+        self.seen = {pk for pk in self.seen if pk > self.last_id - RELAY_OVERLAP}
+        return published
@@ -0,0 +1,158 @@
+# notifications/fanout.py
+"""
+Fan-out of one alert to every user who has a product in their wishlist.
+
+Signal receivers only store a ``WishlistFanout`` job in their own
+transaction and, once it commits, queue it on Celery; when the broker is
+unreachable the job simply waits for the periodic sweep
+(``run_pending_fanouts``), the request never does the fan-out itself. A
+worker streams the wishlister ids in chunks and writes the notifications
+with bulk_create. Every row carries a dedupe key, so running
+the same alert twice (a product saved again with the same discount, a
+retried task) never notifies anyone twice. bulk_create can't tell which rows
+were skipped as duplicates, so the unread counters of each batch's users
+are recounted rather than incremented.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+
+from notifications.models import Notification, WishlistFanout
+from notifications.unread import recount
+from products.models import Product, WishlistItem
+
+logger = logging.getLogger(__name__)
+
+FANOUT_BATCH_SIZE = getattr(settings, 'NOTIFICATION_FANOUT_BATCH_SIZE', 1000)
+MAX_ATTEMPTS = getattr(settings, 'NOTIFICATION_FANOUT_MAX_ATTEMPTS', 6)
+BACKOFF_BASE = 30
+BACKOFF_MAX = 3600
+# How long a claimed job stays invisible to other workers
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def discount_dedupe_key(product):
+    """One key per product and standalone discount window"""
+    window = [
+        int(value.timestamp()) if value else 'none'
+        for value in (product.standalone_discount_start, product.standalone_discount_end)
+    ]
+    return f"discount:{product.pk}:{product.standalone_discount_percentage}:{window[0]}:{window[1]}"
+
+
+def sale_dedupe_key(product_sale):
+    return f"sale:{product_sale.product_id}:{product_sale.pk}"
+
+
+def wishlist_user_ids(product_id, chunk_size=FANOUT_BATCH_SIZE):
+    """Distinct ids of the users wishlisting ``product_id``, fetched ``chunk_size`` at a time"""
+    return WishlistItem.objects.filter(
+        product_id=product_id
+    ).order_by('wishlist__user_id').values_list(
+        'wishlist__user_id', flat=True
+    ).distinct().iterator(chunk_size=chunk_size)
+
+
+def fan_out_to_wishlists(product_id, notification_type, message_ar, message_en, dedupe_key,
+                         batch_size=FANOUT_BATCH_SIZE):
+    """Write the alert for every wishlister, returns how many users were processed"""
+    content_type = ContentType.objects.get_for_model(Product)
+    processed = 0
+    batch = []
+    for user_id in wishlist_user_ids(product_id, batch_size):
+        batch.append(Notification(
+            user_id=user_id,
+            notification_type=notification_type,
+            message_ar=message_ar,
+            message_en=message_en,
+            content_type=content_type,
+            object_id=product_id,
+            dedupe_key=dedupe_key,
+        ))
+        if len(batch) >= batch_size:
+            processed += _write(batch)
+            batch = []
+    if batch:
+        processed += _write(batch)
+    return processed
+
+
+def _write(batch):
+    Notification.objects.bulk_create(batch, ignore_conflicts=True)
+    # A retried task recounts again, so no transaction is needed to keep them in step
+    recount(notification.user_id for notification in batch)
+    return len(batch)
+
+
+def schedule_wishlist_fanout(**kwargs):
+    """Store the fan-out with the current transaction, queue it once that commits"""
+    job = WishlistFanout.objects.create(**kwargs)
+    transaction.on_commit(lambda: _dispatch(job.pk))
+
+
+def _dispatch(job_id):
+    from notifications.tasks import run_wishlist_fanout
+
+    try:
+        run_wishlist_fanout.apply_async(args=[job_id], retry=False)
+    except Exception:
+        logger.warning('Could not queue the wishlist fan-out, the next periodic sweep will run it', exc_info=True)
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX))
+
+
+def _claim(job_id, now):
+    """
+    Take a due job for this worker by pushing its next_attempt_at past the
+    claim timeout; the conditional update hands it to exactly one worker.
+    """
+    claimed = WishlistFanout.objects.filter(
+        id=job_id, status=WishlistFanout.Status.PENDING, next_attempt_at__lte=now
+    ).update(next_attempt_at=now + CLAIM_TIMEOUT)
+    return WishlistFanout.objects.filter(id=job_id).first() if claimed else None
+
+
+def run_job(job_id):
+    """Run one stored fan-out, returns users processed (None if another worker has it)"""
+    job = _claim(job_id, timezone.now())
+    if job is None:
+        return None
+    try:
+        processed = fan_out_to_wishlists(
+            job.product_id, job.notification_type, job.message_ar, job.message_en, job.dedupe_key
+        )
+    except Exception as exc:
+        # The rows already written are deduped when the job runs again
+        job.attempts += 1
+        job.last_error = f'{type(exc).__name__}: {exc}'
+        if job.attempts >= MAX_ATTEMPTS:
+            job.status = WishlistFanout.Status.FAILED
+            logger.error('Giving up on wishlist fan-out %s: %s', job.pk, job.last_error)
+        else:
+            job.next_attempt_at = timezone.now() + backoff(job.attempts)
+        job.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at'])
+        raise
+    job.delete()
+    return processed
+
+
+def run_pending_fanouts(limit=20):
+    """Run the due jobs (never queued, or waiting for a retry), returns how many ran"""
+    due = WishlistFanout.objects.filter(
+        status=WishlistFanout.Status.PENDING, next_attempt_at__lte=timezone.now()
+    ).order_by('next_attempt_at').values_list('id', flat=True)[:limit]
+
+    ran = 0
+    for job_id in due:
+        try:
+            if run_job(job_id) is not None:
+                ran += 1
+        except Exception:
+            logger.exception('Wishlist fan-out %s failed', job_id)
+    return ran
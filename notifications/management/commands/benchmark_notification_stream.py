@@ -0,0 +1,116 @@
+# notifications/management/commands/benchmark_notification_stream.py
+import asyncio
+import gc
+import resource
+import time
+import tracemalloc
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import User
+from notifications.broker import broker
+from Store2.benchmark import benchmark_database
+
+STREAM_PATH = '/api/notifications/stream/'
+
+
+class StreamClient:
+    """One connection driven straight through the ASGI application, no sockets"""
+
+    def __init__(self, application, token):
+        self.application = application
+        self.token = token
+        self.status = None
+        self.body = b''
+        self.connected = asyncio.Event()
+        self.notified = asyncio.Event()
+        self.disconnect = asyncio.Event()
+        self._request_sent = False
+
+    def scope(self):
+        return {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': STREAM_PATH, 'raw_path': STREAM_PATH.encode(),
+            'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'authorization', f'Bearer {self.token}'.encode())],
+            'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+        }
+
+    async def receive(self):
+        if not self._request_sent:
+            self._request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.disconnect.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif message['type'] == 'http.response.body':
+            self.body += message.get('body', b'')
+            if b'event: unread' in self.body:
+                self.connected.set()
+            if b'event: notification' in self.body:
+                self.notified.set()
+
+    async def run(self):
+        await self.application(self.scope(), self.receive, self.send)
+
+
+class Command(BaseCommand):
+    help = 'How many idle notification streams one ASGI worker holds, and how fast a push reaches them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--idle', type=float, default=2.0, help='Seconds to hold the connections idle')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user = User.objects.create_user(
+                email='bench-stream@example.com', username='bench-stream', password='bench',
+                first_name='Bench', last_name='Stream', phone_number='0', role='user'
+            )
+            token = str(RefreshToken.for_user(user).access_token)
+            async_to_sync(self.run)(user, token, options)
+
+    async def run(self, user, token, options):
+        from Store2.asgi import application
+
+        total = options['connections']
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        clients = [StreamClient(application, token) for _ in range(total)]
+        tasks = [asyncio.create_task(client.run()) for client in clients]
+        await asyncio.gather(*(client.connected.wait() for client in clients))
+        opened = time.perf_counter() - start
+
+        statuses = {client.status for client in clients}
+        held = broker.connection_count()
+        await asyncio.sleep(options['idle'])
+        gc.collect()
+        per_connection = (tracemalloc.get_traced_memory()[0] - baseline) / total
+        tracemalloc.stop()
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        start = time.perf_counter()
+        await sync_to_async(user.send_notification)('system_alert', 'تنبيه', 'Load test alert')
+        await asyncio.gather(*(client.notified.wait() for client in clients))
+        pushed = time.perf_counter() - start
+
+        for client in clients:
+            client.disconnect.set()
+        await asyncio.gather(*tasks)
+
+        self.stdout.write(
+            f'{held} idle streams (status {", ".join(map(str, sorted(statuses)))}) opened in {opened:.2f}s, '
+            f'{per_connection / 1024:.1f} KiB each, peak RSS {max_rss:.0f} MiB'
+        )
+        self.stdout.write(f'one notification reached all {total} streams in {pushed * 1000:.0f} ms')
+        self.stdout.write(self.style.SUCCESS(
+            f'{broker.connection_count()} streams left open after the clients disconnected'
+        ))
@@ -0,0 +1,12 @@
+# notifications/management/commands/rebuild_unread_counters.py
+from django.core.management.base import BaseCommand
+
+from notifications.unread import recount
+
+
+class Command(BaseCommand):
+    help = 'Recounts every user\'s unread notifications into their inbox counter'
+
+    def handle(self, *args, **options):
+        rebuilt = recount()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} unread counters'))
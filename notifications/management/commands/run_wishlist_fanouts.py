@@ -0,0 +1,15 @@
+# notifications/management/commands/run_wishlist_fanouts.py
+from django.core.management.base import BaseCommand
+
+from notifications.fanout import run_pending_fanouts
+
+
+class Command(BaseCommand):
+    help = 'Runs the wishlist fan-outs that are due (never queued, or waiting for a retry)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        ran = run_pending_fanouts(limit=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Ran {ran} wishlist fan-outs'))
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.2 on 2026-10-18 00:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_inbox_unread_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WishlistFanout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.PositiveIntegerField()),
+                ('notification_type', models.CharField(max_length=20)),
+                ('message_ar', models.TextField()),
+                ('message_en', models.TextField()),
+                ('dedupe_key', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'notifications_wishlist_fanout',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='fanout_status_next_idx')],
+            },
+        ),
+    ]
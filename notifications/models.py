@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 
@@ -23,12 +24,65 @@ class Notification(models.Model):
     message_ar = models.TextField()
     message_en = models.TextField()
     is_read = models.BooleanField(default=False)
+    read_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, blank=True)
     object_id = models.PositiveIntegerField(null=True, blank=True)
     content_object = GenericForeignKey('content_type', 'object_id')
+    # Same key for the same user = same alert, written only once (see fanout.py)
+    dedupe_key = models.CharField(max_length=100, null=True, blank=True)
 
     class Meta:
         ordering = ['-created_at']
-        db_table = 'notifications_notification'
\ No newline at end of file
+        db_table = 'notifications_notification'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'dedupe_key'], name='unique_user_notification_dedupe_key')
+        ]
+        indexes = [
+            # Inbox pages, with or without the read/unread filter
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notif_user_read_created_idx'),
+        ]
+
+
+class UnreadCounter(models.Model):
+    """Denormalized unread count of a user's inbox, see notifications/unread.py"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='notification_counter'
+    )
+    unread = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'notifications_unread_counter'
+
+
+class WishlistFanout(models.Model):
+    """A wishlist alert waiting to be fanned out by a worker (see notifications/fanout.py)"""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        FAILED = 'failed', 'Failed'
+
+    # No foreign key: a job for a deleted product just finds no wishlisters
+    product_id = models.PositiveIntegerField()
+    notification_type = models.CharField(max_length=20)
+    message_ar = models.TextField()
+    message_en = models.TextField()
+    dedupe_key = models.CharField(max_length=100)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'notifications_wishlist_fanout'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='fanout_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.dedupe_key} ({self.status})"
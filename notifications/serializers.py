@@ -1,3 +1,4 @@
+from django.contrib.contenttypes.models import ContentType
 from rest_framework import serializers
 from .models import Notification
 
@@ -18,11 +19,12 @@ class NotificationSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
     def get_related_object(self, obj):
-        if not obj.content_object:
+        if obj.content_type_id is None or obj.object_id is None:
             return None
-        
-        # Customize this based on your model serialization needs
+
+        # Read from the row itself: get_for_id() is served from the
+        # ContentType cache and the target object is never loaded
         return {
-            'type': obj.content_type.model,
+            'type': ContentType.objects.get_for_id(obj.content_type_id).model,
             'id': obj.object_id
         }
\ No newline at end of file
@@ -1,32 +1,33 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from products.models import Product, ProductSale, WishlistItem
-from django.contrib.contenttypes.models import ContentType
+from products.models import Product, ProductSale
 from notifications.models import Notification
+from notifications.broker import publish_on_commit
+from notifications.unread import add_unread
+from products.tracking import on_change
+from notifications.fanout import discount_dedupe_key, sale_dedupe_key, schedule_wishlist_fanout
+
+# Stock and other catalog edits don't concern wishlists or the seller's inbox
+DISCOUNT_FIELDS = (
+    'has_standalone_discount', 'standalone_discount_percentage',
+    'standalone_discount_start', 'standalone_discount_end',
+)
+APPROVAL_FIELDS = ('is_approved', 'approved_at', 'disapproval_reason_ar', 'disapproval_reason_en')
 
 @receiver(post_save, sender=Product)
+@on_change(*DISCOUNT_FIELDS, *APPROVAL_FIELDS)
 def handle_product_approval(sender, instance, created, **kwargs):
     product = instance
   
     if product.has_standalone_discount:
-        product_content_type = ContentType.objects.get_for_model(product)
-        # Get all wishlist items for this product with related users
-        wishlist_items = WishlistItem.objects.filter(
-            product=product
-        ).select_related('wishlist__user')
-        # Prepare notification messages in both languages
-        message_ar = f"المنتج {product.name_ar} في قائمة أمنياتك أصبح في عرض! خصم {product.standalone_discount_percentage}%"
-        message_en = f"Product {product.name_en} in your wishlist is now on sale! {product.standalone_discount_percentage}% off"
-        # Create notifications for each user
-        for item in wishlist_items:
-            Notification.objects.create(
-                user=item.wishlist.user,
-                notification_type='wishlist_discount',
-                message_ar=message_ar,
-                message_en=message_en,
-                content_type=product_content_type,
-                object_id=product.id
-            )
+        # Sent in bulk by a background task after commit, once per discount window
+        schedule_wishlist_fanout(
+            product_id=product.id,
+            notification_type='wishlist_discount',
+            message_ar=f"المنتج {product.name_ar} في قائمة أمنياتك أصبح في عرض! خصم {product.standalone_discount_percentage}%",
+            message_en=f"Product {product.name_en} in your wishlist is now on sale! {product.standalone_discount_percentage}% off",
+            dedupe_key=discount_dedupe_key(product)
+        )
         return
     if not product.standalone_discount_percentage == None:
         return
@@ -53,24 +54,21 @@ def handle_product_approval(sender, instance, created, **kwargs):
 def notify_wishlist_users(sender, instance, created, **kwargs):
     if created:
         product = instance.product
-        product_content_type = ContentType.objects.get_for_model(product)
-        
-        # Get all wishlist items for this product with related users
-        wishlist_items = WishlistItem.objects.filter(
-            product=product
-        ).select_related('wishlist__user')
-        
-        # Prepare notification messages in both languages
-        message_ar = f"المنتج {product.name_ar} في قائمة أمنياتك أصبح في عرض! خصم {instance.discount_percentage}%"
-        message_en = f"Product {product.name_en} in your wishlist is now on sale! {instance.discount_percentage}% off"
-        
-        # Create notifications for each user
-        for item in wishlist_items:
-            Notification.objects.create(
-                user=item.wishlist.user,
-                notification_type='wishlist_discount',
-                message_ar=message_ar,
-                message_en=message_en,
-                content_type=product_content_type,
-                object_id=product.id
-            )
\ No newline at end of file
+        schedule_wishlist_fanout(
+            product_id=product.id,
+            notification_type='wishlist_discount',
+            message_ar=f"المنتج {product.name_ar} في قائمة أمنياتك أصبح في عرض! خصم {instance.discount_percentage}%",
+            message_en=f"Product {product.name_en} in your wishlist is now on sale! {instance.discount_percentage}% off",
+            dedupe_key=sale_dedupe_key(instance)
+        )
+
+
+@receiver(post_save, sender=Notification)
+def notification_created(sender, instance, created, **kwargs):
+    # bulk_create (the wishlist fan-out) recounts its users itself, and its
+    # rows reach open streams through the database relay
+    if not created:
+        return
+    if not instance.is_read:
+        add_unread(instance.user_id)
+    publish_on_commit(instance)
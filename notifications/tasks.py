@@ -0,0 +1,17 @@
+from celery import shared_task
+
+from notifications.fanout import run_job, run_pending_fanouts
+
+@shared_task
+def run_wishlist_fanout(job_id):
+    processed = run_job(job_id)
+    if processed is None:
+        return f"Fan-out {job_id} already taken"
+    return f"Notified {processed} wishlist users"
+
+
+@shared_task
+def run_pending_wishlist_fanouts():
+    ran = run_pending_fanouts()
+    return f"Ran {ran} wishlist fan-outs"
+
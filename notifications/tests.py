@@ -1,3 +1,326 @@
-from django.test import TestCase
+import asyncio
+from datetime import timedelta
+from io import StringIO
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from asgiref.sync import sync_to_async
+from django.test import AsyncClient, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import User
+from notifications.broker import DatabaseRelay, broker, notification_event
+from notifications.fanout import fan_out_to_wishlists, run_pending_fanouts
+from notifications.models import Notification, UnreadCounter, WishlistFanout
+from notifications.tasks import run_wishlist_fanout
+from notifications.unread import unread_count
+from products.models import Category, Product, Wishlist, WishlistItem
+
+
+def make_user(username, role='user'):
+    return User.objects.create_user(
+        email=f'{username}@example.com', username=username, password='pass12345',
+        first_name=username, last_name='test', phone_number='0000', role=role
+    )
+
+
+class WishlistFanOutTests(TestCase):
+    def setUp(self):
+        seller = make_user('seller', role='seller')
+        category = Category.objects.create(name_ar='قسم', name_en='Category')
+        self.product = Product.objects.create(
+            seller=seller, category=category, name_ar='منتج', name_en='Product',
+            price=Decimal('50.00'), quantity=5, is_approved=True
+        )
+        self.users = [make_user(f'buyer{index}') for index in range(7)]
+        for user in self.users:
+            wishlist = Wishlist.objects.create(user=user)
+            WishlistItem.objects.create(wishlist=wishlist, product=self.product)
+
+    def alerts(self):
+        return Notification.objects.filter(notification_type='wishlist_discount')
+
+    def start_discount(self, percentage):
+        now = timezone.now()
+        self.product.has_standalone_discount = True
+        self.product.standalone_discount_percentage = Decimal(percentage)
+        self.product.standalone_discount_start = now
+        self.product.standalone_discount_end = now + timedelta(days=3)
+        self.product.save()
+
+    def run_queued_tasks(self, callbacks):
+        """Run the tasks the commit callbacks queued, as a worker would"""
+        with mock.patch.object(run_wishlist_fanout, 'apply_async') as apply_async:
+            for callback in callbacks:
+                callback()
+        for call in apply_async.call_args_list:
+            run_wishlist_fanout(*call.kwargs['args'])
+        return len(apply_async.call_args_list)
+
+    def test_discount_alert_is_sent_after_commit_in_bulk(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.start_discount('20')
+        # Nothing written inside the seller's request
+        self.assertEqual(self.alerts().count(), 0)
+
+        self.assertEqual(self.run_queued_tasks(callbacks), 1)
+        self.assertEqual(
+            sorted(self.alerts().values_list('user_id', flat=True)),
+            [user.id for user in self.users]
+        )
+        self.assertIn('20', self.alerts().first().message_en)
+
+    def test_batches_and_dedupe(self):
+        arguments = dict(
+            product_id=self.product.id, notification_type='wishlist_discount',
+            message_ar='عرض', message_en='Sale', dedupe_key='discount:test'
+        )
+        fan_out_to_wishlists(**arguments, batch_size=3)
+        # One streamed SELECT of the ids, then per batch of 3 one INSERT and
+        # the two counter queries
+        with self.assertNumQueries(10):
+            self.assertEqual(fan_out_to_wishlists(**arguments, batch_size=3), 7)
+        self.assertEqual(self.alerts().count(), 7)
+        # The repeated run was all duplicates and counted nothing twice
+        self.assertEqual([unread_count(user.id) for user in self.users], [1] * 7)
+
+    def test_same_discount_window_alerts_once(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.start_discount('20')
+            self.product.quantity += 1
+            self.product.save()
+        self.run_queued_tasks(callbacks)
+        self.assertEqual(self.alerts().count(), 7)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.start_discount('30')
+        self.run_queued_tasks(callbacks)
+        self.assertEqual(self.alerts().count(), 14)
+
+    def test_waits_for_the_sweep_without_a_broker(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.start_discount('20')
+        with mock.patch.object(run_wishlist_fanout, 'apply_async', side_effect=ConnectionError), \
+                self.assertLogs('notifications.fanout', 'WARNING'):
+            for callback in callbacks:
+                callback()
+        # Not run on the request path: the stored job waits for a worker
+        self.assertEqual(self.alerts().count(), 0)
+        self.assertEqual(WishlistFanout.objects.count(), 1)
+
+        self.assertEqual(run_pending_fanouts(), 1)
+        self.assertEqual(self.alerts().count(), 7)
+        self.assertFalse(WishlistFanout.objects.exists())
+        self.assertEqual(run_pending_fanouts(), 0)
+
+    def test_failed_jobs_are_retried_later(self):
+        with self.captureOnCommitCallbacks():
+            self.start_discount('20')
+        with mock.patch('notifications.fanout.fan_out_to_wishlists', side_effect=RuntimeError('boom')), \
+                self.assertLogs('notifications.fanout', 'ERROR'):
+            self.assertEqual(run_pending_fanouts(), 0)
+
+        job = WishlistFanout.objects.get()
+        self.assertEqual((job.status, job.attempts, job.last_error), ('pending', 1, 'RuntimeError: boom'))
+        self.assertGreater(job.next_attempt_at, timezone.now())
+        # Backing off: not due yet
+        self.assertEqual(run_pending_fanouts(), 0)
+
+        WishlistFanout.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(run_pending_fanouts(), 1)
+        self.assertEqual(self.alerts().count(), 7)
+
+
+class InboxTests(TestCase):
+    def setUp(self):
+        self.user = make_user('reader')
+        seller = make_user('seller', role='seller')
+        category = Category.objects.create(name_ar='قسم', name_en='Category')
+        self.product = Product.objects.create(
+            seller=seller, category=category, name_ar='منتج', name_en='Product',
+            price=Decimal('10.00'), quantity=1
+        )
+        self.notifications = [
+            self.user.send_notification('system_alert', f'تنبيه {i}', f'Alert {i}', content_object=self.product)
+            for i in range(5)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_pages_without_loading_targets(self):
+        ContentType.objects.get_for_model(Product)  # warm the cache, as any running process has
+        # The page and nothing per row: no product is fetched for related_object
+        with self.assertNumQueries(1):
+            first = self.client.get('/api/notifications/?page_size=3').json()
+        self.assertEqual([row['message_en'] for row in first['results']], ['Alert 4', 'Alert 3', 'Alert 2'])
+        self.assertEqual(first['results'][0]['related_object'], {'type': 'product', 'id': self.product.id})
+        self.assertIsNone(first['previous'])
+
+        second = self.client.get(first['next']).json()
+        self.assertEqual([row['message_en'] for row in second['results']], ['Alert 1', 'Alert 0'])
+        self.assertIsNone(second['next'])
+
+    def test_unread_counter_follows_creates_and_reads(self):
+        url = '/api/notifications/unread-count/'
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).json(), {'unread_count': 5})
+
+        first = self.notifications[0]
+        self.assertEqual(self.client.post(f'/api/notifications/{first.id}/read/').status_code, 200)
+        # Marking it again takes nothing more off
+        self.assertEqual(self.client.post(f'/api/notifications/{first.id}/read/').status_code, 200)
+        self.assertEqual(self.client.get(url).json(), {'unread_count': 4})
+        first.refresh_from_db()
+        self.assertIsNotNone(first.read_at)
+
+        other = make_user('other')
+        self.assertEqual(self.client.post(
+            f'/api/notifications/{other.send_notification("system_alert", "ت", "A").id}/read/'
+        ).status_code, 404)
+        self.assertEqual(unread_count(other.id), 1)
+
+        self.assertEqual(self.client.post('/api/notifications/mark-all-read/').json(),
+                         {'status': 'marked 4 notifications as read'})
+        self.assertEqual(self.client.get(url).json(), {'unread_count': 0})
+        self.assertEqual(self.client.get('/api/notifications/?is_read=false').json()['results'], [])
+
+    def test_rebuild_after_drift(self):
+        UnreadCounter.objects.filter(user=self.user).delete()
+        self.assertEqual(unread_count(self.user.id), 0)
+        call_command('rebuild_unread_counters', stdout=StringIO())
+        self.assertEqual(unread_count(self.user.id), 5)
+
+
+class NotificationStreamTests(TestCase):
+    def setUp(self):
+        self.user = make_user('listener')
+        self.earlier = self.user.send_notification('system_alert', 'قديم', 'Earlier')
+        self.headers = {'Authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+    def notify(self, message):
+        # The push happens once the creating transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.user.send_notification('system_alert', message, message)
+
+    async def open_stream(self, **headers):
+        response = await AsyncClient().get('/api/notifications/stream/', headers={**self.headers, **headers})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return (chunk.decode() async for chunk in response.streaming_content)
+
+    async def disconnect(self, events):
+        # What the ASGI handler does when the client goes away: cancel the
+        # response while it waits for the next event
+        waiting = asyncio.ensure_future(anext(events))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+
+    async def test_pushes_new_notifications(self):
+        events = await self.open_stream()
+        self.assertTrue((await anext(events)).startswith('retry:'))
+        self.assertEqual(await anext(events), 'event: unread\ndata: {"unread_count":1}\n\n')
+        self.assertEqual(broker.connection_count(), 1)
+
+        created = await sync_to_async(self.notify)('Pushed')
+        event = await anext(events)
+        self.assertIn(f'id: {created.id}\nevent: notification\n', event)
+        self.assertIn('"message_en":"Pushed"', event)
+        self.assertIn('"unread_count":2', event)
+
+        await self.disconnect(events)
+        self.assertEqual(broker.connection_count(), 0)
+
+    async def test_replays_after_last_event_id(self):
+        missed = await sync_to_async(self.user.send_notification)('system_alert', 'فائت', 'Missed')
+        events = await self.open_stream(**{'Last-Event-ID': str(self.earlier.id)})
+        await anext(events)
+        await anext(events)
+        # The overlap window below Last-Event-ID comes first
+        self.assertIn(f'id: {self.earlier.id}\n', await anext(events))
+        self.assertIn(f'id: {missed.id}\n', await anext(events))
+        await self.disconnect(events)
+
+    async def test_late_commits_are_sent_once(self):
+        create = sync_to_async(lambda **fields: Notification.objects.bulk_create([Notification(
+            user=self.user, notification_type='system_alert', message_ar='دفعة', **fields
+        )])[0])
+        # An id taken by a transaction that has not committed yet
+        late = (await create(message_en='Late')).id
+        await sync_to_async(Notification.objects.filter(id=late).delete)()
+
+        events = await self.open_stream()
+        await anext(events)
+        await anext(events)
+        higher = await sync_to_async(self.notify)('Higher')
+        self.assertIn(f'id: {higher.id}\n', await anext(events))
+
+        # It commits after the higher id was sent; the relay publishes it
+        row = await create(id=late, message_en='Late')
+        event = await sync_to_async(notification_event)(row, 2)
+        broker.publish(self.user.id, event)
+        broker.publish(self.user.id, event)
+        self.assertIn(f'id: {late}\n', await anext(events))
+        newest = await sync_to_async(self.notify)('Newest')
+        self.assertIn(f'id: {newest.id}\n', await anext(events))
+        await self.disconnect(events)
+
+        # A client that only got the higher id gets it on reconnect as well
+        events = await self.open_stream(**{'Last-Event-ID': str(higher.id)})
+        await anext(events)
+        await anext(events)
+        replayed = [await anext(events) for _ in range(4)]
+        self.assertEqual(
+            [event.split('\n')[0] for event in replayed],
+            [f'id: {pk}' for pk in sorted([self.earlier.id, late, higher.id, newest.id])]
+        )
+        await self.disconnect(events)
+
+    async def test_requires_a_token(self):
+        response = await AsyncClient().get('/api/notifications/stream/')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_database_relay_publishes_rows_written_elsewhere(self):
+        subscription = broker.subscribe(self.user.id)
+        relay = DatabaseRelay(broker, asyncio.get_running_loop())
+        relay.task.cancel()  # polled by hand below
+        try:
+            await sync_to_async(relay.poll)()
+            # Written without any signal, like the wishlist fan-out
+            await sync_to_async(Notification.objects.bulk_create)([Notification(
+                user=self.user, notification_type='system_alert', message_ar='دفعة', message_en='Bulk'
+            )])
+            self.assertEqual(await sync_to_async(relay.poll)(), 1)
+            event = await subscription.get(timeout=1)
+            self.assertEqual(event['data']['notification']['message_en'], 'Bulk')
+            self.assertEqual(await sync_to_async(relay.poll)(), 0)
+        finally:
+            subscription.close()
+
+    async def test_database_relay_catches_late_commits(self):
+        subscription = broker.subscribe(self.user.id)
+        relay = DatabaseRelay(broker, asyncio.get_running_loop())
+        relay.task.cancel()
+        create = sync_to_async(lambda **fields: Notification.objects.bulk_create([Notification(
+            user=self.user, notification_type='system_alert', message_ar='دفعة', **fields
+        )]))
+        try:
+            await sync_to_async(relay.poll)()
+            # The id a transaction took but had not committed yet...
+            late = (await create(message_en='Late'))[0].id
+            await sync_to_async(Notification.objects.filter(id=late).delete)()
+            await create(message_en='Early')
+            self.assertEqual(await sync_to_async(relay.poll)(), 1)
+            self.assertEqual((await subscription.get(timeout=1))['data']['notification']['message_en'], 'Early')
+
+            # ...commits after a higher id was relayed
+            await create(id=late, message_en='Late')
+            self.assertEqual(await sync_to_async(relay.poll)(), 1)
+            self.assertEqual((await subscription.get(timeout=1))['id'], late)
+            self.assertEqual(await sync_to_async(relay.poll)(), 0)
+        finally:
+            subscription.close()
@@ -0,0 +1,61 @@
+# notifications/unread.py
+"""
+Per-user unread counter.
+
+The inbox badge is polled constantly, so the unread count is kept in its own
+row (``UnreadCounter``, keyed by user) instead of being counted each time:
+creating an unread notification adds one, marking notifications read takes
+off exactly the rows that flipped, and the fan-out recounts the users of
+each batch it writes. ``recount()`` rebuilds counters from the notifications
+(``rebuild_unread_counters`` command) should they ever drift, e.g. after
+notifications are deleted.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Notification, UnreadCounter
+
+
+def unread_count(user_id):
+    """One primary-key lookup"""
+    count = UnreadCounter.objects.filter(user_id=user_id).values_list('unread', flat=True).first()
+    return max(count or 0, 0)
+
+
+def add_unread(user_id, amount=1):
+    if not UnreadCounter.objects.filter(user_id=user_id).update(unread=F('unread') + amount):
+        # First notification of this user
+        UnreadCounter.objects.bulk_create([UnreadCounter(user_id=user_id)], ignore_conflicts=True)
+        UnreadCounter.objects.filter(user_id=user_id).update(unread=F('unread') + amount)
+
+
+def recount(user_ids=None):
+    """Set the counters of ``user_ids`` (everyone if None) from the notifications, returns how many"""
+    counters = UnreadCounter.objects.all()
+    if user_ids is None:
+        missing = Notification.objects.filter(
+            is_read=False, user__notification_counter__isnull=True
+        ).values_list('user_id', flat=True).distinct()
+    else:
+        missing = user_ids = set(user_ids)
+        counters = counters.filter(user_id__in=user_ids)
+    UnreadCounter.objects.bulk_create([UnreadCounter(user_id=user_id) for user_id in missing],
+                                      ignore_conflicts=True)
+    unread = Notification.objects.filter(
+        user_id=OuterRef('user_id'), is_read=False
+    ).order_by().values('user_id').annotate(total=Count('id')).values('total')
+    return counters.update(unread=Coalesce(Subquery(unread, output_field=IntegerField()), Value(0)))
+
+
+def mark_read(user_id, notification_ids=None):
+    """Mark the user's unread notifications (or only ``notification_ids``) read, returns how many"""
+    notifications = Notification.objects.filter(user_id=user_id, is_read=False)
+    if notification_ids is not None:
+        notifications = notifications.filter(id__in=notification_ids)
+    # Only the rows this call flipped come off the counter, so concurrent
+    # calls never take the same notification off twice
+    updated = notifications.update(is_read=True, read_at=timezone.now())
+    if updated:
+        UnreadCounter.objects.filter(user_id=user_id).update(unread=F('unread') - updated)
+    return updated
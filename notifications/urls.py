@@ -3,7 +3,8 @@ from .views import (
     NotificationListView,
     MarkAsReadView,
     UnreadCountView,
-    MarkAllAsReadView
+    MarkAllAsReadView,
+    NotificationStreamView
 )
 
 urlpatterns = [
@@ -11,4 +12,5 @@ urlpatterns = [
     path('<int:notification_id>/read/', MarkAsReadView.as_view(), name='mark-read'),
     path('unread-count/', UnreadCountView.as_view(), name='unread-count'),
     path('mark-all-read/', MarkAllAsReadView.as_view(), name='mark-all-read'),
+    path('stream/', NotificationStreamView.as_view(), name='notification-stream'),
 ]
\ No newline at end of file
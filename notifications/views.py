@@ -1,17 +1,31 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.views import View
+from accounts.authentication import JWTAuthentication
+from products.pagination import KeysetPagination
+from .broker import RELAY_OVERLAP, broker, format_event, notification_event
 from .models import Notification
 from .serializers import NotificationSerializer
-from django.utils import timezone
-from django.db.models import Q
+from . import unread
+
+STREAM_KEEPALIVE_SECONDS = getattr(settings, 'NOTIFICATION_STREAM_KEEPALIVE_SECONDS', 15)
+STREAM_MAX_SECONDS = getattr(settings, 'NOTIFICATION_STREAM_MAX_SECONDS', 300)
+STREAM_REPLAY_LIMIT = 100
 
 class NotificationListView(APIView):
     """
-    List all notifications for the authenticated user
+    List all notifications for the authenticated user, newest first
     Supports filtering by read/unread status and notification type
+    Cursor paginated (?cursor=, ?page_size=)
     """
     permission_classes = [IsAuthenticated]
 
@@ -21,7 +35,7 @@ class NotificationListView(APIView):
         notification_type = request.query_params.get('type', None)
         
         # Base queryset
-        notifications = request.user.user_notifications.all().order_by('-created_at')
+        notifications = Notification.objects.filter(user=request.user)
         
         # Apply filters
         if is_read is not None:
@@ -29,8 +43,10 @@ class NotificationListView(APIView):
         if notification_type:
             notifications = notifications.filter(notification_type=notification_type)
         
-        serializer = NotificationSerializer(notifications, many=True)
-        return Response(serializer.data)
+        paginator = KeysetPagination(ordering=('-created_at', '-id'))
+        page = paginator.paginate_queryset(notifications, request, view=self)
+        serializer = NotificationSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class MarkAsReadView(APIView):
@@ -40,27 +56,20 @@ class MarkAsReadView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, notification_id):
-        notification = get_object_or_404(
-            Notification,
-            id=notification_id,
-            user=request.user
-        )
-        if not notification.is_read:
-            notification.is_read = True
-            notification.read_at = timezone.now()  # Add this field to your model if needed
-            notification.save()
+        if not unread.mark_read(request.user.id, [notification_id]):
+            # Already read, or not this user's
+            get_object_or_404(Notification, id=notification_id, user=request.user)
         return Response({'status': 'marked as read'}, status=status.HTTP_200_OK)
 
 
 class UnreadCountView(APIView):
     """
-    Get count of unread notifications
+    Get count of unread notifications (from the user's counter, no COUNT)
     """
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        count = request.user.user_notifications.filter(is_read=False).count()
-        return Response({'unread_count': count})
+        return Response({'unread_count': unread.unread_count(request.user.id)})
 
 
 class MarkAllAsReadView(APIView):
@@ -70,10 +79,7 @@ class MarkAllAsReadView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        updated = request.user.user_notifications.filter(is_read=False).update(
-            is_read=True,
-            read_at=timezone.now()  # Requires read_at field in model
-        )
+        updated = unread.mark_read(request.user.id)
         return Response({'status': f'marked {updated} notifications as read'})
 
 
@@ -92,9 +98,123 @@ class NotificationDetailView(APIView):
         
         # Mark as read when retrieved
         if not notification.is_read:
-            notification.is_read = True
-            notification.read_at = timezone.now()
-            notification.save()
+            unread.mark_read(request.user.id, [notification.id])
+            notification.refresh_from_db(fields=['is_read', 'read_at'])
             
         serializer = NotificationSerializer(notification)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+
+def opening_events(user_id, last_event_id):
+    """
+    The current unread count, then whatever was missed since ``last_event_id``.
+
+    A lower id can commit after ``last_event_id`` was sent (see
+    notifications/broker.py), so the relay's overlap window below it is
+    replayed too; clients drop the notifications they already have by id.
+    """
+    count = unread.unread_count(user_id)
+    events = [{'event': 'unread', 'data': {'unread_count': count}}]
+    if last_event_id is not None:
+        mine = Notification.objects.filter(user_id=user_id)
+        overlap = mine.filter(
+            id__gt=last_event_id - RELAY_OVERLAP, id__lte=last_event_id
+        ).order_by('-id')[:STREAM_REPLAY_LIMIT]
+        missed = mine.filter(id__gt=last_event_id).order_by('id')[:STREAM_REPLAY_LIMIT]
+        events += [
+            notification_event(notification, count)
+            for notification in [*reversed(overlap), *missed]
+        ]
+    return events
+
+
+class SentIds:
+    """Ids a stream already sent, down to the relay's overlap window below the highest"""
+
+    def __init__(self):
+        self.ids = set()
+        self.highest = 0
+
+    def add(self, event_id):
+        """False when ``event_id`` was already sent"""
+        if event_id in self.ids or event_id <= self.highest - RELAY_OVERLAP:
+            return False
+        self.ids.add(event_id)
+        if event_id > self.highest:
+            self.highest = event_id
+            self.ids = {pk for pk in self.ids if pk > self.highest - RELAY_OVERLAP}
+        return True
+
+
+async def notification_events(user_id, last_event_id):
+    # Subscribed before the replay is read, so nothing falls in between
+    subscription = broker.subscribe(user_id)
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + STREAM_MAX_SECONDS
+        yield f"retry: {STREAM_KEEPALIVE_SECONDS * 1000}\n\n"
+
+        sent = SentIds()
+        for event in await sync_to_async(opening_events)(user_id, last_event_id):
+            if event.get('id') is None or sent.add(event['id']):
+                yield format_event(event)
+
+        while not subscription.overflowed:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                # The client reconnects with Last-Event-ID, which also spreads
+                # long-lived connections over freshly started workers
+                break
+            try:
+                event = await subscription.get(min(STREAM_KEEPALIVE_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            # Out of id order is fine (late commits), twice is not
+            if event.get('id') is not None and not sent.add(event['id']):
+                continue
+            yield format_event(event)
+    finally:
+        subscription.close()
+
+
+class NotificationStreamView(View):
+    """
+    Server-Sent Events stream of the user's new notifications, replacing the
+    unread-count and list polling. Sends the unread count on connect, then
+    one ``notification`` event (with the new unread count) per notification.
+    Send ``Last-Event-ID`` when reconnecting to get what was missed; the
+    replay may repeat notifications just below it, keep them by id.
+
+    Only ``NOTIFICATION_STREAM_RELAY = 'database'`` pushes the wishlist
+    alerts (bulk-created by the fan-out) and notifications written by other
+    processes; the default ``'local'`` relay pushes the ones saved in this
+    worker only (see notifications/broker.py).
+
+    Async: served by the ASGI application (Store2/asgi.py), where an idle
+    stream costs a queue and no thread.
+    """
+
+    async def get(self, request):
+        try:
+            auth = await sync_to_async(JWTAuthentication().authenticate)(request)
+        except AuthenticationFailed as e:
+            return JsonResponse({"error": str(e.detail)}, status=401)
+        if auth is None:
+            return JsonResponse({"error": "Authentication credentials were not provided."}, status=401)
+
+        last_event_id = request.headers.get('Last-Event-ID')
+        if last_event_id is not None:
+            try:
+                last_event_id = int(last_event_id)
+            except ValueError:
+                return JsonResponse({"error": "Last-Event-ID must be a notification id"}, status=400)
+
+        response = StreamingHttpResponse(
+            notification_events(auth[0].id, last_event_id),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Don't let nginx buffer the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,174 @@
+# products/cart.py
+"""
+Cart read path: everything the cart response shows is loaded with a fixed
+number of queries (cart, items with product/category/parent, images, active
+sales) however many items the cart holds, and the totals are computed from
+those rows in one pass.
+
+``cart_delta()`` is the compact answer to a mutation (``?response=delta``):
+only the items that changed, the ids that were removed, the new totals and
+the cart version. ``apply_batch()`` runs many add/update/remove operations
+in one transaction, so an offline cart syncs in one round trip.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+
+from . import stock
+from .models import Cart, CartItem, Product
+from .pricing import active_sales_prefetch, with_pricing
+
+CENT = Decimal('0.01')
+BATCH_MAX_OPERATIONS = getattr(settings, 'CART_BATCH_MAX_OPERATIONS', 100)
+
+
+class BatchError(Exception):
+    """One operation of a batch failed; nothing of the batch was applied"""
+
+    def __init__(self, message, index=None, status_code=400):
+        self.message = message
+        self.index = index
+        self.status_code = status_code
+        super().__init__(message)
+
+
+def cart_items_queryset():
+    return CartItem.objects.select_related(
+        'product__category__parent'
+    ).prefetch_related('product__images').order_by('id')
+
+
+def prefetch_cart(cart, now=None):
+    """Load the items of ``cart`` with everything they render (no-op if done)"""
+    if 'items' not in getattr(cart, '_prefetched_objects_cache', {}):
+        prefetch_related_objects([cart], Prefetch('items', queryset=cart_items_queryset()))
+    prefetch_related_objects([cart], active_sales_prefetch('items__product', now))
+    return cart
+
+
+def load_cart(user_id):
+    cart, _ = Cart.objects.get_or_create(user_id=user_id)
+    return prefetch_cart(cart)
+
+
+def cart_totals(items):
+    """
+    Item count, subtotal at list price, discount and amount due, with the
+    discounted price each product actually sells at right now.
+    """
+    total_items = 0
+    total_price = Decimal('0')
+    total_due = Decimal('0')
+    for item in items:
+        total_items += item.quantity
+        total_price += item.product.price * item.quantity
+        total_due += item.product.current_price * item.quantity
+
+    return {
+        'items': total_items,
+        'price': total_price,
+        'discount': (total_price - total_due).quantize(CENT),
+        'due': total_due.quantize(CENT),
+    }
+
+
+def cart_delta(cart, changed=(), removed=()):
+    """
+    What a client needs to patch its copy of the cart after a mutation:
+    the items in ``changed`` (ids) rendered in full, everything else only
+    counted into the totals.
+    """
+    items = with_pricing(
+        CartItem.objects.filter(cart_id=cart.id).select_related('product__category__parent').order_by('id'),
+        'product'
+    )
+    changed = set(changed)
+    changed_items = [item for item in items if item.id in changed]
+    prefetch_related_objects(changed_items, 'product__images')
+
+    cart.refresh_from_db(fields=['version'])
+    return {
+        'version': cart.version,
+        'items': changed_items,
+        'removed': sorted(set(removed) - changed),
+        'totals': cart_totals(items),
+    }
+
+
+def _quantity(operation, default=None):
+    try:
+        quantity = int(operation.get('quantity', default))
+    except (ValueError, TypeError):
+        raise BatchError("Quantity must be a positive integer")
+    if quantity <= 0:
+        raise BatchError("Quantity must be a positive integer")
+    return quantity
+
+
+def _cart_item(cart, operation):
+    if operation.get('item_id') is not None:
+        lookup = {'id': operation['item_id']}
+    elif operation.get('product_id') is not None:
+        lookup = {'product_id': operation['product_id']}
+    else:
+        raise BatchError("item_id or product_id is required")
+    item = CartItem.objects.filter(cart=cart, **lookup).first()
+    if item is None:
+        raise BatchError("Item not found in your cart", status_code=404)
+    return item
+
+
+def apply_batch(cart, operations, base_version=None):
+    """
+    Apply ``operations`` ({'op': 'add'|'update'|'remove', ...}) to ``cart``
+    all or nothing. Returns the (changed, removed) item ids; raises
+    BatchError with the index of the operation that failed.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise BatchError("operations must be a non-empty list")
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise BatchError(f"At most {BATCH_MAX_OPERATIONS} operations per batch")
+
+    changed, removed = set(), set()
+    with transaction.atomic():
+        if base_version is not None:
+            version = Cart.objects.filter(id=cart.id).values_list('version', flat=True).get()
+            if str(version) != str(base_version):
+                raise BatchError("The cart changed since base_version, reload it", status_code=409)
+
+        for index, operation in enumerate(operations):
+            try:
+                if not isinstance(operation, dict):
+                    raise BatchError("Each operation must be an object")
+                op = operation.get('op')
+                if op == 'add':
+                    quantity = _quantity(operation, default=1)
+                    product = Product.objects.filter(id=operation.get('product_id'), is_approved=True).first()
+                    if product is None:
+                        raise BatchError("Product not found or not approved", status_code=404)
+                    item = stock.add_to_cart(cart, product, quantity)
+                    changed.add(item.id)
+                elif op == 'update':
+                    quantity = _quantity(operation)
+                    item = stock.set_quantity(_cart_item(cart, operation), quantity)
+                    changed.add(item.id)
+                elif op == 'remove':
+                    item = _cart_item(cart, operation)
+                    stock.remove_from_cart(item)
+                    changed.discard(item.id)
+                    removed.add(item.id)
+                else:
+                    raise BatchError("op must be one of add, update, remove")
+            except (ValueError, TypeError):
+                raise BatchError("Invalid product_id or item_id", index=index)
+            except stock.OutOfStock as e:
+                raise BatchError(str(e), index=index)
+            except stock.CartItemChanged:
+                raise BatchError("The cart item was changed by another request, please retry",
+                                 index=index, status_code=409)
+            except BatchError as e:
+                e.index = index
+                raise
+    return changed, removed
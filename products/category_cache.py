@@ -0,0 +1,85 @@
+# products/category_cache.py
+"""
+Cached, language-specific category tree.
+
+Categories change only when a superadmin edits them, so the whole tree is
+built from a single query and cached per language under a version number.
+Every category write bumps the version (see signals.py), which orphans the
+cached trees and changes the ETag the category endpoints send.
+
+With a per-process cache (LocMem) a write only bumps the version of the
+worker that handled it. The version itself therefore expires after
+CATEGORY_TREE_CACHE_TIMEOUT: every worker then starts a new one, so its
+trees and ETags (category and product ones) are never staler than that.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .conditional import make_etag
+
+VERSION_KEY = 'products:categories:version'
+TREE_KEY = 'products:categories:{version}:{lang}'
+# Bounds how stale the trees and the version of other workers can get
+TREE_TIMEOUT = getattr(settings, 'CATEGORY_TREE_CACHE_TIMEOUT', 300)
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock so a lost or expired counter never reuses an
+        # old version
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=TREE_TIMEOUT)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        get_version()
+
+
+def invalidate():
+    """Bump the version once the current transaction commits"""
+    transaction.on_commit(bump_version)
+
+
+def get_etag(lang):
+    return make_etag('categories', get_version(), lang)
+
+
+def _build(lang):
+    from .models import Category
+
+    name_field = 'name_ar' if lang == 'ar' else 'name_en'
+    children = {}
+    roots = []
+    for pk, parent_id, name in Category.objects.order_by('id').values_list('id', 'parent_id', name_field):
+        node = {'id': pk, 'name': name}
+        children.setdefault(pk, [])
+        if parent_id is None:
+            roots.append(node)
+        else:
+            children.setdefault(parent_id, []).append(node)
+
+    return {
+        'tree': [{**root, 'children': children[root['id']]} for root in roots],
+        'children': children,
+    }
+
+
+def get_tree(lang):
+    """
+    {'tree': [parent + children, ...], 'children': {category_id: [child, ...]}}
+    for the given language, built once per version
+    """
+    key = TREE_KEY.format(version=get_version(), lang=lang)
+    data = cache.get(key)
+    if data is None:
+        data = _build(lang)
+        cache.set(key, data, TREE_TIMEOUT)
+    return data
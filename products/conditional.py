@@ -0,0 +1,54 @@
+# products/conditional.py
+"""
+ETag helpers for the public catalog endpoints.
+
+A view computes a cheap validator for what it is about to return and calls
+``not_modified()`` first: when the client already holds that version it gets
+an empty 304 and the view skips building the body. ``with_etag()`` stamps the
+full response with the same validator.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+
+def make_etag(*parts):
+    """Strong ETag derived from the given version parts"""
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def _patch_headers(response, etag):
+    response['ETag'] = etag
+    # Same payload for every user; always revalidate, the answer is usually a cheap 304
+    patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    patch_vary_headers(response, ['Accept-Language'])
+    return response
+
+
+def product_stamp(product, images=True, pricing=True):
+    """
+    What a serialized product depends on besides the category names: its own
+    row (updated_at), its images and whichever discounts are running now.
+    Expects images and active_sales to be loaded already (see with_pricing);
+    a sparse fieldset that renders neither passes ``images``/``pricing`` False.
+    """
+    return (
+        product.pk,
+        product.updated_at.isoformat(),
+        tuple((image.pk, image.image.name) for image in product.images.all()) if images else (),
+        tuple((sale.pk, sale.discount_percentage) for sale in product.active_sales) if pricing else (),
+        product.has_active_standalone_discount(),
+    )
+
+
+def not_modified(request, etag):
+    """A 304 response if the request's If-None-Match matches ``etag``, else None"""
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        return None
+    return _patch_headers(response, etag)
+
+
+def with_etag(response, etag):
+    return _patch_headers(response, etag)
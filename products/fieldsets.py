@@ -0,0 +1,130 @@
+# products/fieldsets.py
+"""
+Sparse fieldsets for the product endpoints.
+
+``?fields=id,name,price`` keeps only the listed fields of each product (``id``
+always stays), ``?expand=category,seller`` adds related objects the default
+representation leaves out. Unknown names are a 400.
+
+Serializers built on ``SparseFieldsMixin`` drop the other fields before
+rendering, so their method fields never run, and ``QueryPlan`` loads only the
+relations and prices the remaining fields read. Without the parameters (and
+for serializers used without a fieldset in their context, e.g. cart items)
+nothing changes.
+"""
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+class Fieldset:
+    """What a request asked for: ``fields`` (None for the defaults) and ``expand``"""
+
+    def __init__(self, fields=None, expand=()):
+        self.fields = None if fields is None else frozenset(fields)
+        self.expand = frozenset(expand)
+
+
+def _names(query_params, param):
+    if param not in query_params:
+        return None
+    return {
+        name.strip()
+        for value in query_params.getlist(param)
+        for name in value.split(',') if name.strip()
+    }
+
+
+def from_request(request, serializer_class):
+    """The request's Fieldset for ``serializer_class``, or None when it asked for the defaults"""
+    fields = _names(request.query_params, FIELDS_PARAM)
+    expand = _names(request.query_params, EXPAND_PARAM) or set()
+    if fields is None and not expand:
+        return None
+
+    unknown = (fields or set()) - set(serializer_class.field_names())
+    unknown |= expand - set(serializer_class.expandable_fields)
+    if unknown:
+        raise ValidationError({"error": f"Unknown fields: {', '.join(sorted(unknown))}"})
+    return Fieldset(fields, expand)
+
+
+class SparseFieldsMixin:
+    """
+    ModelSerializer mixin rendering only ``context['fieldset']``.
+
+    ``renamed_fields`` maps an output name to the serializer fields it is
+    built from (``name`` from ``name_ar``/``name_en``), ``expandable_fields``
+    are method fields only added on request. ``select_related_fields``,
+    ``prefetch_related_fields`` and ``priced_fields`` say what each output
+    field reads besides the product row, for QueryPlan.
+    """
+    renamed_fields = {}
+    expandable_fields = ()
+    select_related_fields = {}
+    prefetch_related_fields = {}
+    priced_fields = ()
+
+    @classmethod
+    def field_names(cls):
+        """Output names of the default representation"""
+        sources = {source for names in cls.renamed_fields.values() for source in names}
+        return [name for name in cls.Meta.fields if name not in sources] + list(cls.renamed_fields)
+
+    @classmethod
+    def rendered_fields(cls, fieldset):
+        names = cls.field_names()
+        if fieldset is None:
+            return names
+        if fieldset.fields is not None:
+            names = [name for name in names if name == 'id' or name in fieldset.fields]
+        return names + sorted(fieldset.expand)
+
+    @property
+    def needs_pricing(self):
+        rendered = self.rendered_fields(self.context.get('fieldset'))
+        return any(name in self.priced_fields for name in rendered)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.context.get('fieldset')
+        if fieldset is None:
+            return fields
+
+        if fieldset.fields is not None:
+            keep = set()
+            for name in self.rendered_fields(fieldset):
+                keep.update(self.renamed_fields.get(name, (name,)))
+            fields = {name: field for name, field in fields.items() if name in keep}
+        for name in sorted(fieldset.expand):
+            fields[name] = serializers.SerializerMethodField()
+        return fields
+
+
+class QueryPlan:
+    """The select_related / prefetch_related lookups and pricing a fieldset needs"""
+
+    def __init__(self, serializer_class, fieldset):
+        rendered = serializer_class.rendered_fields(fieldset)
+        self.select = sorted({
+            serializer_class.select_related_fields[name]
+            for name in rendered if name in serializer_class.select_related_fields
+        })
+        self.prefetch = sorted({
+            serializer_class.prefetch_related_fields[name]
+            for name in rendered if name in serializer_class.prefetch_related_fields
+        })
+        self.priced = any(name in serializer_class.priced_fields for name in rendered)
+
+    @property
+    def images(self):
+        return 'images' in self.prefetch
+
+    def apply(self, products):
+        if self.select:
+            products = products.select_related(*self.select)
+        if self.prefetch:
+            products = products.prefetch_related(*self.prefetch)
+        return products
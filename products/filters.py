@@ -0,0 +1,87 @@
+# products/filters.py
+from django.db.models import Q
+from django.utils import timezone
+
+VALID_SORT_FIELDS = ['price', 'created_at', 'rating']
+
+
+def get_sort_params(query_params):
+    """
+    Returns (sort_param, sort_prefix) from ?sort_by= and ?sort_direction=,
+    e.g. ('-created_at', '-') for the default newest-first listing.
+    """
+    sort_by = query_params.get('sort_by', '-created_at')  # Default: newest first
+    sort_direction = query_params.get('sort_direction', 'desc')  # Default: descending
+
+    # Validate sort options
+    if sort_by not in VALID_SORT_FIELDS:
+        sort_by = 'created_at'
+
+    # Validate sort direction
+    sort_direction = sort_direction.lower()
+    if sort_direction not in ['asc', 'desc']:
+        sort_direction = 'desc'
+
+    sort_prefix = '' if sort_direction == 'asc' else '-'
+    return f"{sort_prefix}{sort_by}", sort_prefix
+
+
+def active_standalone_discount_q(now=None):
+    """Products whose standalone discount is running right now"""
+    now = now or timezone.now()
+    return (
+        Q(has_standalone_discount=True) &
+        Q(standalone_discount_percentage__isnull=False) &
+        (
+            Q(standalone_discount_start__isnull=True) |
+            Q(standalone_discount_start__lte=now)
+        ) &
+        (
+            Q(standalone_discount_end__isnull=True) |
+            Q(standalone_discount_end__gte=now)
+        )
+    )
+
+
+def filter_catalog(products, query_params):
+    """
+    Apply the public catalog filters (category, price, rating, stock and
+    discount) to an approved-products queryset. Invalid values are ignored.
+    """
+    category_id = query_params.get('category_id')
+    parent_category_id = query_params.get('parent_category_id')
+
+    # Apply category filters
+    if category_id:
+        products = products.filter(category_id=category_id)
+    elif parent_category_id:
+        products = products.filter(category__parent_id=parent_category_id)
+
+    # Apply price, rating and quantity range filters
+    ranges = [
+        ('min_price', 'price__gte', float),
+        ('max_price', 'price__lte', float),
+        ('min_rating', 'rating__gte', float),
+        ('max_rating', 'rating__lte', float),
+        ('min_quantity', 'quantity__gte', int),
+        ('max_quantity', 'quantity__lte', int),
+    ]
+    for param, lookup, cast in ranges:
+        value = query_params.get(param)
+        if value:
+            try:
+                products = products.filter(**{lookup: cast(value)})
+            except (ValueError, TypeError):
+                pass
+
+    # Apply in-stock filter
+    in_stock = query_params.get('in_stock')
+    if in_stock and in_stock.lower() in ['true', '1', 'yes']:
+        products = products.filter(quantity__gt=0)
+
+    # Apply discount filter
+    has_discount = query_params.get('has_discount')
+    if has_discount and has_discount.lower() in ['true', '1', 'yes']:
+        products = products.filter(active_standalone_discount_q())
+
+    return products
@@ -0,0 +1,129 @@
+import random
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import User
+from products.filters import filter_catalog, get_sort_params
+from products.models import Category, Product
+from Store2.benchmark import benchmark_database, timed
+
+# (name, query params) - the filter/sort combinations ProductListView serves
+SCENARIOS = [
+    ('newest', {}),
+    ('category_newest', {'category_id': '{category}'}),
+    ('parent_category_newest', {'parent_category_id': '{parent}'}),
+    ('price_asc', {'sort_by': 'price', 'sort_direction': 'asc'}),
+    ('price_range_by_price', {'min_price': '20', 'max_price': '80', 'sort_by': 'price', 'sort_direction': 'asc'}),
+    ('category_by_price', {'category_id': '{category}', 'sort_by': 'price'}),
+    ('top_rated', {'sort_by': 'rating'}),
+    ('min_rating', {'min_rating': '4'}),
+    ('in_stock_newest', {'in_stock': 'true'}),
+    ('has_discount', {'has_discount': 'true'}),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a throwaway database with products and prints EXPLAIN QUERY PLAN '
+        'plus timings for every catalog filter/sort combination'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1_000_000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--deep-page', type=int, default=500, help='Page number used for the OFFSET timing')
+        parser.add_argument('--scenario', action='append', help='Only run the named scenario(s)')
+        parser.add_argument(
+            '--db-name',
+            help='Database name (file path for SQLite). Defaults to a temporary file'
+        )
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Keep the seeded database and reuse it on the next run'
+        )
+
+    def handle(self, *args, **options):
+        db_name = options['db_name'] or Path(tempfile.gettempdir()) / 'store2_catalog_benchmark.sqlite3'
+
+        with benchmark_database(db_name, keepdb=options['keepdb']) as connection:
+            self.stdout.write(f'Database: {connection.vendor} ({connection.settings_dict["NAME"]})')
+            self.seed(options['products'], options['batch_size'])
+            self.run_scenarios(options)
+
+    def seed(self, total, batch_size):
+        existing = Product.objects.count()
+        if existing >= total:
+            self.stdout.write(f'Reusing {existing} seeded products')
+            return
+
+        rng = random.Random(42)
+        seller = User.objects.filter(role='seller').first() or User.objects.create_user(
+            email='bench-seller@example.com', username='bench-seller', password='bench',
+            first_name='Bench', last_name='Seller', phone_number='0', role='seller'
+        )
+        children = list(Category.objects.filter(parent__isnull=False))
+        if not children:
+            for p in range(10):
+                parent = Category.objects.create(name_ar=f'قسم {p}', name_en=f'Parent {p}')
+                for c in range(10):
+                    children.append(Category.objects.create(
+                        name_ar=f'فرع {p}-{c}', name_en=f'Child {p}-{c}', parent=parent
+                    ))
+
+        now = timezone.now()
+        created = existing
+        while created < total:
+            batch = []
+            for _ in range(min(batch_size, total - created)):
+                discounted = rng.random() < 0.02
+                batch.append(Product(
+                    seller=seller,
+                    category=rng.choice(children),
+                    name_ar='منتج',
+                    name_en=f'Product {created}',
+                    price=Decimal(rng.randint(100, 100000)) / 100,
+                    rating=None if rng.random() < 0.2 else Decimal(rng.randint(100, 500)) / 100,
+                    quantity=rng.choice([0, 0, 1, 5, 20, 100]),
+                    is_approved=rng.random() < 0.9,
+                    has_standalone_discount=discounted,
+                    standalone_discount_percentage=Decimal(rng.randint(5, 50)) if discounted else None,
+                    standalone_discount_start=now - timedelta(days=rng.randint(0, 5)) if discounted else None,
+                    standalone_discount_end=now + timedelta(days=rng.randint(-2, 5)) if discounted else None,
+                ))
+                created += 1
+            Product.objects.bulk_create(batch, batch_size=batch_size)
+            self.stdout.write(f'\rSeeded {created}/{total}', ending='')
+            self.stdout.flush()
+        self.stdout.write('')
+
+    def run_scenarios(self, options):
+        category = Category.objects.filter(parent__isnull=False).order_by('id').first()
+        placeholders = {'category': str(category.id), 'parent': str(category.parent_id)}
+        page_size, repeat = options['page_size'], options['repeat']
+        offset = (options['deep_page'] - 1) * page_size
+
+        for name, params in SCENARIOS:
+            if options['scenario'] and name not in options['scenario']:
+                continue
+            params = {key: value.format(**placeholders) for key, value in params.items()}
+            sort_param, _ = get_sort_params(params)
+            queryset = filter_catalog(Product.objects.filter(is_approved=True), params).order_by(sort_param)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{name} {params}'))
+            self.stdout.write(queryset[:page_size].explain())
+
+            timings = [
+                ('first page', lambda: list(queryset[:page_size])),
+                ('count', lambda: queryset.count()),
+                (f'page {options["deep_page"]}', lambda: list(queryset[offset:offset + page_size])),
+            ]
+            for label, func in timings:
+                best, median = timed(func, repeat)
+                self.stdout.write(f'  {label:<12} best {best:8.2f} ms   median {median:8.2f} ms')
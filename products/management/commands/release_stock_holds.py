@@ -0,0 +1,24 @@
+# products/management/commands/release_stock_holds.py
+from django.core.management.base import BaseCommand
+
+from products.stock import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Drops abandoned cart items and puts their reserved stock back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            released = release_expired(batch_size=options['batch_size'])
+            total += released
+            if released < options['batch_size']:
+                break
+
+        if total:
+            self.stdout.write(self.style.SUCCESS(f'Released {total} expired cart holds'))
+        else:
+            self.stdout.write("No expired cart holds found")
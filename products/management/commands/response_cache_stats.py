@@ -0,0 +1,25 @@
+# products/management/commands/response_cache_stats.py
+from django.core.management.base import BaseCommand
+
+from Store2 import response_cache
+# The views register their cache scopes on import
+import products.views  # noqa: F401
+
+
+class Command(BaseCommand):
+    help = 'Hits, misses and coalesced waits of the public response cache, per endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them')
+
+    def handle(self, *args, **options):
+        for scope, counts in response_cache.stats().items():
+            served = sum(counts.values())
+            ratio = (counts['hit'] + counts['coalesced']) / served if served else 0
+            self.stdout.write(
+                f"{scope:<20} {counts['hit']:>8} hits {counts['miss']:>8} misses "
+                f"{counts['coalesced']:>6} coalesced   hit ratio {ratio:.1%}"
+            )
+        if options['reset']:
+            response_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
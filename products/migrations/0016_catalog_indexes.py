@@ -0,0 +1,39 @@
+# Generated by Django 5.2.2 on 2026-10-17 22:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0015_product_has_standalone_discount_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['category', '-created_at'], name='product_appr_cat_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['-created_at'], name='product_appr_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['price'], name='product_appr_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['rating'], name='product_appr_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['category', 'price'], name='product_appr_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('has_standalone_discount', True), ('is_approved', True), ('standalone_discount_percentage__isnull', False)), fields=['standalone_discount_start', 'standalone_discount_end'], name='product_active_discount_idx'),
+        ),
+    ]
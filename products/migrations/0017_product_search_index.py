@@ -0,0 +1,75 @@
+import re
+
+from django.db import migrations
+
+# A frozen copy of products/search.py as it was when this migration was
+# written: later edits there must not change what the migration does
+FTS_TABLE = 'products_product_fts'
+FTS_COLUMNS = ('name_ar', 'name_en', 'description_ar', 'description_en')
+
+CREATE_FTS_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"{', '.join(FTS_COLUMNS)}, "
+    "tokenize = 'porter unicode61 remove_diacritics 2')"
+)
+DROP_FTS_SQL = f'DROP TABLE IF EXISTS {FTS_TABLE}'
+INSERT_SQL = (
+    f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) "
+    "VALUES (%s, %s, %s, %s, %s)"
+)
+
+ARABIC_DIACRITICS = re.compile(r'[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+ARABIC_LETTERS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',  # alef forms
+    'ى': 'ي',  # alef maksura -> ya
+    'ة': 'ه',  # ta marbuta -> ha
+})
+
+
+def normalize_text(text):
+    text = ARABIC_DIACRITICS.sub('', text or '')
+    return text.translate(ARABIC_LETTERS).lower()
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_FTS_SQL)
+
+
+def fill_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Product = apps.get_model('products', 'Product')
+    products = Product.objects.using(schema_editor.connection.alias).filter(
+        is_approved=True
+    ).values_list('id', *FTS_COLUMNS)
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        batch = []
+        for pk, *columns in products.iterator(chunk_size=2000):
+            batch.append([pk, *[normalize_text(value) for value in columns]])
+            if len(batch) >= 2000:
+                cursor.executemany(INSERT_SQL, batch)
+                batch = []
+        if batch:
+            cursor.executemany(INSERT_SQL, batch)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(DROP_FTS_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0016_catalog_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(fill_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def hold_existing_cart_items(apps, schema_editor):
+    """
+    Cart items used to hold nothing: take their quantity out of the product
+    stock now, trimming (or dropping) items the shelf can no longer cover.
+    """
+    CartItem = apps.get_model('products', 'CartItem')
+    Product = apps.get_model('products', 'Product')
+    expiry = django.utils.timezone.now() + timedelta(minutes=30)
+
+    for item in CartItem.objects.order_by('added_at').iterator():
+        stock = Product.objects.filter(id=item.product_id).values_list('quantity', flat=True).first() or 0
+        held = min(item.quantity, stock)
+        if not held:
+            item.delete()
+            continue
+        Product.objects.filter(id=item.product_id).update(quantity=F('quantity') - held)
+        CartItem.objects.filter(id=item.id).update(quantity=held, reserved_until=expiry)
+
+
+def release_cart_items(apps, schema_editor):
+    CartItem = apps.get_model('products', 'CartItem')
+    Product = apps.get_model('products', 'Product')
+    for product_id, quantity in CartItem.objects.values_list('product_id', 'quantity').iterator():
+        Product.objects.filter(id=product_id).update(quantity=F('quantity') + quantity)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0017_product_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cartitem",
+            name="reserved_until",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name="cartitem",
+            index=models.Index(fields=["reserved_until"], name="cartitem_reserved_until_idx"),
+        ),
+        migrations.RunPython(hold_existing_cart_items, release_cart_items),
+    ]
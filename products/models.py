@@ -4,11 +4,14 @@ from django.db import models
 from accounts.models import EmailVerification, Purpose, User, Role
 from django.conf import settings
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.db.models import Sum, F  # Add these imports at the top
 from django.core.exceptions import ValidationError
 from django.db.models import Q
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from .tracking import TrackedFieldsMixin
+
 class status(models.TextChoices):
     PENDING = 'pending'
     APPROVED = 'approved'
@@ -37,7 +40,7 @@ class Category(models.Model):
     def is_child(self):
         return self.parent is not None
 
-class Product(models.Model):
+class Product(TrackedFieldsMixin, models.Model):
     seller = models.ForeignKey(User, on_delete=models.CASCADE)
     category = models.ForeignKey(
         Category, 
@@ -94,16 +97,69 @@ class Product(models.Model):
     )
     standalone_discount_start = models.DateTimeField(null=True, blank=True)
     standalone_discount_end = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # Access paths of the public catalog (ProductListView,
+        # CategoryProductsView): always approved, optionally one category,
+        # sorted by created_at / price / rating.
+        # Partial on is_approved: boolean filters compile to a bare
+        # ``WHERE is_approved`` which can only be matched by an index predicate
+        indexes = [
+            models.Index(
+                fields=['category', '-created_at'],
+                condition=Q(is_approved=True),
+                name='product_appr_cat_created_idx'
+            ),
+            models.Index(
+                fields=['-created_at'],
+                condition=Q(is_approved=True),
+                name='product_appr_created_idx'
+            ),
+            models.Index(
+                fields=['price'],
+                condition=Q(is_approved=True),
+                name='product_appr_price_idx'
+            ),
+            models.Index(
+                fields=['rating'],
+                condition=Q(is_approved=True),
+                name='product_appr_rating_idx'
+            ),
+            models.Index(
+                fields=['category', 'price'],
+                condition=Q(is_approved=True),
+                name='product_appr_cat_price_idx'
+            ),
+            # Only the few products with a standalone discount, for ?has_discount=
+            models.Index(
+                fields=['standalone_discount_start', 'standalone_discount_end'],
+                condition=Q(
+                    is_approved=True,
+                    has_standalone_discount=True,
+                    standalone_discount_percentage__isnull=False
+                ),
+                name='product_active_discount_idx'
+            ),
+        ]
     
+    @cached_property
+    def active_sales(self):
+        """
+        ProductSale rows running right now, newest first.
+        List endpoints fill this in bulk through ``products.pricing.with_pricing``.
+        """
+        now = timezone.now()
+        return list(self.sales.filter(
+            sale_event__start_date__lte=now,
+            sale_event__end_date__gte=now
+        ))
+
     @property
     def current_price(self):
         """Returns either discounted price or regular price"""
-        now = timezone.now()
-        if (self.has_standalone_discount and 
-            self.standalone_discount_percentage and
-            (not self.standalone_discount_start or self.standalone_discount_start <= now) and
-            (not self.standalone_discount_end or now <= self.standalone_discount_end)):
-            return self.price * (100 - self.standalone_discount_percentage) / 100
+        discount = self.active_discount_percentage
+        if discount:
+            return self.price * (100 - discount) / 100
         return self.price
   
     def has_active_standalone_discount(self):
@@ -122,71 +178,27 @@ class Product(models.Model):
     @property
     def has_active_discount(self):
         """Check if product has any active discount (standalone or sale)"""
-        now = timezone.now()
-        
-        # Check standalone discount
-        if self.has_standalone_discount and self.standalone_discount_percentage:
-            start_ok = (self.standalone_discount_start is None) or (self.standalone_discount_start <= now)
-            end_ok = (self.standalone_discount_end is None) or (now <= self.standalone_discount_end)
-            if start_ok and end_ok:
-                return True
-        
-        # Check sale discounts
-        active_sales = self.sales.filter(
-            sale_event__start_date__lte=now,
-            sale_event__end_date__gte=now
-        ).exists()
-        
-        return active_sales
+        return self.has_active_standalone_discount() or bool(self.active_sales)
 
     @property
     def active_discount_percentage(self):
         """Get the current active discount percentage"""
-        if not self.has_active_discount:
-            return None
-            
-        now = timezone.now()
-        
-        # Check standalone discount first
-        if self.has_standalone_discount and self.standalone_discount_percentage:
-            start_ok = (self.standalone_discount_start is None) or (self.standalone_discount_start <= now)
-            end_ok = (self.standalone_discount_end is None) or (now <= self.standalone_discount_end)
-            if start_ok and end_ok:
-                return self.standalone_discount_percentage
-        
-        # Check sale discounts
-        active_sale = self.sales.filter(
-            sale_event__start_date__lte=now,
-            sale_event__end_date__gte=now
-        ).first()
-        
-        return active_sale.discount_percentage if active_sale else None
+        # Standalone discount wins over sale discounts
+        if self.has_active_standalone_discount():
+            return self.standalone_discount_percentage
+
+        active_sales = self.active_sales
+        return active_sales[0].discount_percentage if active_sales else None
 
     def get_dirty_fields(self):
         """Track which fields have changed"""
         if not self.pk:
             return {}
-        
-        current_state = type(self).objects.get(pk=self.pk)
-        dirty_fields = {}
-        
-        for field in self._meta.fields:
-            current_value = getattr(current_state, field.name)
-            new_value = getattr(self, field.name)
-            if current_value != new_value:
-                dirty_fields[field.name] = new_value
-        
-        return dirty_fields
 
-    def save(self, *args, **kwargs):
-            # Track approval changes
-            if self.pk:  # Only for existing products
-                old = Product.objects.get(pk=self.pk)
-                if not old.is_approved and self.is_approved:
-                    # Approval happened
-                    super().save(*args, **kwargs)
-                    return
-            super().save(*args, **kwargs)
+        changed = self.get_changed_fields()
+        if changed is None:
+            changed = {field.name for field in self._meta.fields}
+        return {name: getattr(self, name) for name in changed}
     
 class ProductEditRequest(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -347,6 +359,8 @@ class Cart(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Bumped by every item change (products.stock), lets clients sync deltas
+    version = models.PositiveIntegerField(default=0)
 
     @property
     def total_items(self):
@@ -371,15 +385,14 @@ class CartItem(models.Model):
     )
     quantity = models.PositiveIntegerField(default=1)
     added_at = models.DateTimeField(auto_now_add=True)
+    # The quantity is taken out of product.quantity until then (products.stock)
+    reserved_until = models.DateTimeField()
 
     class Meta:
         unique_together = ('cart', 'product')  # Prevent duplicate items
-
-    def clean(self):
-        if self.quantity > self.product.quantity:
-            raise ValidationError(
-                f"Only {self.product.quantity} available in stock"
-            )
+        indexes = [
+            models.Index(fields=['reserved_until'], name='cartitem_reserved_until_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         self.full_clean()  # Validate before saving
@@ -0,0 +1,174 @@
+# products/pagination.py
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on (sort field, id).
+
+    Every page is a range scan that starts right after the last row of the
+    previous page, so there is no COUNT(*) and no OFFSET no matter how deep
+    the client goes. Cursors are opaque base64 tokens carrying the boundary
+    row's sort value and id plus the paging direction.
+
+    NULL sort values (e.g. products without a rating) always come last.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def __init__(self, ordering=('-created_at', '-id')):
+        # (sort field, tiebreaker) - the tiebreaker must be unique
+        self.ordering = tuple(ordering)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+            if size > 0:
+                return min(size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        field, tiebreaker = self.ordering
+        self.field, self.tiebreaker = field.lstrip('-'), tiebreaker.lstrip('-')
+        self.descending = field.startswith('-')
+        self.nullable = queryset.model._meta.get_field(self.field).null
+        if position is not None:
+            position = self.convert_position(position, queryset.model)
+
+        queryset = queryset.order_by(*self._order_by(reverse))
+        if position is not None:
+            queryset = queryset.filter(self._after(position, reverse))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # Moving backwards: the page we came from is always after this one
+        self.has_next = (position is not None) if reverse else has_more
+        self.has_previous = has_more if reverse else (position is not None)
+        self.rows = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
+
+    def get_next_link(self):
+        if not self.rows or not self.has_next:
+            return None
+        return self.encode_cursor(self._position(self.rows[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.rows or not self.has_previous:
+            return None
+        return self.encode_cursor(self._position(self.rows[0]), reverse=True)
+
+    # Cursor encoding
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        token = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            value, row_id = payload['p']
+            return (value, row_id), bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def convert_position(self, position, model):
+        """The cursor's values as the ordering fields' types; a 404 for anything else"""
+        value, row_id = position
+        try:
+            if value is not None:
+                value = model._meta.get_field(self.field).to_python(value)
+            row_id = model._meta.get_field(self.tiebreaker).to_python(row_id)
+            if row_id is None:
+                raise ValidationError('Missing id')
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return value, row_id
+
+    def _position(self, row):
+        value = getattr(row, self.field)
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        elif value is not None:
+            value = str(value)
+        return [value, getattr(row, self.tiebreaker)]
+
+    # Query building
+
+    def _order_by(self, reverse):
+        descending = self.descending != reverse
+        sort = F(self.field).desc if descending else F(self.field).asc
+        # NULLs sit at the end of the forward ordering
+        nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+        tiebreak = f'-{self.tiebreaker}' if descending else self.tiebreaker
+        return sort(**nulls), tiebreak
+
+    def _after(self, position, reverse):
+        """Rows that come after ``position`` in the (possibly reversed) ordering"""
+        value, row_id = position
+        op = 'lt' if self.descending != reverse else 'gt'
+        field, tiebreaker = self.field, self.tiebreaker
+        later_id = Q(**{f'{tiebreaker}__{op}': row_id})
+
+        if value is None:
+            # The boundary row is in the NULL block
+            in_nulls = Q(**{f'{field}__isnull': True}) & later_id
+            return in_nulls if not reverse else in_nulls | Q(**{f'{field}__isnull': False})
+
+        condition = Q(**{f'{field}__{op}': value}) | (Q(**{field: value}) & later_id)
+        if self.nullable and not reverse:
+            condition |= Q(**{f'{field}__isnull': True})
+        return condition
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Opaque pagination cursor (empty for the first page)',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page',
+                'schema': {'type': 'integer'},
+            },
+        ]
@@ -0,0 +1,48 @@
+# products/pricing.py
+from django.db.models import Prefetch, QuerySet, prefetch_related_objects
+from django.utils import timezone
+
+from .models import ProductSale
+
+
+def active_sales_prefetch(through='', now=None):
+    """
+    Prefetch that loads the sales running right now into ``Product.active_sales``.
+
+    ``through`` is the relation path from the objects being loaded to the product
+    ('' for products, 'product' for cart/wishlist items, 'items__product' for carts).
+    """
+    now = now or timezone.now()
+    lookup = f'{through}__sales' if through else 'sales'
+    return Prefetch(
+        lookup,
+        queryset=ProductSale.objects.filter(
+            sale_event__start_date__lte=now,
+            sale_event__end_date__gte=now
+        ),
+        to_attr='active_sales'
+    )
+
+
+def with_pricing(objects, through='', now=None):
+    """
+    Resolve active discounts for many products at once.
+
+    Querysets get the prefetch attached (it runs together with the queryset),
+    lists/instances are prefetched immediately in a single query. Products that
+    already resolved their sales are skipped, so calling this twice is free.
+    """
+    prefetch = active_sales_prefetch(through, now)
+
+    # An evaluated queryset (e.g. prefetched items) would be fetched again by
+    # prefetch_related(): resolve its rows in place instead
+    if isinstance(objects, QuerySet) and objects._result_cache is None:
+        for lookup in objects._prefetch_related_lookups:
+            if getattr(lookup, 'prefetch_to', None) == prefetch.prefetch_to:
+                return objects
+        return objects.prefetch_related(prefetch)
+
+    objects = list(objects)
+    if objects:
+        prefetch_related_objects(objects, prefetch)
+    return objects
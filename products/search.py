@@ -0,0 +1,162 @@
+# products/search.py
+"""
+Full-text product search backed by an SQLite FTS5 shadow table.
+
+Only approved products are indexed. Text is normalized before it is indexed
+and before it is queried (Arabic diacritics stripped, letter variants
+unified), and the porter tokenizer stems English words, so
+"phones" finds "Phone" and "هاتِف" finds "هاتف".
+
+The index table lives in the products' own database and the signal
+receivers write it on the connection of the save, inside an atomic block:
+within the writer's transaction it commits or rolls back with the row.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+
+FTS_TABLE = 'products_product_fts'
+FTS_COLUMNS = ('name_ar', 'name_en', 'description_ar', 'description_en')
+# bm25 column weights: a hit in the name counts ten times a description hit
+FTS_WEIGHTS = (10.0, 10.0, 1.0, 1.0)
+
+CREATE_FTS_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"{', '.join(FTS_COLUMNS)}, "
+    "tokenize = 'porter unicode61 remove_diacritics 2')"
+)
+DROP_FTS_SQL = f'DROP TABLE IF EXISTS {FTS_TABLE}'
+
+# Tashkeel (harakat, tanween, shadda, sukun, superscript alef) and tatweel
+ARABIC_DIACRITICS = re.compile(r'[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+ARABIC_LETTERS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',  # alef forms
+    'ى': 'ي',  # alef maksura -> ya
+    'ة': 'ه',  # ta marbuta -> ha
+})
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize_text(text):
+    """Lowercase and fold Arabic spelling variants so they index identically"""
+    text = ARABIC_DIACRITICS.sub('', text or '')
+    return text.translate(ARABIC_LETTERS).lower()
+
+
+def search_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(query):
+    """
+    Turn user input into an FTS5 MATCH expression: every word must match,
+    the last one as a prefix so results show up while the user is typing.
+    """
+    words = WORD_RE.findall(normalize_text(query))
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _row(product):
+    return [normalize_text(getattr(product, column)) for column in FTS_COLUMNS]
+
+
+def index_product(product, using=DEFAULT_DB_ALIAS):
+    """Insert/refresh one product, or drop it when it is not approved"""
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.pk])
+        if product.is_approved:
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                [product.pk, *_row(product)]
+            )
+
+
+def remove_product(product_id, using=DEFAULT_DB_ALIAS):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+
+def rebuild_index(queryset=None, batch_size=2000):
+    """Re-create the whole index from the approved products, returns the row count"""
+    if queryset is None:
+        from .models import Product
+        queryset = Product.objects.filter(is_approved=True)
+
+    products = queryset.only('id', *FTS_COLUMNS)
+    insert_sql = (
+        f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) "
+        "VALUES (%s, %s, %s, %s, %s)"
+    )
+    total = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        batch = []
+        for product in products.iterator(chunk_size=batch_size):
+            batch.append([product.pk, *_row(product)])
+            if len(batch) >= batch_size:
+                cursor.executemany(insert_sql, batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(insert_sql, batch)
+            total += len(batch)
+        # Merge the b-tree segments written by the bulk load
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('optimize')")
+    return total
+
+
+class SearchResults:
+    """
+    Lazily evaluated, BM25-ranked search results.
+
+    Behaves enough like a queryset (count() and slicing) for Django's
+    Paginator: each page runs one ranked FTS query for its ids and one query
+    on ``queryset`` for the products themselves.
+    """
+
+    def __init__(self, query, queryset):
+        self.match = build_match_query(query)
+        self.queryset = queryset
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            if self.match is None:
+                self._count = 0
+            else:
+                with connections[self.queryset.db].cursor() as cursor:
+                    cursor.execute(
+                        f'SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                        [self.match]
+                    )
+                    self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        if self.match is None:
+            return []
+
+        offset = key.start or 0
+        limit = (key.stop - offset) if key.stop is not None else -1
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        # Same database as the products (a replica for catalog reads)
+        with connections[self.queryset.db].cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s OFFSET %s',
+                [self.match, limit, offset]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+
+        products = self.queryset.in_bulk(ids)
+        return [products[pk] for pk in ids if pk in products]
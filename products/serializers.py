@@ -3,9 +3,27 @@ from rest_framework import serializers
 from .models import Category,Wishlist,WishlistItem,SaleEvent,ProductSale
 from .models import Product, ProductImage,Cart,CartItem
 from rest_framework import serializers
+from django.db.models.manager import BaseManager
 from django.utils import timezone
+from .cart import cart_totals, prefetch_cart
+from .fieldsets import SparseFieldsMixin
+from .pricing import with_pricing
 
-class ProductLanguageSerializer(serializers.ModelSerializer):
+class PricedListSerializer(serializers.ListSerializer):
+    """
+    Resolves active discounts for the whole list in one query before the rows
+    are rendered, instead of one sales query per product.
+    """
+    def to_representation(self, data):
+        if isinstance(data, BaseManager):
+            data = data.all()
+        if not getattr(self.child, 'needs_pricing', True):
+            # A sparse fieldset without any price field
+            return super().to_representation(data)
+        through = getattr(self.child, 'pricing_through', '')
+        return super().to_representation(with_pricing(data, through))
+
+class ProductLanguageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category_name = serializers.SerializerMethodField()
     parent_category_name = serializers.SerializerMethodField()
     images = serializers.SerializerMethodField()
@@ -13,6 +31,21 @@ class ProductLanguageSerializer(serializers.ModelSerializer):
     has_active_discount = serializers.SerializerMethodField()
     discount_percentage = serializers.SerializerMethodField()
 
+    # Sparse fieldsets (?fields= / ?expand=, see fieldsets.py)
+    renamed_fields = {
+        'name': ('name_ar', 'name_en'),
+        'description': ('description_ar', 'description_en'),
+    }
+    expandable_fields = ('category', 'seller')
+    select_related_fields = {
+        'category_name': 'category',
+        'parent_category_name': 'category__parent',
+        'category': 'category__parent',
+        'seller': 'seller',
+    }
+    prefetch_related_fields = {'images': 'images'}
+    priced_fields = ('current_price', 'has_active_discount', 'discount_percentage')
+
     class Meta:
         model = Product
         fields = [
@@ -22,6 +55,7 @@ class ProductLanguageSerializer(serializers.ModelSerializer):
             'disapproval_reason_ar', 'disapproval_reason_en', 'quantity',
             'has_active_discount', 'discount_percentage',"seller_id"
         ]
+        list_serializer_class = PricedListSerializer
 
     def get_category_name(self, obj):
         lang = self.context.get('lang', 'ar')
@@ -39,69 +73,85 @@ class ProductLanguageSerializer(serializers.ModelSerializer):
             return [request.build_absolute_uri(img.image.url) for img in obj.images.all()]
         return [img.image.url for img in obj.images.all()]
 
-    def to_representation(self, instance):
-        data = super().to_representation(instance)
-        lang = self.context.get('lang', 'ar')
-        
-        # Handle language-specific fields
-        if lang == 'en':
-            data['name'] = data.pop('name_en')
-            data['description'] = data.pop('description_en')
-            data.pop('name_ar', None)
-            data.pop('description_ar', None)
-        else:
-            data['name'] = data.pop('name_ar')
-            data['description'] = data.pop('description_ar')
-            data.pop('name_en', None)
-            data.pop('description_en', None)
-        
-        # Clean up empty disapproval reasons
-        if not data.get('disapproval_reason_ar'):
-            data.pop('disapproval_reason_ar', None)
-        if not data.get('disapproval_reason_en'):
-            data.pop('disapproval_reason_en', None)
-
     def get_current_price(self, obj):
         return obj.current_price
 
     def get_has_active_discount(self, obj):
-        now = timezone.now()
-        return (obj.has_standalone_discount and 
-                (not obj.standalone_discount_start or obj.standalone_discount_start <= now) and
-                (not obj.standalone_discount_end or now <= obj.standalone_discount_end))
+        return obj.has_active_discount
 
     def get_discount_percentage(self, obj):
-        if self.get_has_active_discount(obj):
-            return obj.standalone_discount_percentage
-        return None
+        return obj.active_discount_percentage
+
+    def get_category(self, obj):
+        # ?expand=category
+        lang = self.context.get('lang', 'ar')
+        parent = obj.category.parent
+        return {
+            'id': obj.category.id,
+            'name': obj.category.name_ar if lang == 'ar' else obj.category.name_en,
+            'parent': {
+                'id': parent.id,
+                'name': parent.name_ar if lang == 'ar' else parent.name_en,
+            } if parent else None,
+        }
+
+    def get_seller(self, obj):
+        # ?expand=seller
+        return {
+            'id': obj.seller.id,
+            'name': f'{obj.seller.first_name} {obj.seller.last_name}',
+        }
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        lang = self.context.get('lang', 'ar')
+        lang, other = ('en', 'ar') if self.context.get('lang') == 'en' else ('ar', 'en')
         
-        # Handle language-specific fields
-        if lang == 'en':
-            data['name'] = data.pop('name_en')
-            data['description'] = data.pop('description_en')
-            data.pop('name_ar', None)
-            data.pop('description_ar', None)
-        else:
-            data['name'] = data.pop('name_ar')
-            data['description'] = data.pop('description_ar')
-            data.pop('name_en', None)
-            data.pop('description_en', None)
+        # Handle language-specific fields (absent when not requested)
+        for name in ('name', 'description'):
+            if f'{name}_{lang}' in data:
+                data[name] = data.pop(f'{name}_{lang}')
+                data.pop(f'{name}_{other}', None)
         
         # Clean up empty fields
         for field in ['disapproval_reason_ar', 'disapproval_reason_en']:
-            if not data.get(field):
-                data.pop(field, None)
+            if field in data and not data[field]:
+                data.pop(field)
         
         # Only show discount percentage if there's an active discount
-        if not data.get('has_active_discount'):
-            data.pop('discount_percentage', None)
+        if 'discount_percentage' in data and not instance.has_active_discount:
+            data.pop('discount_percentage')
             
         return data
 
+class ProductCardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """What a product grid shows (?view=card): no category, description or image list"""
+    name = serializers.SerializerMethodField()
+    current_price = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
+
+    prefetch_related_fields = {'thumbnail': 'images'}
+    priced_fields = ('current_price',)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'price', 'current_price', 'thumbnail']
+        list_serializer_class = PricedListSerializer
+
+    def get_name(self, obj):
+        return obj.name_en if self.context.get('lang', 'ar') == 'en' else obj.name_ar
+
+    def get_current_price(self, obj):
+        return obj.current_price
+
+    def get_thumbnail(self, obj):
+        # The first uploaded image, from the prefetched list
+        images = list(obj.images.all())
+        if not images:
+            return None
+        url = min(images, key=lambda image: image.pk).image.url
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
 class CategorySerializer(serializers.ModelSerializer):
     children = serializers.SerializerMethodField()
     
@@ -136,15 +186,13 @@ class ProductSerializer(serializers.ModelSerializer):
             'standalone_discount_percentage', 'standalone_discount_start',
             'standalone_discount_end', 'quantity'
         ]
+        list_serializer_class = PricedListSerializer
     
     def get_current_price(self, obj):
         return obj.current_price
     
     def get_has_active_discount(self, obj):
-        now = timezone.now()
-        return (obj.has_standalone_discount and 
-                (not obj.standalone_discount_start or obj.standalone_discount_start <= now) and
-                (not obj.standalone_discount_end or now <= obj.standalone_discount_end))
+        return obj.has_active_discount
 
     def get_category_name(self, obj):
         lang = self.context.get('lang', 'ar')
@@ -154,53 +202,85 @@ class CartItemSerializer(serializers.ModelSerializer):
     product = ProductLanguageSerializer()
     max_available = serializers.SerializerMethodField()
     current_price = serializers.SerializerMethodField()
+    pricing_through = 'product'
 
     class Meta:
         model = CartItem
         fields = [
-            'id', 'product', 'quantity', 'added_at', 
+            'id', 'product', 'quantity', 'added_at', 'reserved_until',
             'max_available', 'current_price'
         ]
         read_only_fields = fields
+        list_serializer_class = PricedListSerializer
 
     def get_max_available(self, obj):
-        return obj.product.quantity
+        # What is left on the shelf plus what this item already holds
+        return obj.product.quantity + obj.quantity
         
     def get_current_price(self, obj):
         return obj.product.current_price
     
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True)
-    total_items = serializers.IntegerField(read_only=True)
+    total_items = serializers.IntegerField(source='totals.items', read_only=True)
     total_price = serializers.DecimalField(
+        source='totals.price',
+        max_digits=10,
+        decimal_places=2,
+        read_only=True
+    )
+    total_discount = serializers.DecimalField(
+        source='totals.discount',
+        max_digits=10,
+        decimal_places=2,
+        read_only=True
+    )
+    total_after_discount = serializers.DecimalField(
+        source='totals.due',
         max_digits=10,
         decimal_places=2,
         read_only=True
     )
-    total_discount = serializers.SerializerMethodField()
 
     class Meta:
         model = Cart
-        fields = ['id', 'items', 'total_items', 'total_price', 'total_discount']
-        
-    def get_total_discount(self, obj):
-        total = 0
-        for item in obj.items.all():
-            if item.product.has_active_discount:
-                discount_amount = item.product.price - item.product.current_price
-                total += discount_amount * item.quantity
-        return total
+        fields = ['id', 'version', 'items', 'total_items', 'total_price', 'total_discount', 'total_after_discount']
+
+    def to_representation(self, instance):
+        # Items with their product, categories, images and active sales are
+        # loaded once; the totals come from the same rows
+        prefetch_cart(instance)
+        instance.totals = cart_totals(instance.items.all())
+        return super().to_representation(instance)
+
+class CartDeltaSerializer(serializers.Serializer):
+    """Renders products.cart.cart_delta(): the changed items and new totals only"""
+    version = serializers.IntegerField(read_only=True)
+    items = CartItemSerializer(many=True, read_only=True)
+    removed = serializers.ListField(child=serializers.IntegerField(), read_only=True)
+    total_items = serializers.IntegerField(source='totals.items', read_only=True)
+    total_price = serializers.DecimalField(
+        source='totals.price', max_digits=10, decimal_places=2, read_only=True
+    )
+    total_discount = serializers.DecimalField(
+        source='totals.discount', max_digits=10, decimal_places=2, read_only=True
+    )
+    total_after_discount = serializers.DecimalField(
+        source='totals.due', max_digits=10, decimal_places=2, read_only=True
+    )
 
 class WishlistItemSerializer(serializers.ModelSerializer):
     product = serializers.SerializerMethodField()
     has_discount = serializers.SerializerMethodField()
     discount_percentage = serializers.SerializerMethodField()
     current_price = serializers.SerializerMethodField()
+    pricing_through = 'product'
 
     class Meta:
         model = WishlistItem
         fields = ['id', 'product', 'added_at', 'has_discount', 'discount_percentage', 'current_price']
         read_only_fields = fields
+        list_serializer_class = PricedListSerializer
 
     def get_product(self, obj):
         # Use ProductLanguageSerializer for product details
@@ -216,10 +296,7 @@ class WishlistItemSerializer(serializers.ModelSerializer):
         return obj.product.active_discount_percentage
 
     def get_current_price(self, obj):
-        if obj.product.has_active_discount:
-            discount = obj.product.active_discount_percentage or 0
-            return obj.product.price * (100 - discount) / 100
-        return obj.product.price
+        return obj.product.current_price
 
 class WishlistSerializer(serializers.ModelSerializer):
     items = WishlistItemSerializer(many=True)
@@ -241,6 +318,7 @@ class ProductSaleSerializer(serializers.ModelSerializer):
     product = ProductLanguageSerializer(read_only=True)
     sale_event = SaleEventSerializer(read_only=True)
     discounted_price = serializers.SerializerMethodField()
+    pricing_through = 'product'
     
     class Meta:
         model = ProductSale
@@ -248,6 +326,7 @@ class ProductSaleSerializer(serializers.ModelSerializer):
             'id', 'product', 'sale_event', 'discount_percentage',
             'discounted_price', 'is_active'
         ]
+        list_serializer_class = PricedListSerializer
     
     def get_discounted_price(self, obj):
         return obj.product.price * (100 - obj.discount_percentage) / 100
@@ -0,0 +1,77 @@
+# products/signals.py
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from Store2 import response_cache
+from . import category_cache, search
+from .models import Category, Product, ProductImage, ProductSale, SaleEvent
+from .suggest import index as suggestion_index
+from .tracking import on_change
+
+
+@receiver(post_save, sender=Product)
+@on_change('is_approved', *search.FTS_COLUMNS)
+def sync_product_search_index(sender, instance, using, **kwargs):
+    # Same connection, so the same transaction, as the save
+    if search.search_enabled():
+        search.index_product(instance, using=using)
+
+    # Rolled back writes never reach the suggestions
+    if instance.is_approved:
+        transaction.on_commit(partial(
+            suggestion_index.add, 'product', instance.pk, instance.name_ar, instance.name_en
+        ))
+    else:
+        transaction.on_commit(partial(suggestion_index.remove, 'product', instance.pk))
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_search_index(sender, instance, using, **kwargs):
+    if search.search_enabled():
+        search.remove_product(instance.pk, using=using)
+    transaction.on_commit(partial(suggestion_index.remove, 'product', instance.pk))
+
+
+def invalidate_responses(*tags):
+    """Orphan the cached public responses built from these tags once the write commits"""
+    transaction.on_commit(lambda: response_cache.invalidate(*tags))
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_responses(sender, instance, **kwargs):
+    invalidate_responses('products', f'product:{instance.pk}')
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def invalidate_product_image_responses(sender, instance, **kwargs):
+    invalidate_responses('products', f'product:{instance.product_id}')
+
+
+@receiver([post_save, post_delete], sender=ProductSale)
+def invalidate_product_sale_responses(sender, instance, **kwargs):
+    invalidate_responses('products', f'product:{instance.product_id}', 'sales')
+
+
+@receiver([post_save, post_delete], sender=SaleEvent)
+def invalidate_sale_event_responses(sender, instance, **kwargs):
+    # The event's dates decide the prices of every product in it
+    invalidate_responses('sales', 'products')
+
+
+@receiver(post_save, sender=Category)
+def sync_category_caches(sender, instance, **kwargs):
+    category_cache.invalidate()
+    invalidate_responses('categories')
+    transaction.on_commit(partial(
+        suggestion_index.add, 'category', instance.pk, instance.name_ar, instance.name_en
+    ))
+
+
+@receiver(post_delete, sender=Category)
+def drop_category_caches(sender, instance, **kwargs):
+    category_cache.invalidate()
+    invalidate_responses('categories')
+    transaction.on_commit(partial(suggestion_index.remove, 'category', instance.pk))
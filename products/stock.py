@@ -0,0 +1,169 @@
+# products/stock.py
+"""
+Stock reservations for carts.
+
+``Product.quantity`` is the stock that is still free to sell. Putting an item
+in a cart takes its quantity out of it with one conditional UPDATE
+(``... SET quantity = quantity - n WHERE quantity >= n``), so two buyers can
+never both get the last unit: the database decides, not a Python check.
+
+Every cart item holds its quantity until ``reserved_until``; adding to or
+changing the item renews the hold. ``release_expired()`` (Celery beat task
+and the ``release_stock_holds`` command) drops abandoned cart items and puts
+their quantity back on the shelf.
+
+Cart item rows are changed compare-and-swap style (``WHERE quantity = old``)
+inside the same transaction as the stock move, so a concurrent change to the
+same item retries instead of leaking or double-releasing stock.
+
+These UPDATEs send no ``post_save``, so every stock move orphans the cached
+responses of its product itself, on commit (Store2/response_cache.py).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Cart, CartItem, Product
+from .signals import invalidate_responses
+
+HOLD_MINUTES = getattr(settings, 'CART_RESERVATION_MINUTES', 30)
+# Attempts for a compare-and-swap on a cart item before giving up
+MAX_RETRIES = 5
+
+
+class OutOfStock(Exception):
+    def __init__(self, available):
+        self.available = available
+        super().__init__(f"Only {available} available in stock")
+
+
+class CartItemChanged(Exception):
+    """The item kept changing under us (or is gone); the client should reload the cart"""
+
+
+def hold_expiry(now=None):
+    return (now or timezone.now()) + timedelta(minutes=HOLD_MINUTES)
+
+
+def stock_changed(product_id):
+    invalidate_responses('products', f'product:{product_id}')
+
+
+def reserve(product_id, quantity):
+    """Take ``quantity`` units off the shelf, False if there aren't enough"""
+    # updated_at moves with quantity: the product ETags are stamped with it
+    reserved = Product.objects.filter(
+        id=product_id, quantity__gte=quantity
+    ).update(quantity=F('quantity') - quantity, updated_at=timezone.now()) == 1
+    if reserved:
+        stock_changed(product_id)
+    return reserved
+
+
+def release(product_id, quantity):
+    if quantity > 0:
+        Product.objects.filter(id=product_id).update(
+            quantity=F('quantity') + quantity, updated_at=timezone.now()
+        )
+        stock_changed(product_id)
+
+
+def available(product_id):
+    return Product.objects.filter(id=product_id).values_list('quantity', flat=True).first() or 0
+
+
+def touch_cart(cart_id):
+    """Every change to a cart's items moves its version, clients sync on it"""
+    Cart.objects.filter(id=cart_id).update(version=F('version') + 1, updated_at=timezone.now())
+
+
+def restock(product, quantity):
+    """Seller adds stock: an increment in the database, never read-modify-write"""
+    Product.objects.filter(id=product.id).update(
+        quantity=F('quantity') + quantity, updated_at=timezone.now()
+    )
+    stock_changed(product.id)
+    product.refresh_from_db(fields=['quantity', 'updated_at'])
+    return product
+
+
+def add_to_cart(cart, product, quantity):
+    """Reserve ``quantity`` more of ``product`` in ``cart``, returns the cart item"""
+    with transaction.atomic():
+        if not reserve(product.id, quantity):
+            raise OutOfStock(available(product.id))
+
+        expiry = hold_expiry()
+        item, created = CartItem.objects.get_or_create(
+            cart=cart, product=product,
+            defaults={'quantity': quantity, 'reserved_until': expiry}
+        )
+        if not created:
+            CartItem.objects.filter(id=item.id).update(
+                quantity=F('quantity') + quantity, reserved_until=expiry
+            )
+            item.refresh_from_db(fields=['quantity', 'reserved_until'])
+        touch_cart(cart.id)
+    return item
+
+
+def set_quantity(item, quantity):
+    """Change the held quantity of ``item`` to ``quantity`` (0 removes it)"""
+    for attempt in range(MAX_RETRIES):
+        if attempt:
+            item = CartItem.objects.filter(id=item.id).first()
+            if item is None:
+                raise CartItemChanged()
+
+        delta = quantity - item.quantity
+        with transaction.atomic():
+            if delta > 0 and not reserve(item.product_id, delta):
+                raise OutOfStock(available(item.product_id) + item.quantity)
+
+            current = CartItem.objects.filter(id=item.id, quantity=item.quantity)
+            if quantity:
+                expiry = hold_expiry()
+                swapped = current.update(quantity=quantity, reserved_until=expiry)
+            else:
+                swapped, _ = current.delete()
+            if not swapped:
+                # Someone else changed the item first: undo our stock move and retry
+                transaction.set_rollback(True)
+                continue
+
+            release(item.product_id, -delta)
+            touch_cart(item.cart_id)
+
+        if quantity:
+            item.quantity = quantity
+            item.reserved_until = expiry
+        return item
+    raise CartItemChanged()
+
+
+def remove_from_cart(item):
+    set_quantity(item, 0)
+
+
+def release_expired(now=None, batch_size=500):
+    """Drop cart items whose hold ran out and give their stock back, returns how many"""
+    now = now or timezone.now()
+    expired = CartItem.objects.filter(reserved_until__lt=now).order_by('reserved_until').values_list(
+        'id', 'cart_id', 'product_id', 'quantity'
+    )[:batch_size]
+
+    released = 0
+    for item_id, cart_id, product_id, quantity in expired:
+        with transaction.atomic():
+            # Renewed or changed since we read it: it is not abandoned
+            deleted, _ = CartItem.objects.filter(
+                id=item_id, quantity=quantity, reserved_until__lt=now
+            ).delete()
+            if deleted:
+                release(product_id, quantity)
+                touch_cart(cart_id)
+                released += 1
+    return released
@@ -0,0 +1,199 @@
+# products/suggest.py
+"""
+In-memory prefix index behind the search-as-you-type suggestions.
+
+Every approved product name and every category name (both languages) is
+stored once per word it contains, as the normalized text from that word to
+the end ("smart phone case" -> "smart phone case", "phone case", "case"), in
+one sorted list. A prefix lookup is a bisect into that list followed by a
+short forward scan, so answering never touches the database.
+
+The index lives in the worker process: it is loaded on first use and then
+kept current by the product/category signals once their transaction
+commits. Each committed change is also published to the other workers: a
+sequence number from the cache and the change itself stored under it for
+SUGGESTION_CHANGE_LOG_TIMEOUT. Before answering, a worker applies the
+changes after the last sequence it saw, in order. Only a change that is
+gone (expired, evicted) or a worker too far behind costs a full reload.
+The cache has to be shared by the workers for them to see each other's
+changes; with a per-process cache (LocMem) each worker only follows its own.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .search import WORD_RE, normalize_text
+
+# How many matching keys are looked at before ranking, keeps short prefixes
+# ("a", "م") as cheap as long ones
+MAX_SCAN = 200
+
+SEQUENCE_KEY = 'products:suggest:sequence'
+CHANGE_KEY = 'products:suggest:change:{sequence}'
+CHANGE_TIMEOUT = getattr(settings, 'SUGGESTION_CHANGE_LOG_TIMEOUT', 3600)
+# A sequence number is taken before its change is stored: a missing change
+# only counts as lost after this many seconds
+CHANGE_GRACE = 2
+# Further behind than this, reloading is cheaper than replaying
+MAX_REPLAY = 1000
+
+
+def current_sequence():
+    sequence = cache.get(SEQUENCE_KEY)
+    if sequence is None:
+        # Start from the clock so a lost counter never reuses an old number
+        cache.add(SEQUENCE_KEY, int(time.time() * 1000), timeout=None)
+        sequence = cache.get(SEQUENCE_KEY)
+    return sequence
+
+
+def publish(change):
+    """Append ``change`` to the log the other workers replay, returns its sequence number"""
+    try:
+        sequence = cache.incr(SEQUENCE_KEY)
+    except ValueError:
+        current_sequence()
+        sequence = cache.incr(SEQUENCE_KEY)
+    cache.set(CHANGE_KEY.format(sequence=sequence), change, CHANGE_TIMEOUT)
+    return sequence
+
+
+def _keys(text):
+    words = WORD_RE.findall(normalize_text(text))
+    return {' '.join(words[i:]): i for i in reversed(range(len(words)))}
+
+
+class SuggestionIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._sequence = None  # the last change of the shared log this copy has
+        self._missing = None  # (sequence, since) of a change not in the log yet
+        self._keys = []  # sorted (key, kind, pk, lang, word position)
+        self._entries = {}  # (kind, pk) -> {'ar': name, 'en': name, 'keys': [...]}
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def clear(self):
+        with self._lock:
+            self._loaded = False
+            self._sequence = None
+            self._missing = None
+            self._keys = []
+            self._entries = {}
+
+    def load(self):
+        from .models import Category, Product
+
+        with self._lock:
+            # Read before the rows: a change committed meanwhile is replayed on top
+            self._sequence = current_sequence()
+            self._missing = None
+            self._keys = []
+            self._entries = {}
+            approved = Product.objects.filter(is_approved=True)
+            for pk, name_ar, name_en in approved.values_list('id', 'name_ar', 'name_en').iterator():
+                self._add('product', pk, name_ar, name_en)
+            for pk, name_ar, name_en in Category.objects.values_list('id', 'name_ar', 'name_en'):
+                self._add('category', pk, name_ar, name_en)
+            self._keys.sort()
+            self._loaded = True
+
+    def _add(self, kind, pk, name_ar, name_en, keep_sorted=False):
+        keys = []
+        for lang, name in (('ar', name_ar), ('en', name_en)):
+            for key, position in _keys(name).items():
+                row = (key, kind, pk, lang, position)
+                if keep_sorted:
+                    insort(self._keys, row)
+                else:
+                    self._keys.append(row)
+                keys.append(row)
+        self._entries[(kind, pk)] = {'ar': name_ar, 'en': name_en, 'keys': keys}
+
+    def _apply(self, change):
+        # Replaying a change twice (our own, coming back from the log) is harmless
+        action, kind, pk, *names = change
+        self._remove(kind, pk)
+        if action == 'add':
+            self._add(kind, pk, *names, keep_sorted=True)
+
+    def _change(self, change):
+        with self._lock:
+            if self._loaded:
+                self._apply(change)
+        publish(change)
+
+    def add(self, kind, pk, name_ar, name_en):
+        """Insert or refresh one committed entry, here and in the other workers"""
+        self._change(('add', kind, pk, name_ar, name_en))
+
+    def _remove(self, kind, pk):
+        entry = self._entries.pop((kind, pk), None)
+        if entry is None:
+            return
+        for row in entry['keys']:
+            position = bisect_left(self._keys, row)
+            if position < len(self._keys) and self._keys[position] == row:
+                del self._keys[position]
+
+    def remove(self, kind, pk):
+        self._change(('remove', kind, pk))
+
+    def _catch_up(self):
+        """Apply the logged changes after ``self._sequence``; False when some are lost"""
+        head = current_sequence()
+        if head < self._sequence or head - self._sequence > MAX_REPLAY:
+            return False
+        sequences = range(self._sequence + 1, head + 1)
+        changes = cache.get_many([CHANGE_KEY.format(sequence=sequence) for sequence in sequences])
+        for sequence in sequences:
+            change = changes.get(CHANGE_KEY.format(sequence=sequence))
+            if change is None:
+                # Its worker may still be storing it; the next call tries again
+                now = time.monotonic()
+                if self._missing is None or self._missing[0] != sequence:
+                    self._missing = (sequence, now)
+                return now - self._missing[1] < CHANGE_GRACE
+            self._apply(change)
+            self._sequence = sequence
+        self._missing = None
+        return True
+
+    def suggest(self, query, limit=10):
+        """
+        Top ``limit`` entries whose name has a word starting with ``query``.
+        Names starting with the query rank first, then shorter names.
+        """
+        prefix = ' '.join(WORD_RE.findall(normalize_text(query)))
+        if not prefix:
+            return []
+        best = {}
+        with self._lock:
+            if not self._loaded or not self._catch_up():
+                self.load()
+
+            keys = self._keys
+            position = bisect_left(keys, (prefix,))
+            end = min(position + MAX_SCAN, len(keys))
+            while position < end and keys[position][0].startswith(prefix):
+                key, kind, pk, lang, word = keys[position]
+                name = self._entries[(kind, pk)][lang]
+                rank = (word > 0, len(name), kind, pk)
+                if (kind, pk) not in best or rank < best[(kind, pk)][0]:
+                    best[(kind, pk)] = (rank, name)
+                position += 1
+
+        ranked = sorted(best.items(), key=lambda item: item[1][0])[:limit]
+        return [
+            {'type': kind, 'id': pk, 'text': name}
+            for (kind, pk), (rank, name) in ranked
+        ]
+
+
+index = SuggestionIndex()
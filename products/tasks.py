@@ -18,4 +18,11 @@ def expire_sales():
         is_active=True
     ).update(is_active=False)
     
-    return f"Checked sales at {now}"
\ No newline at end of file
+    return f"Checked sales at {now}"
+
+@shared_task
+def release_expired_reservations():
+    from products.stock import release_expired
+
+    released = release_expired()
+    return f"Released {released} expired cart holds"
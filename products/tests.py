@@ -1,3 +1,1158 @@
-from django.test import TestCase
+import base64
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError, connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+
+from accounts.models import User
+from Store2 import cache_profiles, response_cache
+from Store2.routers import ReplicaRouter, pin_to_primary, replica_reads
+from wallet.models import Wallet
+from .models import (
+    Cart, CartItem, Category, Product, ProductImage, ProductSale, SaleEvent, Wishlist, WishlistItem
+)
+from . import category_cache, search, stock
+from .pricing import with_pricing
+from .serializers import ProductLanguageSerializer, WishlistSerializer
+from .suggest import CHANGE_KEY, SuggestionIndex, current_sequence, index as suggestion_index
+
+
+class CatalogTestMixin:
+    """Shared fixtures for the product tests"""
+
+    def make_user(self, username, role='user', **extra):
+        return User.objects.create_user(
+            email=f'{username}@example.com',
+            username=username,
+            password='pass12345',
+            first_name=username,
+            last_name='test',
+            phone_number='0000',
+            role=role,
+            **extra
+        )
+
+    def make_catalog(self):
+        self.seller = self.make_user('seller', role='seller')
+        self.parent_category = Category.objects.create(name_ar='أب', name_en='Parent')
+        self.category = Category.objects.create(
+            name_ar='ابن', name_en='Child', parent=self.parent_category
+        )
+
+    def make_product(self, **fields):
+        defaults = {
+            'seller': self.seller,
+            'category': self.category,
+            'name_ar': 'منتج',
+            'name_en': 'Product',
+            'price': Decimal('100.00'),
+            'quantity': 10,
+            'is_approved': True,
+        }
+        defaults.update(fields)
+        return Product.objects.create(**defaults)
+
+    def put_on_sale(self, product, percentage):
+        now = timezone.now()
+        event = SaleEvent.objects.create(
+            name_en='Sale', name_ar='تخفيض',
+            start_date=now - timedelta(days=1),
+            end_date=now + timedelta(days=1),
+            created_by=self.seller
+        )
+        return ProductSale.objects.create(
+            product=product,
+            sale_event=event,
+            discount_percentage=Decimal(percentage),
+            start_date=event.start_date,
+            end_date=event.end_date
+        )
+
+
+class PricingResolverTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.make_catalog()
+        now = timezone.now()
+        self.plain = self.make_product(name_en='plain')
+        self.on_sale = self.make_product(name_en='on sale')
+        self.put_on_sale(self.on_sale, '20')
+        self.standalone = self.make_product(
+            name_en='standalone',
+            has_standalone_discount=True,
+            standalone_discount_percentage=Decimal('10'),
+            standalone_discount_start=now - timedelta(hours=1),
+            standalone_discount_end=now + timedelta(hours=1),
+        )
+
+    def test_resolves_every_discount_source(self):
+        products = {p.name_en: p for p in with_pricing(Product.objects.all())}
+
+        self.assertFalse(products['plain'].has_active_discount)
+        self.assertEqual(products['plain'].current_price, Decimal('100.00'))
+        self.assertEqual(products['on sale'].active_discount_percentage, Decimal('20'))
+        self.assertEqual(products['on sale'].current_price, Decimal('80'))
+        self.assertEqual(products['standalone'].active_discount_percentage, Decimal('10'))
+        self.assertEqual(products['standalone'].current_price, Decimal('90'))
+
+    def test_list_rendering_does_not_query_per_product(self):
+        for _ in range(5):
+            self.put_on_sale(self.make_product(), '5')
+
+        products = Product.objects.select_related('category__parent').prefetch_related('images')
+        # products, images, active sales
+        with self.assertNumQueries(3):
+            ProductLanguageSerializer(products, many=True, context={'lang': 'en'}).data
+
+    def test_wishlist_pricing_adds_no_queries_per_product(self):
+        buyer = self.make_user('buyer')
+        wishlist = Wishlist.objects.create(user=buyer)
+        WishlistItem.objects.create(wishlist=wishlist, product=self.on_sale)
+
+        with self.assertNumQueries(7) as small:
+            WishlistSerializer(Wishlist.objects.get(pk=wishlist.pk), context={'lang': 'en'}).data
+
+        for product in (self.plain, self.standalone):
+            WishlistItem.objects.create(wishlist=wishlist, product=product)
+
+        data = None
+        with self.assertNumQueries(len(small) + 2 * 3):
+            # Category, parent category and images are still per product
+            data = WishlistSerializer(Wishlist.objects.get(pk=wishlist.pk), context={'lang': 'en'}).data
+
+        prices = {item['product']['name']: item['current_price'] for item in data['items']}
+        self.assertEqual(prices['on sale'], Decimal('80'))
+        self.assertEqual(prices['standalone'], Decimal('90'))
+
+
+class KeysetPaginationTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.make_catalog()
+        self.client = APIClient()
+        ratings = [None, Decimal('4.50'), Decimal('3.00'), None, Decimal('4.50'), Decimal('1.00')]
+        for index in range(12):
+            self.make_product(
+                price=Decimal(10 + index % 4),
+                rating=ratings[index % len(ratings)]
+            )
+
+    def walk(self, params):
+        """Follow next links to the end, then previous links back to the start"""
+        response = self.client.get('/api/product/', {**params, 'cursor': '', 'page_size': 5})
+        pages = [response.json()]
+        while pages[-1]['next']:
+            pages.append(self.client.get(pages[-1]['next']).json())
+
+        backwards = [pages[-1]]
+        while backwards[-1]['previous']:
+            backwards.append(self.client.get(backwards[-1]['previous']).json())
+        return pages, backwards[::-1]
+
+    def test_pages_match_offset_ordering_in_both_directions(self):
+        for sort_by in ('created_at', 'price', 'rating'):
+            for direction in ('asc', 'desc'):
+                params = {'sort_by': sort_by, 'sort_direction': direction}
+                pages, backwards = self.walk(params)
+
+                ids = [row['id'] for page in pages for row in page['results']]
+                self.assertEqual(len(ids), 12)
+                self.assertEqual(len(set(ids)), 12)
+                self.assertEqual(
+                    [[row['id'] for row in page['results']] for page in pages],
+                    [[row['id'] for row in page['results']] for page in backwards],
+                    params
+                )
+
+                # Same order as the sort itself (NULL ratings last, id breaks ties)
+                descending = direction == 'desc'
+                products = sorted(Product.objects.all(), key=lambda p: p.id, reverse=descending)
+                rated = [p for p in products if getattr(p, sort_by) is not None]
+                rated.sort(key=lambda p: getattr(p, sort_by), reverse=descending)
+                unrated = [p for p in products if getattr(p, sort_by) is None]
+                expected = [p.id for p in rated + unrated]
+                self.assertEqual(ids, expected, params)
+
+    def test_cursor_mode_skips_count(self):
+        data = self.client.get('/api/product/', {'cursor': ''}).json()
+        self.assertNotIn('count', data)
+        self.assertNotIn('total_pages', data)
+        self.assertIsNone(data['previous'])
+
+        data = self.client.get('/api/product/').json()
+        self.assertEqual(data['count'], 12)
+        self.assertEqual(data['total_pages'], 1)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/product/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+        # Well-formed cursors holding values of the wrong type
+        for sort_by, position in (
+            ('created_at', ['yesterday', 1]), ('price', ['cheap', 1]), ('rating', [[1], 1]),
+            ('created_at', ['2024-01-01T00:00:00+00:00', 'one']), ('price', ['10', None]),
+        ):
+            token = base64.urlsafe_b64encode(json.dumps({'p': position, 'r': 0}).encode()).decode()
+            response = self.client.get('/api/product/', {'cursor': token, 'sort_by': sort_by})
+            self.assertEqual(response.status_code, 404, (sort_by, position))
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class CategoryProductsTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.make_catalog()
+        self.client = APIClient()
+        self.sibling = Category.objects.create(name_ar='أخ', name_en='Sibling', parent=self.parent_category)
+        self.other = Category.objects.create(name_ar='آخر', name_en='Other')
+        for index in range(6):
+            product = self.make_product(
+                category=self.category if index % 2 else self.sibling, price=Decimal(10 + index)
+            )
+            ProductImage.objects.create(product=product, image=f'products/{index}-b.png')
+            ProductImage.objects.create(product=product, image=f'products/{index}-a.png')
+        self.make_product(category=self.other)
+        self.make_product(is_approved=False)
+
+    def url(self, category):
+        return f'/api/product/category/{category.id}/products/'
+
+    def test_parent_lists_its_children_paginated(self):
+        data = self.client.get(self.url(self.parent_category), {'page_size': 4}).json()
+        self.assertEqual(data['count'], 6)
+        self.assertEqual(data['total_pages'], 2)
+        self.assertEqual(len(data['results']), 4)
+
+        data = self.client.get(self.url(self.category)).json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual({row['category_id'] for row in data['results']}, {self.category.id})
+
+        data = self.client.get(self.url(self.parent_category), {'sort_by': 'price', 'sort_direction': 'asc'}).json()
+        self.assertEqual([Decimal(row['price']) for row in data['results']], [Decimal(10 + i) for i in range(6)])
+
+        data = self.client.get(self.url(self.parent_category), {'cursor': '', 'page_size': 4}).json()
+        self.assertNotIn('count', data)
+        self.assertEqual(len(data['results']), 4)
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(self.url(self.parent_category), {'page_size': 2})
+        with self.assertNumQueries(len(small)):
+            self.client.get(self.url(self.parent_category), {'page_size': 6})
+        with self.assertNumQueries(len(small)):
+            self.client.get(self.url(self.parent_category), {'page_size': 6, 'view': 'card'})
+
+    def test_card_view(self):
+        product = Product.objects.filter(category=self.category).order_by('price').first()
+        self.put_on_sale(product, '50')
+        data = self.client.get(
+            self.url(self.category), {'view': 'card', 'sort_by': 'price', 'sort_direction': 'asc'},
+            HTTP_ACCEPT_LANGUAGE='en'
+        ).json()
+        card = data['results'][0]
+        self.assertEqual(set(card), {'id', 'name', 'price', 'current_price', 'thumbnail'})
+        self.assertEqual(card['id'], product.id)
+        self.assertEqual(card['name'], 'Product')
+        self.assertEqual(Decimal(card['current_price']), product.price / 2)
+        first = product.images.order_by('id').first()
+        self.assertTrue(card['thumbnail'].startswith('http://testserver/'))
+        self.assertTrue(card['thumbnail'].endswith(first.image.url))
+
+    def test_unknown_category(self):
+        self.assertEqual(self.client.get('/api/product/category/999999/products/').status_code, 404)
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class SparseFieldsetTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.make_catalog()
+        self.client = APIClient()
+        for index in range(4):
+            product = self.make_product(name_en=f'Lamp {index}', description_en='Bright')
+            ProductImage.objects.create(product=product, image=f'products/{index}.png')
+        self.product = product
+        self.put_on_sale(product, '20')
+
+    def test_default_representation_is_unchanged(self):
+        data = self.client.get(f'/api/product/{self.product.id}/', HTTP_ACCEPT_LANGUAGE='en').json()
+        self.assertEqual(set(data), {
+            'id', 'name', 'description', 'price', 'current_price', 'category_id', 'category_name',
+            'parent_category_name', 'created_at', 'is_approved', 'images', 'quantity',
+            'has_active_discount', 'discount_percentage', 'seller_id'
+        })
+        self.assertEqual(data['name'], 'Lamp 3')
+
+    def test_fields_skip_method_fields_and_relations(self):
+        with CaptureQueriesContext(connection) as full:
+            self.client.get('/api/product/')
+        with mock.patch.object(ProductLanguageSerializer, 'get_images') as get_images, \
+                mock.patch.object(ProductLanguageSerializer, 'get_category_name') as get_category_name, \
+                CaptureQueriesContext(connection) as sparse:
+            response = self.client.get('/api/product/', {'fields': 'name,price'}, HTTP_ACCEPT_LANGUAGE='en')
+        get_images.assert_not_called()
+        get_category_name.assert_not_called()
+
+        rows = response.json()['results']
+        self.assertEqual([set(row) for row in rows], [{'id', 'name', 'price'}] * 4)
+        # No images prefetch, no sales prefetch, no category join
+        self.assertEqual(len(sparse), len(full) - 2)
+        self.assertFalse(any('products_category' in query['sql'] for query in sparse))
+
+    def test_price_fields_keep_pricing(self):
+        rows = self.client.get('/api/product/', {'fields': 'current_price,discount_percentage'}).json()['results']
+        row = next(row for row in rows if row['id'] == self.product.id)
+        self.assertEqual(Decimal(row['current_price']), Decimal('80.00'))
+        self.assertEqual(Decimal(row['discount_percentage']), Decimal('20'))
+        self.assertTrue(all('discount_percentage' not in row for row in rows if row['id'] != self.product.id))
+
+    def test_expand(self):
+        data = self.client.get(
+            f'/api/product/{self.product.id}/', {'fields': 'name', 'expand': 'category,seller'},
+            HTTP_ACCEPT_LANGUAGE='en'
+        ).json()
+        self.assertEqual(data, {
+            'id': self.product.id,
+            'name': 'Lamp 3',
+            'category': {
+                'id': self.category.id, 'name': 'Child',
+                'parent': {'id': self.parent_category.id, 'name': 'Parent'},
+            },
+            'seller': {'id': self.seller.id, 'name': 'seller test'},
+        })
+
+    def test_every_product_endpoint(self):
+        params = {'fields': 'id,name'}
+        rows = self.client.get(f'/api/product/category/{self.category.id}/products/', params).json()['results']
+        self.assertEqual(set(rows[0]), {'id', 'name'})
+        rows = self.client.get('/api/product/search/', {**params, 'q': 'Lamp'}).json()['results']
+        self.assertEqual(set(rows[0]), {'id', 'name'})
+        rows = self.client.get('/api/product/', {'view': 'card', 'fields': 'thumbnail'}).json()['results']
+        self.assertEqual(set(rows[0]), {'id', 'thumbnail'})
+
+        self.client.force_authenticate(self.seller)
+        rows = self.client.get('/api/product/sellerproductsApproved/', params).json()
+        self.assertEqual(set(rows[0]), {'id', 'name'})
+
+    def test_unknown_fields(self):
+        response = self.client.get('/api/product/', {'fields': 'name,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Unknown fields: password'})
+        response = self.client.get(f'/api/product/{self.product.id}/', {'expand': 'images'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ProductSearchTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.make_catalog()
+        self.client = APIClient()
+        self.phone = self.make_product(
+            name_ar='هاتف ذكي', name_en='Smart Phone',
+            description_en='A phone with a great camera'
+        )
+        self.case = self.make_product(
+            name_ar='غطاء', name_en='Case',
+            description_ar='غطاء مناسب للهاتف', description_en='Fits most phones'
+        )
+        self.hidden = self.make_product(name_en='Phone prototype', is_approved=False)
+
+    def search(self, query, **params):
+        response = self.client.get('/api/product/search/', {'q': query, **params}, HTTP_ACCEPT_LANGUAGE='en')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_normalize_text(self):
+        self.assertEqual(search.normalize_text('هَاتِفٌ'), 'هاتف')
+        self.assertEqual(search.normalize_text('أحمد إسلام آمنة مستشفى'), 'احمد اسلام امنه مستشفي')
+        self.assertEqual(search.normalize_text('PHONE'), 'phone')
+
+    def test_ranked_and_stemmed(self):
+        data = self.search('phones')
+        # Name hits rank above description-only hits, unapproved products are not indexed
+        self.assertEqual([row['id'] for row in data['results']], [self.phone.id, self.case.id])
+        self.assertEqual(data['count'], 2)
+
+    def test_arabic_query_ignores_diacritics_and_letter_forms(self):
+        self.assertEqual([row['id'] for row in self.search('هاتِف')['results']], [self.phone.id])
+        self.assertEqual([row['id'] for row in self.search('غِطاء')['results']], [self.case.id])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.hidden.is_approved = True
+        self.hidden.save()
+        self.assertEqual(self.search('prototype')['count'], 1)
+
+        self.phone.name_en = 'Tablet'
+        self.phone.description_en = ''
+        self.phone.save()
+        self.assertEqual(self.search('smart')['count'], 0)
+
+        self.case.delete()
+        self.assertEqual([row['id'] for row in self.search('phone')['results']], [self.hidden.id])
+
+    def test_rolled_back_writes_leave_the_index_alone(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.phone.name_en = 'Tablet'
+            self.phone.save()
+            self.case.delete()
+            raise RuntimeError
+        self.assertEqual(self.search('smart')['count'], 1)
+        self.assertEqual(self.search('tablet')['count'], 0)
+        self.assertEqual(self.search('case')['count'], 1)
+
+    def test_paginated_and_rebuildable(self):
+        for index in range(3):
+            self.make_product(name_en=f'Phone {index}')
+        data = self.search('phone', page_size=2, page=2)
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(data['total_pages'], 3)
+        self.assertEqual(len(data['results']), 2)
+
+        self.assertEqual(search.rebuild_index(batch_size=2), 5)
+        self.assertEqual(self.search('phone')['count'], 5)
+        self.assertEqual(self.search('!!!')['count'], 0)
+
+
+class ProductSuggestTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        suggestion_index.clear()
+        self.addCleanup(suggestion_index.clear)
+        self.addCleanup(cache.clear)
+        self.make_catalog()
+        self.client = APIClient()
+        self.case = self.make_product(name_ar='غطاء هاتف', name_en='Phone Case')
+        self.phone = self.make_product(name_ar='هاتف', name_en='Phone')
+        self.make_product(name_en='Phone prototype', is_approved=False)
+
+    def suggest(self, query, **params):
+        response = self.client.get('/api/product/search/suggest/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(row['type'], row['id']) for row in response.json()['results']]
+
+    def test_prefix_matches_rank_name_starts_first(self):
+        self.assertEqual(self.suggest('ph'), [('product', self.phone.id), ('product', self.case.id)])
+        self.assertEqual(self.suggest('cas'), [('product', self.case.id)])
+        self.assertEqual(self.suggest('PHONE c'), [('product', self.case.id)])
+        # Arabic, ignoring diacritics; "هاتف" starts the second word of "غطاء هاتف"
+        self.assertEqual(self.suggest('هَات'), [('product', self.phone.id), ('product', self.case.id)])
+        self.assertEqual(self.suggest('ch'), [('category', self.category.id)])
+        self.assertEqual(self.suggest('ph', limit=1), [('product', self.phone.id)])
+        self.assertEqual(self.suggest('xyz'), [])
+
+    def test_answers_without_queries_once_loaded(self):
+        suggestion_index.load()
+        with self.assertNumQueries(0):
+            self.assertEqual(len(suggestion_index.suggest('phone')), 2)
+
+    def test_follows_approval_and_deletion(self):
+        self.suggest('ph')
+        self.assertTrue(suggestion_index.loaded)
+
+        prototype = Product.objects.get(name_en='Phone prototype')
+        prototype.is_approved = True
+        with self.captureOnCommitCallbacks(execute=True):
+            prototype.save()
+        self.assertIn(('product', prototype.id), self.suggest('proto'))
+
+        self.phone.name_en = 'Tablet'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.phone.save()
+        self.assertEqual(self.suggest('tab'), [('product', self.phone.id)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.case.delete()
+            prototype.is_approved = False
+            prototype.save()
+        self.assertEqual(self.suggest('ph'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+        self.assertEqual(self.suggest('child'), [])
+
+    def test_uncommitted_writes_stay_out(self):
+        self.suggest('ph')
+        # Rolled back: the on_commit callbacks are dropped
+        with self.captureOnCommitCallbacks(execute=False):
+            self.make_product(name_en='Ghost')
+        self.assertEqual(self.suggest('gho'), [])
+
+    def test_other_workers_apply_the_change(self):
+        other = SuggestionIndex()
+        other.load()
+        self.suggest('ph')
+
+        # Committed through this process's index (the signals)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.phone.name_en = 'Tablet'
+            self.phone.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('tab'), [('product', self.phone.id)])
+
+        # The other copy replays it from the change log, no reload
+        with self.assertNumQueries(0):
+            self.assertEqual(other.suggest('tab'), [{'type': 'product', 'id': self.phone.id, 'text': 'Tablet'}])
+            self.assertEqual(other.suggest('phone'), [{'type': 'product', 'id': self.case.id, 'text': 'Phone Case'}])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.case.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(other.suggest('phone'), [])
+
+    def test_lost_changes_reload(self):
+        other = SuggestionIndex()
+        other.load()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.phone.name_en = 'Tablet'
+            self.phone.save()
+        cache.delete(CHANGE_KEY.format(sequence=current_sequence()))
+
+        # Maybe not stored yet: answered from what it has
+        with self.assertNumQueries(0):
+            self.assertEqual(other.suggest('tab'), [])
+        with mock.patch('products.suggest.CHANGE_GRACE', 0):
+            self.assertEqual(other.suggest('tab'), [{'type': 'product', 'id': self.phone.id, 'text': 'Tablet'}])
+
+
+class CategoryTreeCacheTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.make_catalog()
+        self.other_parent = Category.objects.create(name_ar='فارغ', name_en='Empty')
+        self.superadmin = self.make_user('root', role='superadmin', is_superuser=True)
+        self.client = APIClient()
+
+    def test_tree_is_built_once_and_revalidated_without_queries(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/product/LocalizedCategoryList/', HTTP_ACCEPT_LANGUAGE='en')
+        self.assertEqual(response.json(), [
+            {'id': self.parent_category.id, 'name': 'Parent', 'children': [
+                {'id': self.category.id, 'name': 'Child'}
+            ]},
+            {'id': self.other_parent.id, 'name': 'Empty', 'children': []},
+        ])
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                '/api/product/LocalizedCategoryList/', HTTP_ACCEPT_LANGUAGE='en', HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+
+        with self.assertNumQueries(0):
+            parents = self.client.get('/api/product/categories/parents/', HTTP_ACCEPT_LANGUAGE='en').json()
+            children = self.client.get(
+                f'/api/product/categories/children/{self.parent_category.id}/', HTTP_ACCEPT_LANGUAGE='en'
+            ).json()
+        self.assertEqual([p['has_children'] for p in parents], [True, False])
+        self.assertEqual(children, [{'id': self.category.id, 'name': 'Child'}])
+
+        # Arabic is cached and tagged separately
+        response = self.client.get('/api/product/LocalizedCategoryList/', HTTP_ACCEPT_LANGUAGE='ar')
+        self.assertEqual(response.json()[0]['name'], 'أب')
+        self.assertNotEqual(response['ETag'], etag)
+
+        self.assertEqual(self.client.get('/api/product/categories/children/999/').status_code, 404)
+
+    def test_category_writes_invalidate(self):
+        etag = self.client.get('/api/product/LocalizedCategoryList/', HTTP_ACCEPT_LANGUAGE='en')['ETag']
+
+        self.client.force_authenticate(self.superadmin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                f'/api/product/UpdateCategory/{self.category.id}/',
+                {'name_ar': 'ابن', 'name_en': 'Renamed', 'parent_id': self.parent_category.id}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.client.force_authenticate(None)
+
+        response = self.client.get(
+            '/api/product/LocalizedCategoryList/', HTTP_ACCEPT_LANGUAGE='en', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['children'][0]['name'], 'Renamed')
+
+    def test_version_expires(self):
+        # A write made on another worker never bumps this one's version:
+        # it must not keep answering 304 forever
+        etag = self.client.get('/api/product/LocalizedCategoryList/', HTTP_ACCEPT_LANGUAGE='en')['ETag']
+        later = time.time() + category_cache.TREE_TIMEOUT + 1
+        with mock.patch('time.time', return_value=later):
+            response = self.client.get(
+                '/api/product/LocalizedCategoryList/', HTTP_ACCEPT_LANGUAGE='en', HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+# The views' own revalidation, without the response cache in front
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class ConditionalProductRequestTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.make_catalog()
+        self.client = APIClient()
+        self.product = self.make_product(name_en='Lamp')
+        self.make_product(name_en='Desk')
+
+    def assertRevalidates(self, url, changed=None):
+        """Second request with the ETag is a 304; after ``changed()`` it is a 200 again"""
+        response = self.client.get(url, HTTP_ACCEPT_LANGUAGE='en')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('must-revalidate', response['Cache-Control'])
+        self.assertIn('Accept-Language', response['Vary'])
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_ACCEPT_LANGUAGE='en', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get(url, HTTP_ACCEPT_LANGUAGE='ar', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        if changed:
+            changed()
+            response = self.client.get(url, HTTP_ACCEPT_LANGUAGE='en', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail(self):
+        url = f'/api/product/{self.product.id}/'
+        self.assertRevalidates(url, lambda: self.product.save())
+        self.assertRevalidates(url, lambda: ProductImage.objects.create(product=self.product, image='products/a.png'))
+        self.assertRevalidates(url, lambda: self.put_on_sale(self.product, '15'))
+        self.assertRevalidates(url, lambda: SaleEvent.objects.update(end_date=timezone.now() - timedelta(minutes=1)))
+
+    def test_listing(self):
+        self.assertRevalidates('/api/product/', lambda: self.make_product(name_en='Chair'))
+        self.assertRevalidates('/api/product/?sort_by=price', lambda: self.put_on_sale(self.product, '15'))
+        self.assertRevalidates('/api/product/?cursor=', lambda: self.product.delete())
+
+    def test_stock_moves(self):
+        # Holds and releases change the rendered quantity without a save()
+        url = f'/api/product/{self.product.id}/'
+        self.assertRevalidates(url, lambda: stock.reserve(self.product.id, 3))
+        self.assertRevalidates(url, lambda: stock.release(self.product.id, 3))
+        self.assertRevalidates('/api/product/?in_stock=true', lambda: stock.reserve(self.product.id, 10))
+
+
+
+class ResponseCacheTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.make_catalog()
+        self.client = APIClient()
+        self.product = self.make_product(name_en='Lamp')
+
+    def get(self, url, lang='en', **headers):
+        return self.client.get(url, HTTP_ACCEPT_LANGUAGE=lang, **headers)
+
+    def test_hits_until_a_catalog_write(self):
+        self.assertEqual(self.get('/api/product/?sort_by=price&page=1')['X-Cache'], 'MISS')
+        # Query parameter order doesn't matter, the language does
+        with self.assertNumQueries(0):
+            response = self.get('/api/product/?page=1&sort_by=price')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()['results'][0]['name'], 'Lamp')
+        self.assertEqual(self.get('/api/product/?page=1&sort_by=price', lang='ar')['X-Cache'], 'MISS')
+
+        # A 304 straight from the cache
+        response = self.get('/api/product/?page=1&sort_by=price', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((response.status_code, response['X-Cache']), (304, 'HIT'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name_en = 'Desk lamp'
+            self.product.save()
+        response = self.get('/api/product/?page=1&sort_by=price')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['results'][0]['name'], 'Desk lamp')
+
+        self.assertEqual(
+            response_cache.stats(['product-list']),
+            {'product-list': {'hit': 2, 'miss': 3, 'coalesced': 0}}
+        )
+
+    def test_detail_is_tagged_with_its_product(self):
+        url = f'/api/product/{self.product.id}/'
+        self.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_product(name_en='Other')
+        self.assertEqual(self.get(url)['X-Cache'], 'HIT')
+
+        # (the wishlist fan-out the sale schedules is not what this is about)
+        with mock.patch('notifications.fanout._dispatch'), self.captureOnCommitCallbacks(execute=True):
+            self.put_on_sale(self.product, '15')
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(Decimal(response.json()['current_price']), Decimal('85.00'))
+
+        # Errors are never stored
+        self.get('/api/product/999999/')
+        self.assertEqual(self.get('/api/product/999999/').status_code, 404)
+        self.assertEqual(response_cache.stats(['product-detail'])['product-detail']['hit'], 1)
+
+    def test_stock_moves_invalidate_the_product(self):
+        url = f'/api/product/{self.product.id}/'
+        self.get(url)
+        cached = self.get(url)
+        self.assertEqual(cached['X-Cache'], 'HIT')
+
+        # Plain UPDATEs, no post_save
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.reserve(self.product.id, 3)
+        response = self.get(url, HTTP_IF_NONE_MATCH=cached['ETag'])
+        self.assertEqual((response.status_code, response['X-Cache']), (200, 'MISS'))
+        self.assertNotEqual(response['ETag'], cached['ETag'])
+        self.assertEqual(response.json()['quantity'], 7)
+
+        for move in (lambda: stock.release(self.product.id, 3), lambda: stock.restock(self.product, 5)):
+            self.get(url)
+            self.get('/api/product/')
+            with self.captureOnCommitCallbacks(execute=True):
+                move()
+            self.assertEqual(self.get(url)['X-Cache'], 'MISS')
+            self.assertEqual(self.get('/api/product/')['X-Cache'], 'MISS')
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        class SlowView(APIView):
+            authentication_classes = []
+            permission_classes = []
+
+            @response_cache.cache_response('test-slow', tags=('slow',))
+            def get(self, request):
+                calls.append(1)
+                time.sleep(0.2)
+                return Response({'ok': True})
+
+        view = SlowView.as_view()
+        factory = APIRequestFactory()
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            responses = list(pool.map(lambda _: view(factory.get('/slow/')), range(5)))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(response['X-Cache'] for response in responses), ['HIT'] * 4 + ['MISS'])
+        self.assertEqual(response_cache.stats(['test-slow'])['test-slow']['coalesced'], 4)
+
+class ProductChangeTrackingTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.make_catalog()
+        self.product = self.make_product(name_en='Kettle')
+        self.client = APIClient()
+
+    def test_changes_are_tracked_without_a_query(self):
+        product = Product.objects.get(pk=self.product.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(product.get_changed_fields(), set())
+            product.quantity = 3
+            product.price = Decimal('100.00')
+            self.assertEqual(product.get_changed_fields(), {'quantity'})
+            self.assertEqual(product.get_dirty_fields(), {'quantity': 3})
+            self.assertFalse(product.has_changed('name_en', 'is_approved'))
+
+        product.save()
+        self.assertEqual(product.get_changed_fields(), set())
+
+        product.name_en = 'Renamed'
+        product.refresh_from_db(fields=['name_en'])
+        self.assertEqual(product.get_changed_fields(), set())
+
+    def test_stock_update_is_a_single_update(self):
+        self.product.has_standalone_discount = True
+        self.product.standalone_discount_percentage = Decimal('10')
+        self.product.save()
+
+        self.client.force_authenticate(self.seller)
+        with mock.patch('notifications.signals.schedule_wishlist_fanout') as fanout, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f'/api/product/update-quantity/{self.product.id}/', {'quantity': 5}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['new_quantity'], 15)
+        fanout.assert_not_called()
+
+        writes = [query['sql'] for query in queries.captured_queries if not query['sql'].startswith('SELECT')]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith('UPDATE "products_product" SET "quantity"'))
+
+    def test_receivers_run_for_the_fields_they_watch(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.name_en = 'Teapot'
+        product.save()
+        self.assertEqual(len(search.SearchResults('teapot', Product.objects.all())), 1)
+
+        with mock.patch('notifications.signals.schedule_wishlist_fanout') as fanout:
+            product.has_standalone_discount = True
+            product.standalone_discount_percentage = Decimal('20')
+            product.save()
+            product.description_en = 'Now with a lid'
+            product.save()
+        self.assertEqual(fanout.call_count, 1)
+
+
+class StockReservationTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.make_catalog()
+        self.product = self.make_product(quantity=5)
+        self.buyer = self.make_user('buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def add(self, quantity, product=None):
+        return self.client.post(
+            '/api/product/cart/add/',
+            {'product_id': (product or self.product).id, 'quantity': quantity}, format='json'
+        )
+
+    def shelf(self):
+        self.product.refresh_from_db(fields=['quantity'])
+        return self.product.quantity
+
+    def test_cart_holds_stock(self):
+        self.assertEqual(self.add(3).status_code, 201)
+        self.assertEqual(self.shelf(), 2)
+
+        response = self.add(3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Cannot add 3 more (only 2 available)')
+        self.assertEqual(self.add(2).status_code, 201)
+        self.assertEqual(self.shelf(), 0)
+
+        item = CartItem.objects.get()
+        self.assertEqual(item.quantity, 5)
+        self.assertEqual(self.client.get('/api/product/cart/').json()['items'][0]['max_available'], 5)
+
+        response = self.client.patch(f'/api/product/cart/update/{item.id}/', {'quantity': 6}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Only 5 available in stock')
+        response = self.client.patch(f'/api/product/cart/update/{item.id}/', {'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.shelf(), 4)
+
+        self.assertEqual(self.client.delete(f'/api/product/cart/remove/{item.id}/').status_code, 204)
+        self.assertEqual(self.shelf(), 5)
+
+    def test_restock_is_an_increment(self):
+        self.add(2)
+        stale = Product.objects.get(pk=self.product.pk)
+        self.add(1)
+
+        self.client.force_authenticate(self.seller)
+        response = self.client.patch(
+            f'/api/product/update-quantity/{stale.id}/', {'quantity': 10}, format='json'
+        )
+        # The stale copy still said 3 on the shelf; the buyer's hold is kept
+        self.assertEqual(response.json()['new_quantity'], 12)
+        self.assertEqual(self.shelf(), 12)
+
+    def test_expired_holds_are_released(self):
+        self.add(4)
+        other = self.make_product(quantity=2, name_en='Other')
+        self.add(1, product=other)
+        CartItem.objects.filter(product=self.product).update(
+            reserved_until=timezone.now() - timedelta(minutes=1)
+        )
+
+        self.assertEqual(stock.release_expired(), 1)
+        self.assertEqual(self.shelf(), 5)
+        self.assertEqual(list(CartItem.objects.values_list('product_id', flat=True)), [other.id])
+        self.assertEqual(stock.release_expired(), 0)
+
+    def test_concurrent_change_retries(self):
+        self.add(2)
+        item = CartItem.objects.get()
+        stale = CartItem.objects.get()
+        stock.set_quantity(item, 4)
+
+        # Based on quantity 2, but the compare-and-swap sees 4 and recomputes
+        stock.set_quantity(stale, 1)
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+        self.assertEqual(self.shelf(), 4)
+
+
+class CartRenderingTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.make_catalog()
+        self.buyer = self.make_user('buyer')
+        self.cart = Cart.objects.create(user=self.buyer)
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def fill(self, count):
+        for i in range(count):
+            product = self.make_product(name_en=f'Item {i}', price=Decimal('10.00'))
+            ProductImage.objects.create(product=product, image=f'products/{i}.png')
+            if i % 2:
+                self.put_on_sale(product, '25')
+            stock.add_to_cart(self.cart, product, 2)
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        self.fill(1)
+        # cart, items (+product, category, parent), images, active sales
+        with self.assertNumQueries(4):
+            self.client.get('/api/product/cart/')
+
+        self.fill(10)
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/product/cart/')
+        self.assertEqual(len(response.json()['items']), 11)
+        self.assertEqual(len(response.json()['items'][1]['product']['images']), 1)
+
+    def test_totals_use_the_discounted_price(self):
+        self.fill(2)
+        data = self.client.get('/api/product/cart/').json()
+        self.assertEqual(data['total_items'], 4)
+        self.assertEqual(data['total_price'], '40.00')
+        self.assertEqual(data['total_discount'], '5.00')
+        self.assertEqual(data['total_after_discount'], '35.00')
+        self.assertEqual(Decimal(str(data['items'][1]['current_price'])), Decimal('7.5'))
+
+
+class CartMutationResponseTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.make_catalog()
+        self.buyer = self.make_user('buyer')
+        self.cart = Cart.objects.create(user=self.buyer)
+        self.lamp = self.make_product(name_en='Lamp', price=Decimal('10.00'), quantity=5)
+        self.desk = self.make_product(name_en='Desk', price=Decimal('50.00'), quantity=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def batch(self, operations, **extra):
+        return self.client.post(
+            '/api/product/cart/batch/?response=delta',
+            {'operations': operations, **extra}, format='json'
+        )
+
+    def test_delta_response(self):
+        stock.add_to_cart(self.cart, self.desk, 1)
+        response = self.client.post(
+            '/api/product/cart/add/?response=delta', {'product_id': self.lamp.id, 'quantity': 2}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data['version'], 2)
+        self.assertEqual([item['product']['id'] for item in data['items']], [self.lamp.id])
+        self.assertEqual(data['removed'], [])
+        self.assertEqual(data['total_items'], 3)
+        self.assertEqual(data['total_price'], '70.00')
+        self.assertEqual(data['total_discount'], '0.00')
+
+        item_id = data['items'][0]['id']
+        data = self.client.patch(
+            f'/api/product/cart/update/{item_id}/?response=delta', {'quantity': 1}, format='json'
+        ).json()
+        self.assertEqual((data['version'], data['total_items']), (3, 2))
+        # Without the flag the whole cart comes back, version included
+        self.assertEqual(self.client.get('/api/product/cart/').json()['version'], 3)
+
+    def test_batch_applies_everything(self):
+        desk_item = stock.add_to_cart(self.cart, self.desk, 1)
+        response = self.batch([
+            {'op': 'add', 'product_id': self.lamp.id, 'quantity': 4},
+            {'op': 'update', 'product_id': self.lamp.id, 'quantity': 3},
+            {'op': 'remove', 'item_id': desk_item.id},
+        ], base_version=1)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['removed'], [desk_item.id])
+        self.assertEqual([(item['product']['id'], item['quantity']) for item in data['items']], [(self.lamp.id, 3)])
+        self.assertEqual(data['version'], 4)
+        self.lamp.refresh_from_db()
+        self.desk.refresh_from_db()
+        self.assertEqual((self.lamp.quantity, self.desk.quantity), (2, 1))
+
+    def test_batch_is_all_or_nothing(self):
+        response = self.batch([
+            {'op': 'add', 'product_id': self.lamp.id, 'quantity': 2},
+            {'op': 'add', 'product_id': self.desk.id, 'quantity': 2},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Only 1 available in stock', 'index': 1})
+        self.lamp.refresh_from_db()
+        self.assertEqual(self.lamp.quantity, 5)
+        self.assertFalse(CartItem.objects.exists())
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.version, 0)
+
+        self.assertEqual(self.batch([{'op': 'remove', 'item_id': 999}]).status_code, 404)
+        self.assertEqual(self.batch([{'op': 'drop'}]).json()['index'], 0)
+        self.assertEqual(self.batch([]).status_code, 400)
+
+    def test_batch_rejects_a_stale_base_version(self):
+        stock.add_to_cart(self.cart, self.lamp, 1)
+        response = self.batch([{'op': 'add', 'product_id': self.lamp.id}], base_version=0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+
+
+class IdempotentCartTests(CatalogTestMixin, TestCase):
+    def test_retried_add_is_applied_once(self):
+        self.make_catalog()
+        product = self.make_product(quantity=5)
+        buyer = self.make_user('buyer')
+        client = APIClient()
+        client.force_authenticate(buyer)
+
+        for _ in range(3):
+            response = client.post(
+                '/api/product/cart/add/?response=delta', {'product_id': product.id, 'quantity': 2},
+                format='json', HTTP_IDEMPOTENCY_KEY='add-lamp'
+            )
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.json()['total_items'], 2)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 3)
+
+
+class StockConcurrencyTests(CatalogTestMixin, TransactionTestCase):
+    """Thousands of parallel add-to-cart calls must never sell more than the shelf holds"""
+
+    STOCK = 300
+    CALLS = 2000
+    BUYERS = 100
+
+    def add_to_cart(self, cart):
+        try:
+            # The test database is SQLite's shared in-memory one, which answers
+            # a busy table with an error instead of waiting: retry the whole
+            # (atomic) call like a client would
+            while True:
+                try:
+                    stock.add_to_cart(cart, self.product, 1)
+                    return True
+                except stock.OutOfStock:
+                    return False
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    time.sleep(0.001)
+        finally:
+            connections.close_all()
+
+    def test_no_overselling(self):
+        self.make_catalog()
+        self.product = self.make_product(quantity=self.STOCK)
+        # No password hashing for the buyers, they never log in
+        buyers = User.objects.bulk_create([
+            User(
+                email=f'buyer{i}@example.com', username=f'buyer{i}', password='!',
+                first_name='buyer', last_name='test', phone_number='0000'
+            )
+            for i in range(self.BUYERS)
+        ])
+        carts = Cart.objects.bulk_create([Cart(user=buyer) for buyer in buyers])
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(self.add_to_cart, (carts[i % self.BUYERS] for i in range(self.CALLS))))
+
+        self.product.refresh_from_db()
+        held = sum(CartItem.objects.values_list('quantity', flat=True))
+        self.assertEqual(results.count(True), self.STOCK)
+        self.assertEqual(held, self.STOCK)
+        self.assertEqual(self.product.quantity, 0)
+
+
+class ReadReplicaRoutingTests(CatalogTestMixin, TransactionTestCase):
+    """
+    A TransactionTestCase: inside TestCase's wrapping transaction every read
+    would (rightly) stay on the primary.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.make_catalog()
+        self.product = self.make_product()
+        self.router = ReplicaRouter()
+
+    def test_replicas_need_a_shared_cache(self):
+        for url in ('locmem://', 'dummy://'):
+            with self.assertRaises(ImproperlyConfigured):
+                cache_profiles.require_shared({'default': cache_profiles.backend(url)}, 'STORE_DB_REPLICAS')
+        cache_profiles.require_shared(
+            {'default': cache_profiles.backend('redis://localhost:6379/1')}, 'STORE_DB_REPLICAS'
+        )
+
+    @override_settings(REPLICA_DATABASES=['replica_1'])
+    def test_router_decisions(self):
+        self.assertIsNone(self.router.db_for_read(Product))
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Product), 'replica_1')
+            self.assertEqual(Product.objects.all().db, 'replica_1')
+            # Locking reads, wallet reads and reads inside a transaction stay on the primary
+            self.assertEqual(Product.objects.select_for_update().db, 'default')
+            self.assertEqual(Wallet.objects.all().db, 'default')
+            with transaction.atomic():
+                self.assertEqual(Product.objects.all().db, 'default')
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+        self.assertFalse(self.router.allow_migrate('replica_1', 'products'))
+        self.assertIsNone(self.router.allow_migrate('default', 'products'))
+
+    # 'default' stands in for the replica: random.choice() only runs on the replica path
+    @override_settings(REPLICA_DATABASES=['default'], RESPONSE_CACHE_TIMEOUT=0)
+    def test_catalog_reads_stick_to_the_primary_after_a_write(self):
+        buyer = self.make_user('buyer')
+        client = APIClient()
+        client.force_authenticate(buyer)
+
+        with mock.patch('Store2.routers.random.choice', side_effect=lambda aliases: aliases[0]) as choice:
+            self.assertEqual(client.get('/api/product/').status_code, 200)
+            self.assertTrue(choice.called)
+            # The cart is not a replica view
+            choice.reset_mock()
+            response = client.post('/api/product/cart/add/', {'product_id': self.product.id}, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertFalse(choice.called)
+
+            # Right after writing, the buyer reads the primary, other clients don't
+            client.get('/api/product/')
+            self.assertFalse(choice.called)
+            APIClient().get('/api/product/')
+            self.assertTrue(choice.called)
+
+    @override_settings(REPLICA_DATABASES=['default'], RESPONSE_CACHE_TIMEOUT=60)
+    def test_response_cache_is_filled_from_a_replica_past_the_lag(self):
+        buyer = self.make_user('buyer')
+        client = APIClient()
+        client.force_authenticate(buyer)
+
+        with mock.patch('Store2.routers.random.choice', side_effect=lambda aliases: aliases[0]) as choice:
+            response = APIClient().get('/api/product/')
+            self.assertEqual(response['X-Cache'], 'MISS')
+            self.assertTrue(choice.called)
+            choice.reset_mock()
+            self.assertEqual(APIClient().get('/api/product/')['X-Cache'], 'HIT')
+            self.assertFalse(choice.called)
+
+            # Right after a catalog write a lagging replica must not end up in
+            # an entry everybody gets
+            self.product.name_en = 'Renamed'
+            self.product.save()
+            response = APIClient().get('/api/product/')
+            self.assertEqual(response['X-Cache'], 'MISS')
+            self.assertFalse(choice.called)
+            with mock.patch('Store2.response_cache.STICKY_SECONDS', 0):
+                self.product.save()
+            self.assertEqual(APIClient().get('/api/product/')['X-Cache'], 'MISS')
+            self.assertTrue(choice.called)
+            choice.reset_mock()
+
+            # A user pinned after a write bypasses the cache
+            pin_to_primary(buyer.id)
+            response = client.get('/api/product/')
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header('X-Cache'))
+            self.assertFalse(choice.called)
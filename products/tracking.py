@@ -0,0 +1,94 @@
+# products/tracking.py
+"""
+Field-level change tracking without an extra SELECT.
+
+``TrackedFieldsMixin`` remembers the column values an instance was loaded
+with (``from_db``), so ``save()`` can tell which fields really changed by
+comparing in memory. ``on_change()`` wraps post_save receivers that only
+care about a few fields: they are skipped for saves that left those fields
+alone (a stock update no longer reindexes the product or scans wishlists).
+
+Instances that were not loaded from the database (built by hand with a pk)
+have nothing to compare with and count every field as changed.
+"""
+from functools import wraps
+
+
+class TrackedFieldsMixin:
+    def _capture_loaded_values(self, attnames=None):
+        loaded = {} if attnames is None else dict(getattr(self, '_loaded_values', None) or {})
+        for field in self._meta.concrete_fields:
+            if attnames is not None and field.attname not in attnames:
+                continue
+            # Deferred fields are not in __dict__ until they are loaded
+            if field.attname in self.__dict__:
+                loaded[field.attname] = self.__dict__[field.attname]
+        self._loaded_values = loaded
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._capture_loaded_values()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        attnames = None
+        if fields is not None:
+            attnames = {self._meta.get_field(name).attname for name in fields}
+        self._capture_loaded_values(attnames)
+
+    def get_changed_fields(self):
+        """
+        Names of the fields whose value differs from the loaded one, or None
+        when the instance was never loaded (everything counts as changed).
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        changed = set()
+        for field in self._meta.concrete_fields:
+            if field.attname not in self.__dict__:
+                continue
+            if field.attname not in loaded or loaded[field.attname] != self.__dict__[field.attname]:
+                changed.add(field.name)
+        return changed
+
+    def has_changed(self, *fields):
+        """True if any of ``fields`` changed (or the instance is not tracked)"""
+        changed = getattr(self, '_saved_changes', None)
+        if changed is None:
+            changed = self.get_changed_fields()
+        return changed is None or bool(changed.intersection(fields))
+
+    def save(self, *args, **kwargs):
+        changed = self.get_changed_fields()
+        update_fields = kwargs.get('update_fields')
+        if changed is not None and update_fields is not None:
+            changed &= set(update_fields)
+        # What this save writes, for the post_save receivers to look at
+        self._saved_changes = changed
+        try:
+            super().save(*args, **kwargs)
+        finally:
+            self._saved_changes = None
+
+        if update_fields is None:
+            self._capture_loaded_values()
+        else:
+            self._capture_loaded_values({self._meta.get_field(name).attname for name in update_fields})
+
+
+def on_change(*fields):
+    """
+    Decorate a post_save receiver so it only runs for new rows and for saves
+    that changed one of ``fields``.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(sender, instance, created=False, **kwargs):
+            if not created and not instance.has_changed(*fields):
+                return None
+            return func(sender, instance, created=created, **kwargs)
+        return wrapper
+    return decorator
@@ -10,10 +10,12 @@ from .views import (
     ProductDetailView,
     CategoryProductsView,
     ProductSearchView,
+    ProductSuggestView,
     ParentCategoryListView,
     ChildCategoryListView,
     UpdateProductQuantityView,
     CartView,
+    CartBatchView,
     AddToCartView,
     UpdateCartItemView,
     RemoveFromCartView,
@@ -52,6 +54,7 @@ urlpatterns = [
     path('<int:pk>/', ProductDetailView.as_view(), name='product-detail'),  # Single product
     path('category/<int:category_id>/products/', CategoryProductsView.as_view(), name='category-products'),
     path('search/', ProductSearchView.as_view(), name='product-search'),
+    path('search/suggest/', ProductSuggestView.as_view(), name='product-suggest'),
     path('categories/parents/', ParentCategoryListView.as_view(), name='parent-categories'),
     path('categories/children/<int:parent_id>/', ChildCategoryListView.as_view(), name='child-categories'),
     path('update-quantity/<int:product_id>/', UpdateProductQuantityView.as_view(), name='update-product-quantity'),
@@ -59,6 +62,7 @@ urlpatterns = [
     path('cart/add/', AddToCartView.as_view(), name='add-to-cart'),
     path('cart/update/<int:item_id>/', UpdateCartItemView.as_view(), name='update-cart-item'),
     path('cart/remove/<int:item_id>/', RemoveFromCartView.as_view(), name='remove-from-cart'),
+    path('cart/batch/', CartBatchView.as_view(), name='cart-batch'),
     path('wishlist/', WishlistView.as_view(), name='wishlist'),
     path('wishlist/add/', AddToWishlistView.as_view(), name='add-to-wishlist'),
     path('wishlist/remove/<int:item_id>/', RemoveFromWishlistView.as_view(), name='remove-from-wishlist'),
@@ -13,25 +13,35 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from accounts.idempotency import idempotent
 from accounts.permissionsUsers import (
     IsSuperAdmin, IsSeller, IsAdmin,
     IsSuperAdminOrAdmin, IsBuyerOrSeller
 )
+from Store2.response_cache import cache_response
+from Store2.routers import ReadReplicaMixin
 
 from .models import (
     Category, Product, ProductImage, WishlistItem,
     Wishlist, Cart, CartItem, SaleEvent, ProductSale
 )
 
+from . import category_cache, fieldsets, search, stock
+from .cart import BatchError, apply_batch, cart_delta, load_cart
+from .conditional import make_etag, not_modified, product_stamp, with_etag
+from .filters import filter_catalog, get_sort_params
+from .pagination import KeysetPagination
 from .permissions import IsSellerOrAdmin
+from .pricing import with_pricing
 from .serializers import (
-    ProductSerializer, CartSerializer, CartItemSerializer,
+    ProductCardSerializer, ProductSerializer, CartSerializer, CartDeltaSerializer, CartItemSerializer,
     ProductLanguageSerializer, SaleEventSerializer,
     ProductSaleSerializer, WishlistItemSerializer,
     WishlistSerializer, CreateProductSaleSerializer,
     UpdateProductSaleSerializer, ProductDiscountSerializer,
     CategorySerializer
 )
+from .suggest import index as suggestion_index
 
 class CreateCategoryView(APIView):
     permission_classes = [IsAuthenticated, IsSuperAdmin]
@@ -172,7 +182,7 @@ class DeleteCategoryView(APIView):
         except Category.DoesNotExist:
             return Response({'error': 'الفئة غير موجودة.'}, status=404)
 
-class LocalizedCategoryListView(APIView):
+class LocalizedCategoryListView(ReadReplicaMixin, APIView):
     permission_classes = []  # Accessible to everyone
     
     def get(self, request):
@@ -180,66 +190,56 @@ class LocalizedCategoryListView(APIView):
         if language not in ['ar', 'en']:
             language = 'ar'
 
-        # Get all parent categories with their children
-        parent_categories = Category.objects.filter(parent__isnull=True).prefetch_related('children')
-        
-        results = []
-        for parent in parent_categories:
-            parent_data = {
-                'id': parent.id,
-                'name': parent.name_ar if language == 'ar' else parent.name_en,
-                'children': []
-            }
-            
-            for child in parent.children.all():
-                parent_data['children'].append({
-                    'id': child.id,
-                    'name': child.name_ar if language == 'ar' else child.name_en
-                })
-            
-            results.append(parent_data)
+        # Served from the cached tree; 304 when the client's copy is current
+        etag = category_cache.get_etag(language)
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
 
-        return Response(results)
+        results = category_cache.get_tree(language)['tree']
+        return with_etag(Response(results), etag)
 
-class ParentCategoryListView(APIView):
+class ParentCategoryListView(ReadReplicaMixin, APIView):
     permission_classes = []
     
     def get(self, request):
         lang = request.headers.get('Accept-Language', 'ar').lower()
         if lang not in ['ar', 'en']:
             lang = 'ar'
-        
-        parent_categories = Category.objects.filter(parent__isnull=True)
+
+        etag = category_cache.get_etag(lang)
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+
         results = []
-        
-        for cat in parent_categories:
+        for cat in category_cache.get_tree(lang)['tree']:
             results.append({
-                'id': cat.id,
-                'name': cat.name_ar if lang == 'ar' else cat.name_en,
-                'has_children': cat.children.exists()
+                'id': cat['id'],
+                'name': cat['name'],
+                'has_children': bool(cat['children'])
             })
         
-        return Response(results)
+        return with_etag(Response(results), etag)
 
-class ChildCategoryListView(APIView):
+class ChildCategoryListView(ReadReplicaMixin, APIView):
     permission_classes = []
     
     def get(self, request, parent_id):
         lang = request.headers.get('Accept-Language', 'ar').lower()
         if lang not in ['ar', 'en']:
             lang = 'ar'
+
+        etag = category_cache.get_etag(lang)
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+
+        children = category_cache.get_tree(lang)['children'].get(parent_id)
+        if children is None:
+            raise Http404
         
-        parent = get_object_or_404(Category, id=parent_id)
-        children = parent.children.all()
-        
-        results = []
-        for child in children:
-            results.append({
-                'id': child.id,
-                'name': child.name_ar if lang == 'ar' else child.name_en
-            })
-        
-        return Response(results)
+        return with_etag(Response(children), etag)
 
 class ProductCreateView(APIView):
     permission_classes = [IsAuthenticated, IsSeller]
@@ -410,10 +410,12 @@ class SellerUnapprovedProductsView(APIView):
         products = Product.objects.filter(
             seller=request.user,
             is_approved=False
-        ).select_related('category').prefetch_related('images')
+        )
+        fieldset = fieldsets.from_request(request, ProductLanguageSerializer)
+        products = fieldsets.QueryPlan(ProductLanguageSerializer, fieldset).apply(products)
         
         # استخدام السيريالايزر مع تحديد اللغة
-        serializer = ProductLanguageSerializer(products, many=True, context={'lang': lang})
+        serializer = ProductLanguageSerializer(products, many=True, context={'lang': lang, 'fieldset': fieldset})
         return Response(serializer.data)    
 
 class SellerApprovedProductsView(APIView):
@@ -431,12 +433,15 @@ class SellerApprovedProductsView(APIView):
         products = Product.objects.filter(
             seller=request.user,
             is_approved=True,
-        ).select_related('category').prefetch_related('images')
+        )
+        fieldset = fieldsets.from_request(request, ProductLanguageSerializer)
+        products = fieldsets.QueryPlan(ProductLanguageSerializer, fieldset).apply(products)
         
         # استخدام السيريالايزر مع تحديد اللغة
         serializer = ProductLanguageSerializer(products, many=True, context={
             'lang': lang,
             'request': request,
+            'fieldset': fieldset,
             'show_discount_details': True  # Show full discount info for seller
         })
         return Response(serializer.data)
@@ -503,146 +508,118 @@ class StandardResultsSetPagination(PageNumberPagination):
             'results': data
         })
 
-class ProductListView(APIView):
+CARD_VIEW = 'card'
+
+
+def catalog_response(request, products, lang):
+    """
+    Sort, paginate, price and serialize a queryset of approved products the
+    way the catalog endpoints share: page numbers, or keyset pages with
+    ?cursor= (no COUNT(*), no OFFSET), a fixed number of queries per page
+    and an ETag answered with a 304 before anything is serialized.
+    ``?view=card`` renders only what a product grid shows; ``?fields=`` and
+    ``?expand=`` pick the fields of either view (see fieldsets.py).
+    """
+    card = request.query_params.get('view') == CARD_VIEW
+    serializer_class = ProductCardSerializer if card else ProductLanguageSerializer
+    fieldset = fieldsets.from_request(request, serializer_class)
+    # Only the relations and prices the rendered fields read
+    plan = fieldsets.QueryPlan(serializer_class, fieldset)
+    products = plan.apply(products)
+
+    sort_param, sort_prefix = get_sort_params(request.query_params)
+
+    # Cursor mode (?cursor=): keyset pages on (sort field, id), no COUNT(*)
+    # and no OFFSET. Page numbers stay available for clients needing total_pages
+    if KeysetPagination.cursor_query_param in request.query_params:
+        paginator = KeysetPagination(ordering=(sort_param, f"{sort_prefix}id"))
+    else:
+        # Apply sorting
+        products = products.order_by(sort_param)
+        paginator = StandardResultsSetPagination()
+
+    # Pagination with proper request context
+    result_page = paginator.paginate_queryset(products, request)
+    if plan.priced:
+        result_page = with_pricing(result_page)
+
+    # The page is validated by the URL (filters, page, host), the total and
+    # the stamps of the rows on it: 304 before anything is serialized
+    page = getattr(paginator, 'page', None)
+    etag = make_etag(
+        request.build_absolute_uri(), lang, category_cache.get_version(),
+        page.paginator.count if page else None,
+        *[product_stamp(product, plan.images, plan.priced) for product in result_page]
+    )
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
+    serializer = serializer_class(result_page, many=True, context={
+        'lang': lang,
+        'request': request,
+        'fieldset': fieldset,
+        'show_discount_price': True
+    })
+
+    return with_etag(paginator.get_paginated_response(serializer.data), etag)
+
+
+class ProductListView(ReadReplicaMixin, APIView):
     permission_classes = []  # Accessible to anyone
     
+    @cache_response('product-list', tags=('products', 'categories'))
     def get(self, request):
         lang = request.headers.get('Accept-Language', 'ar').lower()
         if lang not in ['ar', 'en']:
             lang = 'ar'
-        
-        # Get all filter parameters
-        min_price = request.query_params.get('min_price')
-        max_price = request.query_params.get('max_price')
-        min_rating = request.query_params.get('min_rating')
-        max_rating = request.query_params.get('max_rating')
-        category_id = request.query_params.get('category_id')
-        parent_category_id = request.query_params.get('parent_category_id')
-        min_quantity = request.query_params.get('min_quantity')
-        max_quantity = request.query_params.get('max_quantity')
-        in_stock = request.query_params.get('in_stock')
-        has_discount = request.query_params.get('has_discount')
-        
-        # Get sorting parameters
-        sort_by = request.query_params.get('sort_by', '-created_at')  # Default: newest first
-        sort_direction = request.query_params.get('sort_direction', 'desc')  # Default: descending
-        
-        # Validate sort options
-        valid_sort_fields = ['price', 'created_at', 'rating']
-        if sort_by not in valid_sort_fields:
-            sort_by = 'created_at'
-        
-        # Validate sort direction
-        sort_direction = sort_direction.lower()
-        if sort_direction not in ['asc', 'desc']:
-            sort_direction = 'desc'
-        
-        # Build sort parameter
-        sort_prefix = '' if sort_direction == 'asc' else '-'
-        sort_param = f"{sort_prefix}{sort_by}"
-        
-        # Start with base queryset
-        products = Product.objects.filter(is_approved=True)
-        
-        # Apply category filters
-        if category_id:
-            products = products.filter(category_id=category_id)
-        elif parent_category_id:
-            products = products.filter(category__parent_id=parent_category_id)
-        
-        # Apply price filters
-        if min_price:
-            try:
-                products = products.filter(price__gte=float(min_price))
-            except (ValueError, TypeError):
-                pass
-                
-        if max_price:
-            try:
-                products = products.filter(price__lte=float(max_price))
-            except (ValueError, TypeError):
-                pass
-        
-        # Apply rating filters
-        if min_rating:
-            try:
-                products = products.filter(rating__gte=float(min_rating))
-            except (ValueError, TypeError):
-                pass
-                
-        if max_rating:
-            try:
-                products = products.filter(rating__lte=float(max_rating))
-            except (ValueError, TypeError):
-                pass
-
-        # Apply quantity filters
-        if min_quantity:
-            try:
-                products = products.filter(quantity__gte=int(min_quantity))
-            except (ValueError, TypeError):
-                pass
-                
-        if max_quantity:
-            try:
-                products = products.filter(quantity__lte=int(max_quantity))
-            except (ValueError, TypeError):
-                pass
-                
-        # Apply in-stock filter
-        if in_stock and in_stock.lower() in ['true', '1', 'yes']:
-            products = products.filter(quantity__gt=0)
-
-        # Apply discount filter
-        if has_discount and has_discount.lower() in ['true', '1', 'yes']:
-            now = timezone.now()
-            products = products.filter(
-                Q(has_standalone_discount=True) &
-                Q(standalone_discount_percentage__isnull=False) &
-                (
-                    Q(standalone_discount_start__isnull=True) | 
-                    Q(standalone_discount_start__lte=now)
-                ) &
-                (
-                    Q(standalone_discount_end__isnull=True) | 
-                    Q(standalone_discount_end__gte=now)
-                )
-            )
 
-        # Apply sorting
-        products = products.order_by(sort_param)
-        
-        # Pagination with proper request context
-        paginator = StandardResultsSetPagination()
-        result_page = paginator.paginate_queryset(products, request)
-        
-        serializer = ProductLanguageSerializer(result_page, many=True, context={
-            'lang': lang,
-            'request': request,
-            'show_discount_price': True
-        })
-        
-        return paginator.get_paginated_response(serializer.data)
+        # Start with base queryset and apply the catalog filters
+        products = filter_catalog(Product.objects.filter(is_approved=True), request.query_params)
+        return catalog_response(request, products, lang)
     
-class ProductDetailView(APIView):
+class ProductDetailView(ReadReplicaMixin, APIView):
     permission_classes = []  # Accessible to anyone
     
+    @cache_response('product-detail', tags=('product:{pk}', 'sales', 'categories'))
     def get(self, request, pk):
         lang = request.headers.get('Accept-Language', 'ar').lower()
         if lang not in ['ar', 'en']:
             lang = 'ar'
         
-        product = get_object_or_404(Product, pk=pk, is_approved=True)
+        fieldset = fieldsets.from_request(request, ProductLanguageSerializer)
+        plan = fieldsets.QueryPlan(ProductLanguageSerializer, fieldset)
+        product = get_object_or_404(plan.apply(Product.objects.all()), pk=pk, is_approved=True)
+        if plan.priced:
+            with_pricing([product])
+
+        # Absolute image URLs depend on the host, names on the category
+        # version, the rendered fields on the query string
+        etag = make_etag(
+            request.build_absolute_uri(), lang, category_cache.get_version(),
+            *product_stamp(product, plan.images, plan.priced)
+        )
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+
         serializer = ProductLanguageSerializer(product, context={
             'lang': lang,
             'request': request,
+            'fieldset': fieldset,
             'show_discount_price': True
         })
-        return Response(serializer.data)
-
-class CategoryProductsView(APIView):
+        return with_etag(Response(serializer.data), etag)
+
+class CategoryProductsView(ReadReplicaMixin, APIView):
+    """
+    Approved products of a category, or of all the children of a parent
+    category. Same filters, sorting, pagination and ?view=card as the
+    product list.
+    """
     permission_classes = []
     
+    @cache_response('category-products', tags=('products', 'categories'))
     def get(self, request, category_id):
         lang = request.headers.get('Accept-Language', 'ar').lower()
         if lang not in ['ar', 'en']:
@@ -650,26 +627,17 @@ class CategoryProductsView(APIView):
         
         category = get_object_or_404(Category, pk=category_id)
         
-        # If it's a parent category, get products from all its children
+        # A parent category lists the products of all its children: a join on
+        # the category row rather than a subquery on its children
+        products = Product.objects.filter(is_approved=True)
         if category.is_parent:
-            products = Product.objects.filter(
-                category__in=category.children.all(),
-                is_approved=True
-            ).order_by('-created_at')
+            products = products.filter(category__parent_id=category.id)
         else:
-            # If it's a child category, get its products directly
-            products = Product.objects.filter(
-                category=category,
-                is_approved=True
-            ).order_by('-created_at')
-        
-        serializer = ProductLanguageSerializer(products, many=True, context={
-            'lang': lang,
-            'request': request
-        })
-        return Response(serializer.data)
+            products = products.filter(category_id=category.id)
+
+        return catalog_response(request, filter_catalog(products, request.query_params), lang)
     
-class ProductSearchView(APIView):
+class ProductSearchView(ReadReplicaMixin, APIView):
     permission_classes = []
     
     def get(self, request):
@@ -681,21 +649,52 @@ class ProductSearchView(APIView):
         if not query:
             return Response({"error": "Search query is required"}, status=400)
         
-        # Search in both Arabic and English names/descriptions
-        products = Product.objects.filter(
-            Q(name_ar__icontains=query) | 
-            Q(description_ar__icontains=query) |
-            Q(name_en__icontains=query) | 
-            Q(description_en__icontains=query),
-            
-            is_approved=True
+        fieldset = fieldsets.from_request(request, ProductLanguageSerializer)
+        products = fieldsets.QueryPlan(ProductLanguageSerializer, fieldset).apply(
+            Product.objects.filter(is_approved=True)
         )
-        
-        serializer = ProductLanguageSerializer(products, many=True, context={
+
+        if search.search_enabled():
+            # BM25-ranked results from the full-text index
+            results = search.SearchResults(query, products)
+        else:
+            # Search in both Arabic and English names/descriptions
+            results = products.filter(
+                Q(name_ar__icontains=query) |
+                Q(description_ar__icontains=query) |
+                Q(name_en__icontains=query) |
+                Q(description_en__icontains=query)
+            ).order_by('-created_at')
+
+        paginator = StandardResultsSetPagination()
+        result_page = paginator.paginate_queryset(results, request)
+
+        serializer = ProductLanguageSerializer(result_page, many=True, context={
             'lang': lang,
-            'request': request
+            'request': request,
+            'fieldset': fieldset
+        })
+        return paginator.get_paginated_response(serializer.data)
+
+class ProductSuggestView(APIView):
+    """Search-as-you-type suggestions, answered from the in-memory prefix index"""
+    permission_classes = []
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "Search query is required"}, status=400)
+
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except (TypeError, ValueError):
+            return Response({"error": "limit must be a valid integer"}, status=400)
+        limit = max(1, min(limit, 50))
+
+        return Response({
+            'query': query,
+            'results': suggestion_index.suggest(query, limit)
         })
-        return Response(serializer.data)
 
 class UpdateProductQuantityView(APIView):
     permission_classes = [IsAuthenticated, IsSeller]
@@ -723,8 +722,8 @@ class UpdateProductQuantityView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        product.quantity = product.quantity + quantity
-        product.save()
+        # One UPDATE (quantity + n in the database), no search/wishlist receivers
+        stock.restock(product, quantity)
         
         return Response({
             "message": "Product quantity updated successfully",
@@ -732,17 +731,27 @@ class UpdateProductQuantityView(APIView):
             "new_quantity": product.quantity
         })
 
+def cart_response(request, cart, changed=(), removed=(), status_code=status.HTTP_200_OK):
+    """The whole cart, or with ?response=delta only what the mutation changed"""
+    if request.query_params.get('response') == 'delta':
+        data = CartDeltaSerializer(cart_delta(cart, changed, removed)).data
+    else:
+        data = CartSerializer(cart).data
+    return Response(data, status=status_code)
+
 class CartView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
+        # user_id: no need to load the user row for a cached session
+        cart = load_cart(request.user.id)
         serializer = CartSerializer(cart)
         return Response(serializer.data)
 
 class AddToCartView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent('cart.add')
     def post(self, request):
         product_id = request.data.get('product_id')
         quantity = request.data.get('quantity', 1)
@@ -765,42 +774,23 @@ class AddToCartView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        cart, _ = Cart.objects.get_or_create(user=request.user)
+        cart, _ = Cart.objects.get_or_create(user_id=request.user.id)
 
         try:
-            with transaction.atomic():
-                # Check available quantity
-                if quantity > product.quantity:
-                    return Response(
-                        {"error": f"Only {product.quantity} available in stock"},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-                cart_item, created = CartItem.objects.get_or_create(
-                    cart=cart,
-                    product=product,
-                    defaults={'quantity': quantity}
+            item = stock.add_to_cart(cart, product, quantity)
+        except stock.OutOfStock as e:
+            if CartItem.objects.filter(cart=cart, product=product).exists():
+                return Response(
+                    {"error": f"Cannot add {quantity} more (only {e.available} available)"},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-
-                if not created:
-                    new_quantity = cart_item.quantity + quantity
-                    if new_quantity > product.quantity:
-                        return Response(
-                            {"error": f"Cannot add {quantity} more (only {product.quantity - cart_item.quantity} available)"},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-                    cart_item.quantity = new_quantity
-                    cart_item.save()
-
-                serializer = CartSerializer(cart)
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-        except Exception as e:
             return Response(
-                {"error": str(e)},
+                {"error": f"Only {e.available} available in stock"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        return cart_response(request, cart, changed=[item.id], status_code=status.HTTP_201_CREATED)
+
 class UpdateCartItemView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -829,24 +819,19 @@ class UpdateCartItemView(APIView):
             )
 
         try:
-            with transaction.atomic():
-                if quantity > cart_item.product.quantity:
-                    return Response(
-                        {"error": f"Only {cart_item.product.quantity} available in stock"},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                cart_item.quantity = quantity
-                cart_item.save()
-                
-                serializer = CartSerializer(cart_item.cart)
-                return Response(serializer.data)
-
-        except Exception as e:
+            stock.set_quantity(cart_item, quantity)
+        except stock.OutOfStock as e:
             return Response(
-                {"error": str(e)},
+                {"error": f"Only {e.available} available in stock"},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        except stock.CartItemChanged:
+            return Response(
+                {"error": "The cart item was changed by another request, please retry"},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        return cart_response(request, cart_item.cart, changed=[cart_item.id])
 
 class RemoveFromCartView(APIView):
     permission_classes = [IsAuthenticated]
@@ -857,17 +842,41 @@ class RemoveFromCartView(APIView):
                 id=item_id,
                 cart__user=request.user
             )
-            cart_item.delete()
+            # Puts the held quantity back on the shelf
+            stock.remove_from_cart(cart_item)
             return Response(
                 {"message": "Item removed from cart"},
                 status=status.HTTP_204_NO_CONTENT
             )
-        except CartItem.DoesNotExist:
+        except (CartItem.DoesNotExist, stock.CartItemChanged):
             return Response(
                 {"error": "Item not found in your cart"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
+class CartBatchView(APIView):
+    """
+    Apply many cart operations in one transaction, all or nothing:
+    {"base_version": 7, "operations": [{"op": "add", "product_id": 1, "quantity": 2},
+    {"op": "update", "item_id": 5, "quantity": 1}, {"op": "remove", "product_id": 3}]}
+    """
+    permission_classes = [IsAuthenticated]
+
+    @idempotent('cart.batch')
+    def post(self, request):
+        cart, _ = Cart.objects.get_or_create(user_id=request.user.id)
+        try:
+            changed, removed = apply_batch(
+                cart, request.data.get('operations'), base_version=request.data.get('base_version')
+            )
+        except BatchError as e:
+            body = {"error": e.message}
+            if e.index is not None:
+                body["index"] = e.index
+            return Response(body, status=e.status_code)
+
+        return cart_response(request, cart, changed=changed, removed=removed)
+
 class WishlistView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -933,21 +942,30 @@ class MoveToCartView(APIView):
                 wishlist__user=request.user
             )
             
-            cart, _ = Cart.objects.get_or_create(user=request.user)
+            cart, _ = Cart.objects.get_or_create(user_id=request.user.id)
             
-            # Check if product already in cart
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=wishlist_item.product,
-                defaults={'quantity': 1}
-            )
-            
-            if not created:
-                if cart_item.quantity < cart_item.product.quantity:
-                    cart_item.quantity += 1
-                    cart_item.save()
+            # One more unit if the shelf still has one
+            try:
+                cart_item = stock.add_to_cart(cart, wishlist_item.product, 1)
+            except stock.OutOfStock:
+                cart_item = CartItem.objects.filter(cart=cart, product_id=wishlist_item.product_id).first()
+                if cart_item is None:
+                    return Response(
+                        {"error": "Product is out of stock"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
             
             wishlist_item.delete()
+
+            if request.query_params.get('response') == 'delta':
+                return Response(
+                    {
+                        "message": "Item moved to cart",
+                        "cart": CartDeltaSerializer(cart_delta(cart, changed=[cart_item.id])).data,
+                        "wishlist": {"removed": [item_id]}
+                    },
+                    status=status.HTTP_200_OK
+                )
             
             return Response(
                 {
@@ -964,9 +982,10 @@ class MoveToCartView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-class ActiveSaleEventListView(APIView):
+class ActiveSaleEventListView(ReadReplicaMixin, APIView):
     permission_classes = []
 
+    @cache_response('active-sales', tags=('sales',))
     def get(self, request):
         now = timezone.now()
         events = SaleEvent.objects.filter(
@@ -991,9 +1010,10 @@ class ActiveSaleEventListView(APIView):
         
         return Response(data)
 
-class ProductsInSaleView(APIView):
+class ProductsInSaleView(ReadReplicaMixin, APIView):
     permission_classes = []
 
+    @cache_response('products-in-sale', tags=('sales', 'products'))
     def get(self, request, sale_id):
         now = timezone.now()
         products = ProductSale.objects.filter(
@@ -0,0 +1,56 @@
+# wallet/filters.py
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .models import Transaction
+
+
+def _parse_bound(value, name, end=False):
+    """ISO date or datetime; a bare date covers that whole day"""
+    try:
+        # parse_datetime() would also take a bare date, as midnight
+        day = parse_date(value)
+        moment = datetime.combine(day, time.max if end else time.min) if day else parse_datetime(value)
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ValidationError({name: 'Use an ISO date (2025-01-31) or datetime.'})
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def filter_transactions(transactions, query_params):
+    """
+    History filters: ?type= (comma separated), ?direction=, ?date_from=,
+    ?date_to= and ?reference=. Unlike the catalog filters a bad value is an
+    error, an export must never silently cover the wrong range.
+    """
+    types = [t for t in query_params.get('type', '').split(',') if t]
+    if types:
+        unknown = set(types) - set(Transaction.TransactionType.values)
+        if unknown:
+            raise ValidationError({'type': f"Unknown transaction type: {', '.join(sorted(unknown))}"})
+        transactions = transactions.filter(transaction_type__in=types)
+
+    direction = query_params.get('direction')
+    if direction:
+        if direction not in Transaction.Direction.values:
+            raise ValidationError({'direction': 'Use credit or debit.'})
+        transactions = transactions.filter(direction=direction)
+
+    date_from = query_params.get('date_from')
+    if date_from:
+        transactions = transactions.filter(created_at__gte=_parse_bound(date_from, 'date_from'))
+    date_to = query_params.get('date_to')
+    if date_to:
+        transactions = transactions.filter(created_at__lte=_parse_bound(date_to, 'date_to', end=True))
+
+    reference = query_params.get('reference')
+    if reference:
+        transactions = transactions.filter(reference=reference)
+
+    return transactions
@@ -0,0 +1,194 @@
+# wallet/ledger.py
+"""
+Double-entry wallet ledger.
+
+Every money movement is posted here and nowhere else. A posting locks the
+wallets it touches in id order (so two opposite transfers can't deadlock),
+moves the balances with ``F()`` updates (the debit only if the balance
+covers it), and appends one immutable ``Transaction`` per side carrying the
+resulting balance. A transfer always writes a debit and a credit of the same
+amount, so money is never created or lost.
+
+``take_snapshots()`` records each wallet's ledger balance periodically;
+``ledger_balance()`` and ``reconcile()`` start from the latest snapshot and
+only add the entries after it.
+"""
+import logging
+import uuid
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Sum, When
+from django.utils import timezone
+
+from .models import BalanceSnapshot, LedgerError, Transaction, Wallet
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal('0.00')
+
+
+class InsufficientFunds(LedgerError):
+    pass
+
+
+def new_reference(prefix):
+    """Unique posting reference; the (reference, direction) unique index enforces it"""
+    return f"{prefix}-{uuid.uuid4().hex}"
+
+
+def lock_wallets(*wallet_ids):
+    """Row-lock the wallets, always in id order, and return them by id"""
+    wallets = Wallet.objects.select_for_update().filter(id__in=set(wallet_ids)).order_by('id')
+    locked = {wallet.id: wallet for wallet in wallets}
+    missing = set(wallet_ids) - set(locked)
+    if missing:
+        raise Wallet.DoesNotExist(f"Wallet {min(missing)} does not exist")
+    return locked
+
+
+def _debit(wallet_id, amount, now):
+    if not Wallet.objects.filter(id=wallet_id, balance__gte=amount).update(
+        balance=F('balance') - amount, updated_at=now
+    ):
+        raise InsufficientFunds("Insufficient funds")
+
+
+def _credit(wallet_id, amount, now):
+    Wallet.objects.filter(id=wallet_id).update(balance=F('balance') + amount, updated_at=now)
+
+
+def _balances(*wallet_ids):
+    return dict(Wallet.objects.filter(id__in=wallet_ids).values_list('id', 'balance'))
+
+
+def transfer(sender_id, recipient_id, amount, description='', reference='', received_description=None):
+    """Move ``amount`` between two wallets, returns the (debit, credit) entries"""
+    if amount <= ZERO:
+        raise LedgerError("Amount must be positive")
+    if sender_id == recipient_id:
+        raise LedgerError("Cannot transfer to the same wallet")
+
+    now = timezone.now()
+    with transaction.atomic():
+        lock_wallets(sender_id, recipient_id)
+        _debit(sender_id, amount, now)
+        _credit(recipient_id, amount, now)
+        balances = _balances(sender_id, recipient_id)
+
+        debit, credit = Transaction.objects.bulk_create([
+            Transaction(
+                wallet_id=sender_id,
+                recipient_id=recipient_id,
+                amount=amount,
+                transaction_type=Transaction.TransactionType.TRANSFER,
+                direction=Transaction.Direction.DEBIT,
+                balance_after=balances[sender_id],
+                description=description,
+                reference=reference,
+            ),
+            Transaction(
+                wallet_id=recipient_id,
+                amount=amount,
+                transaction_type=Transaction.TransactionType.TRANSFER,
+                direction=Transaction.Direction.CREDIT,
+                balance_after=balances[recipient_id],
+                description=description if received_description is None else received_description,
+                reference=reference,
+            ),
+        ])
+    return debit, credit
+
+
+def post(wallet_id, amount, direction, transaction_type, description='', reference=''):
+    """A single-sided entry (deposit, withdrawal, fee...) against money outside the wallets"""
+    if amount <= ZERO:
+        raise LedgerError("Amount must be positive")
+
+    now = timezone.now()
+    with transaction.atomic():
+        lock_wallets(wallet_id)
+        if direction == Transaction.Direction.DEBIT:
+            _debit(wallet_id, amount, now)
+        else:
+            _credit(wallet_id, amount, now)
+
+        return Transaction.objects.create(
+            wallet_id=wallet_id,
+            amount=amount,
+            transaction_type=transaction_type,
+            direction=direction,
+            balance_after=_balances(wallet_id)[wallet_id],
+            description=description,
+            reference=reference,
+        )
+
+
+def deposit(wallet_id, amount, description='', reference=''):
+    return post(
+        wallet_id, amount, Transaction.Direction.CREDIT,
+        Transaction.TransactionType.DEPOSIT, description, reference
+    )
+
+
+def _signed_total(entries):
+    return entries.filter(is_successful=True).aggregate(total=Sum(Case(
+        When(direction=Transaction.Direction.CREDIT, then=F('amount')),
+        default=-F('amount'),
+    )))['total'] or ZERO
+
+
+def latest_snapshot(wallet_id):
+    return BalanceSnapshot.objects.filter(wallet_id=wallet_id).order_by('-id').first()
+
+
+def ledger_balance(wallet_id):
+    """Balance according to the ledger: latest snapshot plus the entries after it"""
+    snapshot = latest_snapshot(wallet_id)
+    entries = Transaction.objects.filter(wallet_id=wallet_id)
+    if snapshot is None:
+        return _signed_total(entries)
+    if snapshot.last_transaction_id:
+        entries = entries.filter(id__gt=snapshot.last_transaction_id)
+    return snapshot.balance + _signed_total(entries)
+
+
+def take_snapshot(wallet_id):
+    """Snapshot one wallet if it has new entries, returns the snapshot or None"""
+    with transaction.atomic():
+        # Postings hold this lock until they commit, so no entry can appear
+        # below the id we record
+        lock_wallets(wallet_id)
+        snapshot = latest_snapshot(wallet_id)
+        entries = Transaction.objects.filter(wallet_id=wallet_id)
+        if snapshot is not None and snapshot.last_transaction_id:
+            entries = entries.filter(id__gt=snapshot.last_transaction_id)
+        last_id = entries.order_by('-id').values_list('id', flat=True).first()
+        if last_id is None:
+            return None
+
+        balance = (snapshot.balance if snapshot else ZERO) + _signed_total(entries.filter(id__lte=last_id))
+        return BalanceSnapshot.objects.create(wallet_id=wallet_id, balance=balance, last_transaction_id=last_id)
+
+
+def take_snapshots():
+    """Snapshot every wallet that moved since its last snapshot, returns how many"""
+    taken = 0
+    for wallet_id in Wallet.objects.order_by('id').values_list('id', flat=True).iterator():
+        if take_snapshot(wallet_id) is not None:
+            taken += 1
+    return taken
+
+
+def reconcile():
+    """(wallet id, stored balance, ledger balance) for every wallet that disagrees"""
+    mismatches = []
+    for wallet_id in Wallet.objects.order_by('id').values_list('id', flat=True).iterator():
+        # Locked so a posting can't land between reading the two sides
+        with transaction.atomic():
+            balance = lock_wallets(wallet_id)[wallet_id].balance
+            expected = ledger_balance(wallet_id)
+        if expected != balance:
+            logger.error('Wallet %s balance %s does not match its ledger (%s)', wallet_id, balance, expected)
+            mismatches.append((wallet_id, balance, expected))
+    return mismatches
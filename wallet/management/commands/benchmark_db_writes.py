@@ -0,0 +1,107 @@
+# wallet/management/commands/benchmark_db_writes.py
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+
+from accounts.models import User
+from Store2.benchmark import benchmark_database
+from Store2.db_profiles import PROFILE_ENV
+from wallet import ledger
+from wallet.models import Wallet
+
+
+class Command(BaseCommand):
+    help = (
+        'Wallet transfers per second from parallel clients against a throwaway database. '
+        'Uses the current STORE_DB_PROFILE, or runs once per --profile to compare them'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', action='append', help='Profile(s) to compare, each in its own process')
+        parser.add_argument('--clients', type=int, default=8)
+        parser.add_argument('--transfers', type=int, default=250, help='Transfers per client')
+        parser.add_argument('--wallets', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if options['profile']:
+            for profile in options['profile']:
+                self.run_profile(profile, options)
+            return
+
+        profile = os.environ.get(PROFILE_ENV, 'sqlite')
+        with tempfile.TemporaryDirectory() as directory:
+            # SQLite's in-memory test database would hide WAL and locking
+            name = Path(directory) / 'bench.sqlite3' if connection.vendor == 'sqlite' else None
+            with benchmark_database(name=name):
+                self.run(profile, options)
+
+    def run_profile(self, profile, options):
+        command = [
+            sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), 'benchmark_db_writes',
+            '--clients', str(options['clients']),
+            '--transfers', str(options['transfers']),
+            '--wallets', str(options['wallets']),
+        ]
+        result = subprocess.run(command, env={**os.environ, PROFILE_ENV: profile}, capture_output=True, text=True)
+        if result.returncode:
+            self.stdout.write(self.style.ERROR(f'{profile:<14} failed: {result.stderr.strip().splitlines()[-1]}'))
+        else:
+            self.stdout.write(result.stdout.rstrip())
+
+    def run(self, profile, options):
+        users = User.objects.bulk_create([
+            User(
+                email=f'bench-wallet{i}@example.com', username=f'bench-wallet{i}', password='!',
+                first_name='Bench', last_name='Wallet', phone_number='0'
+            )
+            for i in range(options['wallets'])
+        ])
+        wallet_ids = [wallet.id for wallet in Wallet.objects.bulk_create([Wallet(user=user) for user in users])]
+        for wallet_id in wallet_ids:
+            ledger.deposit(wallet_id, Decimal('1000000.00'))
+        connections.close_all()
+
+        outcomes = {'committed': 0, 'locked': 0}
+        lock = threading.Lock()
+
+        def client(seed):
+            rng = random.Random(seed)
+            committed = locked = 0
+            try:
+                for _ in range(options['transfers']):
+                    sender, recipient = rng.sample(wallet_ids, 2)
+                    try:
+                        ledger.transfer(sender, recipient, Decimal(rng.randint(1, 5000)) / 100)
+                        committed += 1
+                    except OperationalError as e:
+                        # Not retried: this is what a request would answer with
+                        if 'locked' not in str(e):
+                            raise
+                        locked += 1
+            finally:
+                connections.close_all()
+            with lock:
+                outcomes['committed'] += committed
+                outcomes['locked'] += locked
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['clients']) as pool:
+            list(pool.map(client, range(options['clients'])))
+        elapsed = time.perf_counter() - start
+
+        attempted = options['clients'] * options['transfers']
+        self.stdout.write(
+            f'{profile:<14} {options["clients"]} clients  {outcomes["committed"] / elapsed:8.0f} transfers/s   '
+            f'{outcomes["locked"]}/{attempted} failed with "database is locked"'
+        )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from wallet.ledger import reconcile, take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Checks every wallet balance against its ledger (optionally snapshots first)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--snapshot', action='store_true', help='Snapshot the ledger balances before checking')
+
+    def handle(self, *args, **options):
+        if options['snapshot']:
+            taken = take_snapshots()
+            self.stdout.write(f'Took {taken} balance snapshots')
+
+        mismatches = reconcile()
+        for wallet_id, balance, expected in mismatches:
+            self.stdout.write(self.style.ERROR(
+                f'Wallet {wallet_id}: balance {balance}, ledger says {expected}'
+            ))
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('All wallet balances match their ledger'))
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.2 on 2026-10-17 23:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def set_directions(apps, schema_editor):
+    # The sender's side of a transfer is the row that names a recipient
+    Transaction = apps.get_model('wallet', 'Transaction')
+    Transaction.objects.filter(
+        Q(transaction_type__in=['withdrawal', 'payment', 'fee'])
+        | Q(transaction_type='transfer', recipient__isnull=False)
+    ).update(direction='debit')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='balance_after',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='direction',
+            field=models.CharField(choices=[('credit', 'Credit'), ('debit', 'Debit')], default='credit', max_length=6),
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_directions, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='wallet.transaction')),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='wallet.wallet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['wallet', '-id'], name='snapshot_wallet_latest_idx')],
+            },
+        ),
+    ]
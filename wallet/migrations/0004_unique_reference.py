@@ -0,0 +1,36 @@
+# Generated by Django 5.2.2 on 2026-10-17 23:11
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def dedupe_legacy_references(apps, schema_editor):
+    # Time-based references (TRF-<sender>-<recipient>-<second>) could repeat:
+    # keep the first row of each clash and suffix the others with their id
+    Transaction = apps.get_model('wallet', 'Transaction')
+    clashes = Transaction.objects.exclude(reference='').values('reference', 'direction').annotate(
+        rows=Count('id')
+    ).filter(rows__gt=1)
+    for clash in clashes:
+        duplicates = Transaction.objects.filter(
+            reference=clash['reference'], direction=clash['direction']
+        ).order_by('id').values_list('id', flat=True)[1:]
+        for transaction_id in duplicates:
+            Transaction.objects.filter(id=transaction_id).update(
+                reference=f"{clash['reference']}-{transaction_id}"
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0003_transaction_history_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_legacy_references, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('reference', ''), _negated=True), fields=('reference', 'direction'), name='unique_transaction_reference_direction'),
+        ),
+    ]
@@ -7,6 +7,11 @@ from django.core.validators import MinValueValidator
 from decimal import Decimal
 from django.conf import settings
 
+
+class LedgerError(Exception):
+    pass
+
+
 class Wallet(models.Model):
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
@@ -27,6 +32,15 @@ class Wallet(models.Model):
         return f"{self.user.email}'s Wallet (${self.balance})"
 
 class Transaction(models.Model):
+    """
+    One ledger entry, from the point of view of ``wallet``. Entries are
+    append-only: balances only change through wallet.ledger, which writes
+    the entry and moves the balance in the same transaction.
+    """
+    class Direction(models.TextChoices):
+        CREDIT = 'credit', 'Credit'
+        DEBIT = 'debit', 'Debit'
+
     class TransactionType(models.TextChoices):
         DEPOSIT = 'deposit', 'Deposit'
         WITHDRAWAL = 'withdrawal', 'Withdrawal'
@@ -49,6 +63,9 @@ class Transaction(models.Model):
         max_length=20,
         choices=TransactionType.choices
     )
+    direction = models.CharField(max_length=6, choices=Direction.choices)
+    # Wallet balance right after this entry, so history never replays the ledger
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     recipient = models.ForeignKey(
         Wallet,
         on_delete=models.SET_NULL,
@@ -66,7 +83,51 @@ class Transaction(models.Model):
         indexes = [
             models.Index(fields=['reference']),
             models.Index(fields=['created_at']),
+            # History pages and exports: one wallet, keyset on (created_at, id)
+            models.Index(fields=['wallet', '-created_at', '-id'], name='txn_wallet_history_idx'),
+        ]
+        constraints = [
+            # One debit and one credit per posting reference (wallet.ledger.new_reference)
+            models.UniqueConstraint(
+                fields=['reference', 'direction'],
+                condition=~models.Q(reference=''),
+                name='unique_transaction_reference_direction'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.transaction_type} of ${self.amount} ({self.reference})"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise LedgerError("Ledger transactions are immutable, post a correcting entry instead")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise LedgerError("Ledger transactions are immutable, post a correcting entry instead")
+
+
+class BalanceSnapshot(models.Model):
+    """
+    Ledger balance of a wallet up to and including ``last_transaction``.
+    A balance is the latest snapshot plus the entries after it, so
+    reconciliation never replays the whole ledger.
+    """
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='snapshots')
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    last_transaction = models.ForeignKey(
+        Transaction,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', '-id'], name='snapshot_wallet_latest_idx'),
         ]
 
     def __str__(self):
-        return f"{self.transaction_type} of ${self.amount} ({self.reference})"
\ No newline at end of file
+        return f"{self.wallet_id} @ {self.last_transaction_id}: {self.balance}"
\ No newline at end of file
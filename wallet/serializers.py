@@ -23,8 +23,8 @@ class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
         fields = [
-            'id', 'wallet', 'amount', 'transaction_type',
-            'recipient', 'description', 'created_at',
+            'id', 'wallet', 'amount', 'transaction_type', 'direction',
+            'balance_after', 'recipient', 'description', 'created_at',
             'is_successful', 'reference'
         ]
         read_only_fields = ['is_successful', 'reference']
@@ -38,12 +38,6 @@ class TransferSerializer(serializers.Serializer):
     )
     description = serializers.CharField(max_length=255, required=False)
 
-    def validate_amount(self, value):
-        wallet = self.context['request'].user.wallet
-        if value > wallet.balance:
-            raise serializers.ValidationError("Insufficient funds")
-        return value
-
     def validate_recipient_email(self, value):
         if value == self.context['request'].user.email:
             raise serializers.ValidationError("Cannot transfer to yourself")
@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from wallet.ledger import take_snapshots
+
+
+@shared_task
+def snapshot_wallet_balances():
+    taken = take_snapshots()
+    return f"Took {taken} wallet balance snapshots"
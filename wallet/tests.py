@@ -1,3 +1,212 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
 
-# Create your tests here.
+from django.db import OperationalError, connections
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from . import ledger
+from .models import LedgerError, Transaction, Wallet
+
+
+def make_user(username):
+    return User.objects.create_user(
+        email=f'{username}@example.com',
+        username=username,
+        password='pass12345',
+        first_name=username,
+        last_name='test',
+        phone_number='0000',
+    )
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        ledger.deposit(self.alice.wallet.id, Decimal('100.00'), 'Top up')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def transfer(self, amount):
+        return self.client.post(
+            '/api/wallet/transfer/',
+            {'recipient_email': 'bob@example.com', 'amount': amount, 'description': 'Lunch'},
+            format='json'
+        )
+
+    def test_transfer_posts_both_sides(self):
+        response = self.transfer('30.00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.json()['new_balance']), Decimal('70.00'))
+
+        debit = Transaction.objects.get(wallet=self.alice.wallet, transaction_type='transfer')
+        credit = Transaction.objects.get(wallet=self.bob.wallet)
+        self.assertEqual((debit.direction, debit.balance_after), ('debit', Decimal('70.00')))
+        self.assertEqual((credit.direction, credit.balance_after), ('credit', Decimal('30.00')))
+        self.assertEqual(debit.reference, credit.reference)
+
+        self.assertEqual(ledger.ledger_balance(self.alice.wallet.id), Decimal('70.00'))
+        self.assertEqual(ledger.ledger_balance(self.bob.wallet.id), Decimal('30.00'))
+
+    def test_insufficient_funds(self):
+        response = self.transfer('100.01')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'amount': ['Insufficient funds']})
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, Decimal('100.00'))
+        self.assertFalse(Transaction.objects.filter(transaction_type='transfer').exists())
+
+    def test_entries_are_immutable(self):
+        entry = Transaction.objects.get()
+        entry.amount = Decimal('1000.00')
+        with self.assertRaises(LedgerError):
+            entry.save()
+        with self.assertRaises(LedgerError):
+            entry.delete()
+
+    def test_snapshots_and_reconciliation(self):
+        self.assertEqual(ledger.take_snapshots(), 1)
+        self.assertEqual(ledger.take_snapshots(), 0)
+        self.transfer('25.00')
+        self.assertEqual(ledger.take_snapshots(), 2)
+
+        snapshot = ledger.latest_snapshot(self.alice.wallet.id)
+        self.assertEqual(snapshot.balance, Decimal('75.00'))
+        self.transfer('5.00')
+        # Snapshot plus the one entry after it
+        with self.assertNumQueries(2):
+            self.assertEqual(ledger.ledger_balance(self.alice.wallet.id), Decimal('70.00'))
+        self.assertEqual(ledger.reconcile(), [])
+
+        # A balance changed behind the ledger's back is reported
+        Wallet.objects.filter(user=self.bob).update(balance=Decimal('1.00'))
+        with self.assertLogs('wallet.ledger', 'ERROR'):
+            self.assertEqual(ledger.reconcile(), [(self.bob.wallet.id, Decimal('1.00'), Decimal('30.00'))])
+
+
+class TransactionHistoryTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        wallet_id = self.alice.wallet.id
+        ledger.deposit(wallet_id, Decimal('100.00'), 'Top up', reference='DEP-1')
+        for i in range(5):
+            ledger.transfer(wallet_id, self.bob.wallet.id, Decimal(i + 1), 'Gift', reference=f'TRF-{i}')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_keyset_pages(self):
+        url = '/api/wallet/transactions/?page_size=4'
+        # wallet, page (users joined in), whatever the page size
+        with self.assertNumQueries(2):
+            first = self.client.get(url).json()
+        self.assertEqual([row['reference'] for row in first['results']], ['TRF-4', 'TRF-3', 'TRF-2', 'TRF-1'])
+        self.assertIsNone(first['previous'])
+        self.assertIn('alice@example.com', first['results'][0]['wallet'])
+
+        second = self.client.get(first['next']).json()
+        self.assertEqual([row['reference'] for row in second['results']], ['TRF-0', 'DEP-1'])
+        self.assertIsNone(second['next'])
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_filters(self):
+        def references(query):
+            return [row['reference'] for row in self.client.get(f'/api/wallet/transactions/?{query}').json()['results']]
+
+        self.assertEqual(references('type=deposit'), ['DEP-1'])
+        self.assertEqual(references('direction=credit'), ['DEP-1'])
+        self.assertEqual(references('reference=TRF-2'), ['TRF-2'])
+        today = timezone.localdate().isoformat()
+        self.assertEqual(len(references(f'date_from={today}&date_to={today}')), 6)
+        self.assertEqual(references('date_to=2000-01-01'), [])
+
+        response = self.client.get('/api/wallet/transactions/?type=gift')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('type', response.json())
+        self.assertEqual(self.client.get('/api/wallet/transactions/?date_from=yesterday').status_code, 400)
+
+    def test_streaming_exports(self):
+        response = self.client.get('/api/wallet/transactions/export/csv/?type=transfer')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment;', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['reference'] for row in rows], [f'TRF-{i}' for i in range(5)])
+        self.assertEqual(rows[0]['counterparty'], 'bob@example.com')
+        self.assertEqual((rows[0]['direction'], rows[0]['balance_after']), ('debit', '99.00'))
+
+        response = self.client.get('/api/wallet/transactions/export/jsonl/')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[0]['type'], 'deposit')
+        self.assertEqual(lines[0]['amount'], '100.00')
+
+        self.assertEqual(self.client.get('/api/wallet/transactions/export/xlsx/').status_code, 404)
+
+
+class LedgerConcurrencyTests(TransactionTestCase):
+    """Parallel transfers between a few wallets never create or lose money"""
+
+    WALLETS = 10
+    TRANSFERS = 1500
+    OPENING_BALANCE = Decimal('100.00')
+
+    def transfer(self, job):
+        sender, recipient, amount = job
+        try:
+            # SQLite's shared in-memory test database errors on a busy table
+            # instead of waiting; the transfer is atomic, so retry it whole
+            while True:
+                try:
+                    ledger.transfer(sender, recipient, amount)
+                    return True
+                except ledger.InsufficientFunds:
+                    return False
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    time.sleep(0.001)
+        finally:
+            connections.close_all()
+
+    def test_money_is_conserved(self):
+        users = User.objects.bulk_create([
+            User(
+                email=f'holder{i}@example.com', username=f'holder{i}', password='!',
+                first_name='holder', last_name='test', phone_number='0000'
+            )
+            for i in range(self.WALLETS)
+        ])
+        wallets = Wallet.objects.bulk_create([Wallet(user=user) for user in users])
+        wallet_ids = [wallet.id for wallet in wallets]
+        for wallet_id in wallet_ids:
+            ledger.deposit(wallet_id, self.OPENING_BALANCE)
+
+        rng = random.Random(16)
+        jobs = []
+        for _ in range(self.TRANSFERS):
+            sender, recipient = rng.sample(wallet_ids, 2)
+            jobs.append((sender, recipient, Decimal(rng.randint(1, 6000)) / 100))
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(self.transfer, jobs))
+
+        balances = dict(Wallet.objects.values_list('id', 'balance'))
+        self.assertEqual(sum(balances.values()), self.OPENING_BALANCE * self.WALLETS)
+        self.assertTrue(all(balance >= 0 for balance in balances.values()))
+        self.assertIn(False, results)  # some transfers really hit an empty wallet
+
+        entries = Transaction.objects.filter(transaction_type='transfer')
+        self.assertEqual(entries.filter(direction='debit').count(), results.count(True))
+        self.assertEqual(entries.filter(direction='credit').count(), results.count(True))
+
+        ledger.take_snapshots()
+        self.assertEqual(ledger.reconcile(), [])
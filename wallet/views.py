@@ -7,13 +7,17 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
-from django.db import transaction
 from decimal import Decimal
-from .models import Wallet, Transaction
+from django.http import Http404, StreamingHttpResponse
+from accounts.idempotency import idempotent
+from products.pagination import KeysetPagination
+from . import ledger
+from .export import EXPORT_FORMATS
+from .filters import filter_transactions
+from .models import Wallet
 from .serializers import WalletSerializer, TransactionSerializer, TransferSerializer,BalanceAdjustmentSerializer
 from django.contrib.auth import get_user_model
 from rest_framework.permissions import IsAdminUser
-import time 
 
 User = get_user_model()
 
@@ -26,61 +30,69 @@ class WalletAPIView(APIView):
         return Response(serializer.data)
 
 class TransactionHistoryAPIView(APIView):
+    """Newest first, keyset pages on (created_at, id), see wallet.filters for the filters"""
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        wallet = get_object_or_404(Wallet, user=request.user)
-        transactions = wallet.transactions.all().select_related('recipient')
-        serializer = TransactionSerializer(transactions, many=True)
-        return Response(serializer.data)
+        wallet = get_object_or_404(Wallet, user_id=request.user.id)
+        # The wallet strings show the owner's email: users are joined up front
+        transactions = filter_transactions(
+            wallet.transactions.select_related('wallet__user', 'recipient__user'),
+            request.query_params
+        )
+        paginator = KeysetPagination(ordering=('-created_at', '-id'))
+        page = paginator.paginate_queryset(transactions, request, view=self)
+        serializer = TransactionSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+class TransactionExportView(APIView):
+    """The filtered history as a CSV or JSON Lines download, oldest first"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, export_format):
+        if export_format not in EXPORT_FORMATS:
+            raise Http404
+        wallet = get_object_or_404(Wallet, user_id=request.user.id)
+        transactions = filter_transactions(wallet.transactions.all(), request.query_params)
+
+        lines, content_type = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(lines(transactions), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="wallet-{wallet.id}-transactions.{export_format}"'
+        return response
 
 class TransferAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent('wallet.transfer')
     def post(self, request):
         serializer = TransferSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
-            sender_wallet = request.user.wallet
-            recipient = get_object_or_404(User, email=serializer.validated_data['recipient_email'])
-            recipient_wallet = recipient.wallet
+            sender_wallet = get_object_or_404(Wallet, user_id=request.user.id)
+            recipient_wallet = get_object_or_404(
+                Wallet.objects.select_related('user'), user__email=serializer.validated_data['recipient_email']
+            )
             amount = serializer.validated_data['amount']
             description = serializer.validated_data.get('description', '')
 
-            # Generate a unique reference
-            reference = f"TRF-{request.user.id}-{recipient.id}-{int(time.time())}"
-
-            with transaction.atomic():
-                # Deduct from sender
-                sender_wallet.balance -= amount
-                sender_wallet.save()
-
-                # Add to recipient
-                recipient_wallet.balance += amount
-                recipient_wallet.save()
+            reference = ledger.new_reference('TRF')
 
-                # Record transactions
-                Transaction.objects.create(
-                    wallet=sender_wallet,
-                    amount=amount,
-                    transaction_type=Transaction.TransactionType.TRANSFER,
-                    recipient=recipient_wallet,
+            # The balance check happens in the debit itself: concurrent
+            # transfers can't both spend the same money
+            try:
+                debit, credit = ledger.transfer(
+                    sender_wallet.id, recipient_wallet.id, amount,
                     description=description,
-                    reference=reference
-                )
-
-                Transaction.objects.create(
-                    wallet=recipient_wallet,
-                    amount=amount,
-                    transaction_type=Transaction.TransactionType.TRANSFER,
-                    description=f"Received from {request.user.email}: {description}",
-                    reference=reference
+                    reference=reference,
+                    received_description=f"Received from {request.user.email}: {description}"
                 )
+            except ledger.InsufficientFunds:
+                return Response({'amount': ['Insufficient funds']}, status=status.HTTP_400_BAD_REQUEST)
 
             return Response(
                 {
                     'message': 'Transfer successful',
                     'reference': reference,
-                    'new_balance': sender_wallet.balance
+                    'new_balance': debit.balance_after
                 },
                 status=status.HTTP_200_OK
             )
@@ -89,6 +101,7 @@ class TransferAPIView(APIView):
 class AdjustBalanceView(APIView):
     permission_classes = [IsAuthenticated]  # Only allow admins to adjust balances
     
+    @idempotent('wallet.adjust_balance')
     def post(self, request, user_id):
         user = get_object_or_404(User, id=user_id)
         wallet = get_object_or_404(Wallet, user=user)
@@ -100,24 +113,15 @@ class AdjustBalanceView(APIView):
         amount = serializer.validated_data['amount']
         reason = serializer.validated_data.get('reason', 'Balance adjustment')
         
-        with transaction.atomic():
-            # Update balance
-            wallet.balance += amount
-            wallet.save()
-            
-            # Record transaction
-            Transaction.objects.create(
-                wallet=wallet,
-                amount=amount,
-                transaction_type=Transaction.TransactionType.DEPOSIT,
-                description=f"Admin adjustment: {reason}",
-                reference=f"ADJ-{user.id}-{int(time.time())}",
-                is_successful=True
-            )
+        entry = ledger.deposit(
+            wallet.id, amount,
+            description=f"Admin adjustment: {reason}",
+            reference=ledger.new_reference('ADJ')
+        )
         
         return Response({
             'message': 'Balance updated successfully',
-            'new_balance': wallet.balance,
+            'new_balance': entry.balance_after,
             'user_id': user.id,
             'user_email': user.email
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)